@@ -18,7 +18,8 @@ from time import time
 
 import redis
 import redis.sentinel
-from werkzeug.exceptions import NotFound, Conflict, BadRequest
+from werkzeug.exceptions import NotFound, Conflict, BadRequest, \
+    HTTPException
 from oio.common.timestamp import Timestamp
 from oio.common.easy_value import int_value, true_value
 from oio.common.redis_conn import RedisConn
@@ -296,10 +297,11 @@ class AccountBackend(RedisConn):
         accounts = conn.hkeys('accounts:')
         return accounts
 
-    def update_container(self, account_id, name, mtime, dtime, object_count,
-                         bytes_used, autocreate_account=None,
-                         autocreate_container=True):
-        conn = self.conn
+    def _update_container_script_args(self, account_id, name, mtime, dtime,
+                                      object_count, bytes_used,
+                                      autocreate_account=None,
+                                      autocreate_container=True):
+        """Build the keys and arguments of `lua_update_container`."""
         if not account_id or not name:
             raise BadRequest("Missing account or container")
 
@@ -325,21 +327,96 @@ class AccountBackend(RedisConn):
         args = [name, mtime, dtime, object_count, bytes_used,
                 autocreate_account, Timestamp(time()).normal, EXPIRE_TIME,
                 autocreate_container]
+        return keys, args
+
+    @staticmethod
+    def _update_container_error(exc, account_id, name):
+        """
+        Convert an error of `lua_update_container` to an HTTP exception.
+        Return `None` if the error is unexpected.
+        """
+        if str(exc) == "no_account":
+            return NotFound("Account %s not found" % account_id)
+        if str(exc) == "no_container":
+            return NotFound("Container %s not found" % name)
+        elif str(exc) == "no_update_needed":
+            return Conflict("No update needed, "
+                            "event older than last container update")
+        return None
+
+    def update_container(self, account_id, name, mtime, dtime, object_count,
+                         bytes_used, autocreate_account=None,
+                         autocreate_container=True):
+        keys, args = self._update_container_script_args(
+            account_id, name, mtime, dtime, object_count, bytes_used,
+            autocreate_account=autocreate_account,
+            autocreate_container=autocreate_container)
         try:
-            self.script_update_container(keys=keys, args=args, client=conn)
+            self.script_update_container(keys=keys, args=args,
+                                         client=self.conn)
         except redis.exceptions.ResponseError as exc:
-            if str(exc) == "no_account":
-                raise NotFound("Account %s not found" % account_id)
-            if str(exc) == "no_container":
-                raise NotFound("Container %s not found" % name)
-            elif str(exc) == "no_update_needed":
-                raise Conflict("No update needed, "
-                               "event older than last container update")
-            else:
+            error = self._update_container_error(exc, account_id, name)
+            if error is None:
                 raise
+            raise error
 
         return name
 
+    def update_containers(self, updates, autocreate_account=None,
+                          autocreate_container=True):
+        """
+        Apply several container updates, possibly on several accounts.
+        All the script calls are sent in one pipeline, without
+        transaction: the updates are applied in order, and the failure
+        of one of them does not prevent the others.
+
+        :param updates: list of dicts with "account", "name", and
+            optionally "mtime", "dtime", "objects" and "bytes"
+        :returns: a list of dicts with "account", "name", "status"
+            and, for failed updates, "message", in the order of `updates`
+        """
+        results = list()
+        pipelined = list()
+        pipeline = self.conn.pipeline(False)
+        for update in updates:
+            result = {'account': update.get('account'),
+                      'name': update.get('name')}
+            results.append(result)
+            try:
+                keys, args = self._update_container_script_args(
+                    update.get('account'), update.get('name'),
+                    update.get('mtime'), update.get('dtime'),
+                    update.get('objects'), update.get('bytes'),
+                    autocreate_account=autocreate_account,
+                    autocreate_container=autocreate_container)
+            except HTTPException as exc:
+                result['status'] = exc.code
+                result['message'] = exc.description
+                continue
+            except (TypeError, ValueError) as exc:
+                result['status'] = BadRequest.code
+                result['message'] = str(exc)
+                continue
+            self.script_update_container(keys=keys, args=args,
+                                         client=pipeline)
+            pipelined.append(result)
+
+        if pipelined:
+            replies = pipeline.execute(raise_on_error=False)
+            for result, reply in zip(pipelined, replies):
+                if not isinstance(reply, redis.exceptions.ResponseError):
+                    result['status'] = 200
+                    continue
+                error = self._update_container_error(
+                    reply, result['account'], result['name'])
+                if error is None:
+                    result['status'] = 500
+                    result['message'] = str(reply)
+                else:
+                    result['status'] = error.code
+                    result['message'] = error.description
+        return results
+
     def _raw_listing(self, account_id, limit, marker, end_marker, delimiter,
                      prefix):
         conn = self.conn
@@ -185,6 +185,23 @@ class AccountClient(HttpApi):
                                            data=json.dumps(metadata))
         return body
 
+    def container_batch_update(self, updates, **kwargs):
+        """
+        Update several containers, possibly of several accounts,
+        with one request.
+
+        :param updates: container metadata ("account", "name", "bytes",
+        "objects", "mtime", "dtime")
+        :type updates: `list` of `dict`
+        :returns: a list of dicts with "account", "name", "status"
+        and, for failed updates, "message", in the order of `updates`
+        """
+        data = json.dumps({'containers': updates})
+        _resp, body = self.account_request(None, 'POST',
+                                           'container/batch_update',
+                                           data=data, **kwargs)
+        return body['containers']
+
     def container_reset(self, account, container, mtime, **kwargs):
         """
         Reset container of an account
@@ -42,6 +42,8 @@ class Account(WerkzeugApp):
             Rule('/v1.0/account/flush', endpoint='account_flush'),
             Rule('/v1.0/account/container/update',
                  endpoint='account_container_update'),
+            Rule('/v1.0/account/container/batch_update',
+                 endpoint='account_container_batch_update'),
             Rule('/v1.0/account/container/reset',
                  endpoint='account_container_reset')
         ])
@@ -134,6 +136,15 @@ class Account(WerkzeugApp):
         result = json.dumps(info)
         return Response(result)
 
+    def on_account_container_batch_update(self, req):
+        decoded = json.loads(req.get_data())
+        containers = decoded.get('containers')
+        if not isinstance(containers, list):
+            raise BadRequest('Missing list of containers')
+        results = self.backend.update_containers(containers)
+        return Response(json.dumps({'containers': results}),
+                        mimetype='text/json')
+
     def on_account_container_reset(self, req):
         account_id = self._get_account_id(req)
         data = json.loads(req.get_data())
@@ -18,20 +18,26 @@ import math
 import hashlib
 import logging
 from urlparse import urlparse
-from eventlet import Queue, Timeout, GreenPile
+from eventlet import Queue, Timeout, GreenPile, GreenPool, spawn
+from eventlet.queue import Empty
 from greenlet import GreenletExit
 from oio.common import exceptions
 from oio.common.exceptions import SourceReadError
 from oio.common.http import HeadersDict, parse_content_range, \
-    ranges_from_http_header, headers_from_object_metadata
+    ranges_from_http_header, headers_from_object_metadata, \
+    http_header_from_ranges
 from oio.common.utils import fix_ranges
 from oio.api import io
 from oio.common.constants import chunk_headers
 from oio.common import green
+from oio.common import ec_offload
 
 
 logger = logging.getLogger(__name__)
 
+# number of segments read ahead of their reconstruction when rebuilding
+REBUILD_READ_AHEAD = 4
+
 
 def segment_range_to_fragment_range(segment_start, segment_end, segment_size,
                                     fragment_size):
@@ -93,89 +99,164 @@ class ECChunkDownloadHandler(object):
 
     def __init__(self, storage_method, chunks, meta_start, meta_end, headers,
                  connection_timeout=None, read_timeout=None,
-                 **_kwargs):
+                 meta_ranges=None, hedge_percentile=io.HEDGE_PERCENTILE,
+                 latencies=None, **_kwargs):
         """
         :param connection_timeout: timeout to establish the connections
         :param read_timeout: timeout to read a buffer of data
+        :param meta_ranges: a list of (meta_start, meta_end) tuples,
+            to read several ranges of the meta chunk at once (overrides
+            `meta_start` and `meta_end`). The ranges must be sorted,
+            and the segments they touch must not overlap.
+        :param hedge_percentile: when the fragments take longer to answer
+            than this percentile of their services' latencies, request
+            an extra fragment and use the first ones to answer
+            (None to request extra fragments only on failure)
+        :param latencies: a `LatencyTracker`, defaults to `RAWX_LATENCIES`
         """
         self.storage_method = storage_method
         self.chunks = chunks
         self.meta_start = meta_start
         self.meta_end = meta_end
+        self.meta_ranges = meta_ranges
         # the meta chunk length
         # (the amount of actual data stored into the meta chunk)
         self.meta_length = self.chunks[0]['size']
         self.headers = headers
         self.connection_timeout = connection_timeout
         self.read_timeout = read_timeout
+        self.hedge_percentile = hedge_percentile
+        self.latencies = latencies or io.RAWX_LATENCIES
 
     def _get_range_infos(self):
         """
-        Converts requested Range on meta chunk to actual chunk Range
+        Converts requested Ranges on meta chunk to actual chunk Ranges
 
-        :returns: a dict with infos about all the requested Ranges
+        :returns: a list of dicts with infos about all the requested Ranges
         """
         segment_size = self.storage_method.ec_segment_size
         fragment_size = self.storage_method.ec_fragment_size
 
         range_infos = []
 
+        if self.meta_ranges:
+            meta_ranges = self.meta_ranges
         # read all the meta chunk
-        if self.meta_start is None and self.meta_end is None:
+        elif self.meta_start is None and self.meta_end is None:
             return range_infos
-        if self.meta_start is not None and self.meta_start < 0:
-            self.meta_start = self.meta_length + self.meta_start
-
-        segment_start, segment_end = meta_chunk_range_to_segment_range(
-            self.meta_start, self.meta_end, segment_size)
-
-        fragment_start, fragment_end = segment_range_to_fragment_range(
-            segment_start, segment_end, segment_size, fragment_size)
-
-        range_infos.append({
-            'req_meta_start': self.meta_start,
-            'req_meta_end': self.meta_end,
-            'req_segment_start': segment_start,
-            'req_segment_end': segment_end,
-            'req_fragment_start': fragment_start,
-            'req_fragment_end': fragment_end})
+        else:
+            meta_ranges = [(self.meta_start, self.meta_end)]
+
+        for meta_start, meta_end in meta_ranges:
+            if meta_start is not None and meta_start < 0:
+                meta_start = self.meta_length + meta_start
+
+            segment_start, segment_end = meta_chunk_range_to_segment_range(
+                meta_start, meta_end, segment_size)
+
+            fragment_start, fragment_end = segment_range_to_fragment_range(
+                segment_start, segment_end, segment_size, fragment_size)
+
+            range_infos.append({
+                'req_meta_start': meta_start,
+                'req_meta_end': meta_end,
+                'req_segment_start': segment_start,
+                'req_segment_end': segment_end,
+                'req_fragment_start': fragment_start,
+                'req_fragment_end': fragment_end})
         return range_infos
 
     def _get_fragment(self, chunk_iter, range_infos, storage_method):
         headers = dict()
         headers.update(self.headers)
         if range_infos:
-            # only handle one range
-            range_info = range_infos[0]
-            headers['Range'] = 'bytes=%s-%s' % (
-                    range_info['req_fragment_start'],
-                    range_info['req_fragment_end'])
+            # one multi-range request for all the ranges
+            headers['Range'] = http_header_from_ranges(
+                [(range_info['req_fragment_start'],
+                  range_info['req_fragment_end'])
+                 for range_info in range_infos])
+        # extra fragments are requested by the handler, not by the readers
         reader = io.ChunkReader(chunk_iter, storage_method.ec_fragment_size,
                                 headers, self.connection_timeout,
                                 self.read_timeout,
-                                align=True)
+                                align=True, hedge_percentile=None,
+                                latencies=self.latencies)
         return (reader, reader.get_iter())
 
+    def _hedge_delay(self):
+        delays = [self.latencies.hedge_delay(chunk, self.hedge_percentile)
+                  for chunk in self.chunks[:self.storage_method.ec_nb_data]]
+        delays = [delay for delay in delays if delay is not None]
+        if not delays:
+            return None
+        return max(delays)
+
     def get_stream(self):
         range_infos = self._get_range_infos()
         chunk_iter = iter(self.chunks)
+        nb_data = self.storage_method.ec_nb_data
+        # number of fragments that may be requested to hedge slow ones
+        nb_spare = len(self.chunks) - nb_data
+        delay = self._hedge_delay()
+
+        results = Queue()
+        done = list()
+
+        def _get_fragment():
+            try:
+                result = self._get_fragment(chunk_iter, range_infos,
+                                            self.storage_method)
+            except (Exception, Timeout) as err:
+                result = err
+            if done:
+                # enough fragments were already found
+                _discard_fragment(result)
+                return
+            results.put(result)
+
+        def _discard_fragment(result):
+            if isinstance(result, tuple):
+                reader, parts_iter = result
+                parts_iter.close()
+                reader.close()
 
         # we use eventlet GreenPool to manage readers
-        with green.ContextPool(self.storage_method.ec_nb_data) as pool:
-            pile = GreenPile(pool)
-            # we use eventlet GreenPile to spawn readers
-            for _j in range(self.storage_method.ec_nb_data):
-                pile.spawn(self._get_fragment, chunk_iter, range_infos,
-                           self.storage_method)
-
-            readers = []
-            for reader, parts_iter in pile:
+        pool = GreenPool(len(self.chunks))
+        for _j in range(nb_data):
+            pool.spawn(_get_fragment)
+        pending = nb_data
+
+        readers = []
+        error = None
+        try:
+            while pending and len(readers) < nb_data:
+                try:
+                    result = results.get(
+                        timeout=delay if nb_spare > 0 else None)
+                except Empty:
+                    # some fragments are slow, request an extra one
+                    pool.spawn(_get_fragment)
+                    pending += 1
+                    nb_spare -= 1
+                    continue
+                pending -= 1
+                if not isinstance(result, tuple):
+                    error = error or result
+                    continue
+                reader, parts_iter = result
                 if reader.status in (200, 206):
                     readers.append((reader, parts_iter))
                 # TODO log failures?
+        finally:
+            done.append(True)
+            while results.qsize():
+                _discard_fragment(results.get_nowait())
+
+        if error is not None and len(readers) < nb_data:
+            raise error
 
         # with EC we need at least ec_nb_data valid readers
-        if len(readers) >= self.storage_method.ec_nb_data:
+        if len(readers) >= nb_data:
             # all readers should return the same Content-Length
             # so just take the headers from one of them
             resp_headers = HeadersDict(readers[0][0].headers)
@@ -265,9 +346,11 @@ class ECStream(object):
         """
         # we use eventlet Queue to read fragments
         queues = []
+        # number of segments decoded at once
+        batch = ec_offload.batch_size()
         # each iterators has its queue
         for _j in range(len(fragment_iterators)):
-            queues.append(Queue(1))
+            queues.append(Queue(batch))
 
         def put_in_queue(fragment_iterator, queue):
             """
@@ -277,8 +360,8 @@ class ECStream(object):
                 for fragment in fragment_iterator:
                     # put the read fragment in the queue
                     queue.put(fragment)
-                    # the queues are of size 1 so this coroutine blocks
-                    # until we decode a full segment
+                    # the queues are bounded so this coroutine blocks
+                    # until we decode the pending segments
             except GreenletExit:
                 # ignore
                 pass
@@ -287,7 +370,7 @@ class ECStream(object):
             except Exception:
                 logger.exception("Exception on reading")
             finally:
-                queue.resize(2)
+                queue.resize(batch + 1)
                 # put None to indicate the decoding loop
                 # this is over
                 queue.put(None)
@@ -301,27 +384,42 @@ class ECStream(object):
                 pool.spawn(put_in_queue, fragment_iterator, queue)
 
             # main decoding loop
-            while True:
-                data = []
-                # get the fragments from the queues
-                for queue in queues:
-                    fragment = queue.get()
-                    queue.task_done()
-                    data.append(fragment)
-
-                if not all(data):
-                    # one of the readers returned None
-                    # impossible to read segment
+            finished = False
+            while not finished:
+                fragment_sets = []
+                # get the fragments from the queues, waiting for
+                # the first segment and taking the next ones
+                # if they are already available
+                while len(fragment_sets) < batch:
+                    if fragment_sets and \
+                            not all(queue.qsize() for queue in queues):
+                        break
+                    data = []
+                    for queue in queues:
+                        fragment = queue.get()
+                        queue.task_done()
+                        data.append(fragment)
+
+                    if not all(data):
+                        # one of the readers returned None
+                        # impossible to read segment
+                        finished = True
+                        break
+                    fragment_sets.append(data)
+
+                if not fragment_sets:
                     break
-                # actually decode the fragments into a segment
+                # actually decode the fragments into segments
                 try:
-                    segment = self.storage_method.driver.decode(data)
+                    segments = self.storage_method.decode_segments(
+                        fragment_sets)
                 except exceptions.ECError:
                     # something terrible happened
                     logger.exception("ERROR decoding fragments")
                     raise
 
-                yield segment
+                for segment in segments:
+                    yield segment
 
     def _convert_range(self, req_start, req_end, length):
         try:
@@ -456,6 +554,9 @@ def ec_encode(storage_method, n):
     """
     segment_size = storage_method.ec_segment_size
 
+    # number of segments to gather before encoding them at once
+    batch_len = segment_size * ec_offload.batch_size()
+
     buf = collections.deque()
     total_len = 0
 
@@ -464,7 +565,7 @@ def ec_encode(storage_method, n):
         buf.append(data)
         total_len += len(data)
 
-        if total_len >= segment_size:
+        if total_len >= batch_len:
             data_to_encode = []
 
             while total_len >= segment_size:
@@ -485,9 +586,7 @@ def ec_encode(storage_method, n):
                 data_to_encode.append(''.join(parts))
 
             # let's encode!
-            encode_result = []
-            for d in data_to_encode:
-                encode_result.append(storage_method.driver.encode(d))
+            encode_result = storage_method.encode_segments(data_to_encode)
 
             # transform the result
             #
@@ -513,7 +612,11 @@ def ec_encode(storage_method, n):
     # encode what is left in the buf
     whats_left = ''.join(buf)
     if whats_left:
-        last_fragments = storage_method.driver.encode(whats_left)
+        # there may be several segments left when encoding in batches
+        data_to_encode = [whats_left[i:i + segment_size]
+                          for i in range(0, len(whats_left), segment_size)]
+        encode_result = storage_method.encode_segments(data_to_encode)
+        last_fragments = [''.join(p) for p in zip(*encode_result)]
     else:
         last_fragments = [''] * n
     yield last_fragments
@@ -636,12 +739,17 @@ class EcChunkWriter(object):
 class EcMetachunkWriter(io.MetachunkWriter):
     def __init__(self, sysmeta, meta_chunk, global_checksum, storage_method,
                  reqid=None, connection_timeout=None, write_timeout=None,
-                 read_timeout=None):
+                 read_timeout=None, meta_checksum=None):
+        """
+        :param global_checksum: checksum of the whole content, to update
+        :param meta_checksum: checksum of the metachunk, when the data
+            is hashed by the caller (an MD5 is computed otherwise)
+        """
         super(EcMetachunkWriter, self).__init__(storage_method=storage_method)
         self.sysmeta = sysmeta
         self.meta_chunk = meta_chunk
         self.global_checksum = global_checksum
-        self.checksum = hashlib.md5()
+        self.checksum = meta_checksum or hashlib.md5()
         self.reqid = reqid
         self.connection_timeout = connection_timeout or io.CONNECTION_TIMEOUT
         self.write_timeout = write_timeout or io.CHUNK_TIMEOUT
@@ -821,6 +929,8 @@ class EcMetachunkWriter(io.MetachunkWriter):
                     failed_chunks.append(writer.chunk)
             else:
                 failed_chunks.append(writer.chunk)
+            # give the connection back to the pool, if possible
+            writer.conn.close()
 
         for (writer, resp) in pile:
             _handle_resp(writer, resp)
@@ -860,11 +970,6 @@ class ECWriteHandler(io.WriteHandler):
     """
 
     def stream(self):
-        # the checksum context for the content
-        global_checksum = hashlib.md5()
-        total_bytes_transferred = 0
-        content_chunks = []
-
         # the platform chunk size
         chunk_size = self.sysmeta['chunk_size']
 
@@ -880,35 +985,30 @@ class ECWriteHandler(io.WriteHandler):
         #      {"url": "http://...", "pos": "1.1"}, ...],
         #  ..}
         #
-        # iterate through the meta chunks
-        bytes_transferred = -1
-        for meta_chunk in self.chunk_prep():
-            handler = EcMetachunkWriter(
+        def _make_writer(meta_chunk, meta_checksum):
+            # the checksums are computed by the pipeline
+            return EcMetachunkWriter(
                 self.sysmeta, meta_chunk,
-                global_checksum, self.storage_method,
+                io.FakeChecksum(None), self.storage_method,
                 reqid=self.headers.get('X-oio-req-id'),
                 connection_timeout=self.connection_timeout,
                 write_timeout=self.write_timeout,
-                read_timeout=self.read_timeout)
-            bytes_transferred, checksum, chunks = handler.stream(self.source,
-                                                                 max_size)
+                read_timeout=self.read_timeout,
+                meta_checksum=meta_checksum)
 
+        # upload the meta chunks
+        results, total_bytes_transferred, content_checksum = \
+            self._stream_pipeline(_make_writer, max_size)
+
+        content_chunks = []
+        for bytes_transferred, checksum, chunks in results:
             # chunks checksum is the metachunk hash
             # chunks size is the metachunk size
             for chunk in chunks:
                 chunk['hash'] = checksum
                 chunk['size'] = bytes_transferred
-
-            total_bytes_transferred += bytes_transferred
             # add the chunks to the content chunk list
             content_chunks += chunks
-            if bytes_transferred < max_size:
-                break
-            if len(self.source.peek()) == 0:
-                break
-
-        # compute the final content checksum
-        content_checksum = global_checksum.hexdigest()
 
         return content_chunks, total_bytes_transferred, content_checksum
 
@@ -916,12 +1016,25 @@ class ECWriteHandler(io.WriteHandler):
 class ECRebuildHandler(object):
     def __init__(self, meta_chunk, missing, storage_method,
                  connection_timeout=None, read_timeout=None,
-                 **_kwargs):
+                 read_ahead=None, **_kwargs):
+        """
+        :param missing: the position of the fragment to rebuild in the
+            metachunk, or a list of positions of fragments to rebuild
+            at once, from a single read of the metachunk
+        :param read_ahead: number of segments read ahead
+            of their reconstruction
+        """
         self.meta_chunk = meta_chunk
         self.missing = missing
+        if isinstance(missing, (list, tuple, set)):
+            # the driver rebuilds the fragments in their order
+            self.missing_list = sorted(missing)
+        else:
+            self.missing_list = [missing]
         self.storage_method = storage_method
         self.connection_timeout = connection_timeout or io.CONNECTION_TIMEOUT
         self.read_timeout = read_timeout or io.CHUNK_TIMEOUT
+        self.read_ahead = read_ahead or REBUILD_READ_AHEAD
 
     def _get_response(self, chunk, headers):
         resp = None
@@ -933,14 +1046,16 @@ class ECRebuildHandler(object):
 
             with Timeout(self.read_timeout):
                 resp = conn.getresponse()
+                resp.conn = conn
             if resp.status != 200:
                 logger.warning('Invalid GET response from %s', chunk)
+                io.close_source(resp)
                 resp = None
         except (Exception, Timeout):
             logger.exception('ERROR fetching %s', chunk)
         return resp
 
-    def rebuild(self):
+    def _get_responses(self):
         pile = GreenPile(len(self.meta_chunk))
 
         nb_data = self.storage_method.ec_nb_data
@@ -953,47 +1068,112 @@ class ECRebuildHandler(object):
         for resp in pile:
             if not resp:
                 continue
+            if len(resps) >= nb_data:
+                # we already have enough sources
+                io.close_source(resp)
+                continue
             resps.append(resp)
-            if len(resps) >= self.storage_method.ec_nb_data:
-                break
-        else:
+        if len(resps) < nb_data:
+            for resp in resps:
+                io.close_source(resp)
             logger.error('Unable to read enough valid sources to rebuild')
             raise exceptions.UnrecoverableContent(
                 'Not enough valid sources to rebuild')
+        return resps
 
-        rebuild_iter = self._make_rebuild_iter(resps[:nb_data])
-        return rebuild_iter
+    def rebuild(self):
+        """
+        Rebuild a single missing fragment.
+
+        :returns: an iterator over the data of the fragment
+        """
+        return self.rebuild_all()[self.missing_list[0]]
+
+    def rebuild_all(self):
+        """
+        Rebuild all the missing fragments at once.
+
+        :returns: a `dict` with the positions of the missing fragments
+            as keys, and iterators over their data as values.
+            The iterators must be consumed in parallel.
+        """
+        resps = self._get_responses()
+        frag_iters = self._make_rebuild_iters(resps)
+        return dict(zip(self.missing_list, frag_iters))
+
+    def _make_rebuild_iters(self, resps):
+        fragment_size = self.storage_method.ec_fragment_size
 
-    def _make_rebuild_iter(self, resps):
         def _get_frag(resp):
-            buf = ''
-            remaining = self.storage_method.ec_fragment_size
+            parts = []
+            remaining = fragment_size
             while remaining:
                 data = resp.read(remaining)
                 if not data:
                     break
                 remaining -= len(data)
-                buf += data
-            return buf
+                parts.append(data)
+            return ''.join(parts)
 
-        def frag_iter():
-            pile = GreenPile(len(resps))
-            while True:
-                for resp in resps:
-                    pile.spawn(_get_frag, resp)
+        def _read_frags(resp, queue):
+            """Read the fragments ahead of their reconstruction."""
+            try:
+                while True:
+                    with green.ChunkReadTimeout(self.read_timeout):
+                        frag = _get_frag(resp)
+                    if not frag:
+                        break
+                    queue.put(frag)
+            except GreenletExit:
+                pass
+            except (Exception, Timeout):
+                # TODO complete error message
+                logger.exception('ERROR rebuilding')
+            finally:
+                queue.resize(self.read_ahead + 1)
+                queue.put(None)
+                io.close_source(resp)
+
+        in_queues = [Queue(self.read_ahead) for _j in resps]
+        out_queues = [Queue(self.read_ahead) for _j in self.missing_list]
+        abandoned = set()
+
+        def _rebuild():
+            with green.ContextPool(len(resps)) as pool:
+                for resp, queue in zip(resps, in_queues):
+                    pool.spawn(_read_frags, resp, queue)
                 try:
-                    with Timeout(self.read_timeout):
-                        frag = [frag for frag in pile]
-                except (Exception, Timeout):
-                    # TODO complete error message
+                    while len(abandoned) < len(out_queues):
+                        frag = [queue.get() for queue in in_queues]
+                        if not all(frag):
+                            break
+                        rebuilt_frags = self._reconstruct(frag)
+                        for queue, rebuilt_frag in zip(out_queues,
+                                                       rebuilt_frags):
+                            if queue not in abandoned:
+                                queue.put(rebuilt_frag)
+                except Exception:
                     logger.exception('ERROR rebuilding')
-                    break
-                if not all(frag):
-                    break
-                rebuilt_frag = self._reconstruct(frag)
-                yield rebuilt_frag
+                finally:
+                    for queue in out_queues:
+                        queue.resize(self.read_ahead + 1)
+                        queue.put(None)
+
+        def frag_iter(queue):
+            try:
+                while True:
+                    rebuilt_frag = queue.get()
+                    if rebuilt_frag is None:
+                        break
+                    yield rebuilt_frag
+            finally:
+                # unblock the reconstruction
+                abandoned.add(queue)
+                while queue.qsize():
+                    queue.get_nowait()
 
-        return frag_iter()
+        spawn(_rebuild)
+        return [frag_iter(queue) for queue in out_queues]
 
     def _reconstruct(self, frag):
-        return self.storage_method.driver.reconstruct(frag, [self.missing])[0]
+        return self.storage_method.driver.reconstruct(frag, self.missing_list)
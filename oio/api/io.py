@@ -15,14 +15,20 @@
 
 from __future__ import absolute_import
 from io import BufferedReader, RawIOBase, IOBase
+from collections import deque
+import hashlib
 import itertools
 import logging
+import time
 from urlparse import urlparse
-from eventlet import sleep, Timeout
+from eventlet import sleep, spawn, Timeout
+from eventlet.queue import Empty, Queue
 from oio.common import exceptions as exc
+from oio.common.exceptions import SourceReadError
 from oio.common.http import parse_content_type,\
     parse_content_range, ranges_from_http_header, http_header_from_ranges
-from oio.common.http_eventlet import http_connect
+from oio.common.http_eventlet import http_connect as _http_connect, \
+    ConnectionPoolManager
 from oio.common.utils import GeneratorIO, group_chunk_errors
 from oio.common import green
 
@@ -40,6 +46,36 @@ CLIENT_TIMEOUT = 5.0
 
 PUT_QUEUE_DEPTH = 10
 
+# number of metachunks uploaded concurrently
+PUT_PIPELINE_DEPTH = 2
+# number of data blocks (of WRITE_CHUNK_SIZE) read in advance
+# from the source, for each metachunk in the pipeline
+PUT_PIPELINE_BUFFER = 64
+
+# keep-alive connections to the RAWX services, shared by the data path
+RAWX_POOL_MANAGER = ConnectionPoolManager()
+
+# percentile of the observed latencies of a RAWX service after which
+# a backup request is sent to another one (None to disable)
+HEDGE_PERCENTILE = 95
+# never send a backup request sooner than this delay
+HEDGE_MIN_DELAY = 0.05
+# number of latency samples needed before sending backup requests
+HEDGE_MIN_SAMPLES = 16
+# number of latency samples kept for each RAWX service
+LATENCY_SAMPLES = 128
+
+
+def http_connect(host, method, path, headers=None, query_string=None):
+    """
+    Connect to a RAWX service, reusing an idle keep-alive connection
+    from `RAWX_POOL_MANAGER` when possible.
+    Closing the returned connection gives it back to the pool.
+    """
+    return _http_connect(host, method, path, headers=headers,
+                         query_string=query_string,
+                         pool_manager=RAWX_POOL_MANAGER)
+
 
 def close_source(source):
     try:
@@ -48,6 +84,67 @@ def close_source(source):
         pass
 
 
+class LatencyTracker(object):
+    """
+    Keep the recent response latencies of the RAWX services,
+    to decide when a request is slow enough to be hedged.
+    """
+
+    def __init__(self, max_samples=LATENCY_SAMPLES,
+                 min_samples=HEDGE_MIN_SAMPLES, min_delay=HEDGE_MIN_DELAY):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.samples = dict()
+        # samples of all services, when a service has not enough
+        self.all_samples = deque(maxlen=max_samples)
+
+    def record(self, netloc, latency):
+        """Record the time a service took to send response headers."""
+        samples = self.samples.get(netloc)
+        if samples is None:
+            samples = deque(maxlen=self.max_samples)
+            self.samples[netloc] = samples
+        samples.append(latency)
+        self.all_samples.append(latency)
+
+    def percentile(self, netloc, percentile):
+        """
+        :returns: the `percentile` of the latencies of the service,
+            or of all services if not known enough, or None.
+        """
+        samples = self.samples.get(netloc)
+        if not samples or len(samples) < self.min_samples:
+            samples = self.all_samples
+            if len(samples) < self.min_samples:
+                return None
+        ordered = sorted(samples)
+        index = int(len(ordered) * percentile / 100.0)
+        return ordered[min(index, len(ordered) - 1)]
+
+    def hedge_delay(self, chunk, percentile=HEDGE_PERCENTILE):
+        """
+        Compute how long to wait for `chunk` before sending a backup
+        request. Services with a low score (i.e. loaded) are given
+        less time.
+
+        :returns: a delay in seconds, or None to never hedge
+        """
+        if percentile is None:
+            return None
+        delay = self.percentile(urlparse(chunk['url']).netloc, percentile)
+        if delay is None:
+            return None
+        score = chunk.get('score')
+        if score is not None:
+            delay *= 0.5 + min(max(float(score), 0.0), 100.0) / 200.0
+        return max(delay, self.min_delay)
+
+
+# latencies of the RAWX services, shared by the data path
+RAWX_LATENCIES = LatencyTracker()
+
+
 class IOBaseWrapper(RawIOBase):
     """
     Wrap any object that has a `read` method into an `io.IOBase`.
@@ -72,15 +169,109 @@ class IOBaseWrapper(RawIOBase):
         return len(read_data)
 
 
+class FakeChecksum(object):
+    """Acts as a checksum object but does not compute anything"""
+
+    def __init__(self, actual_checksum):
+        self.checksum = actual_checksum
+
+    def hexdigest(self):
+        """Returns the checksum passed as constructor parameter"""
+        return self.checksum
+
+    def update(self, *_args, **_kwargs):
+        pass
+
+
+class DeferredChecksum(object):
+    """
+    Acts as a checksum object for data hashed by another coroutine.
+    `hexdigest()` is only valid once all the data has been fed.
+    """
+
+    def __init__(self):
+        self.checksum = None
+
+    def hexdigest(self):
+        """Returns the checksum computed by the feeder"""
+        if self.checksum is None:
+            raise ValueError('Metachunk checksum not computed yet')
+        return self.checksum.hexdigest()
+
+    def update(self, *_args, **_kwargs):
+        pass
+
+
+class PipedSource(object):
+    """
+    File-like object reading data blocks fed by another coroutine.
+    """
+
+    def __init__(self, max_blocks):
+        """
+        :param max_blocks: number of blocks that can be fed in advance
+        """
+        self.queue = Queue(max_blocks)
+        self.buf = ''
+        self.eof = False
+        self.closed = False
+        self.aborted = False
+
+    def feed(self, data):
+        """
+        Feed a block of data, blocking while the queue is full.
+        An empty block marks the end of the stream.
+        """
+        if not self.closed:
+            self.queue.put(data)
+
+    def close(self):
+        """Stop reading, drop buffered data and unblock the feeder."""
+        self.closed = True
+        while self.queue.qsize():
+            self.queue.get_nowait()
+
+    def abort(self):
+        """
+        Make the reader fail instead of reaching the end of the stream,
+        so the data already fed is not committed.
+        """
+        if self.closed or self.aborted:
+            return
+        self.aborted = True
+        while self.queue.qsize():
+            self.queue.get_nowait()
+        self.queue.put(None)
+
+    def read(self, size=-1):
+        if not self.buf and not self.eof:
+            if not self.aborted:
+                self.buf = self.queue.get()
+            if self.aborted:
+                self.buf = ''
+                raise IOError('Upload aborted')
+            if not self.buf:
+                self.eof = True
+        if size is None or size < 0 or size >= len(self.buf):
+            data, self.buf = self.buf, ''
+        else:
+            data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+
 class WriteHandler(object):
     def __init__(self, source, sysmeta, chunk_preparer,
                  storage_method, headers=None,
                  connection_timeout=None, write_timeout=None,
-                 read_timeout=None, **_kwargs):
+                 read_timeout=None, pipeline_depth=None,
+                 pipeline_buffer=None, **_kwargs):
         """
         :param connection_timeout: timeout to establish the connection
         :param write_timeout: timeout to send a buffer of data
         :param read_timeout: timeout to read a buffer of data from source
+        :param pipeline_depth: number of metachunks uploaded concurrently
+        :param pipeline_buffer: number of data blocks read in advance
+            from the source for each metachunk being uploaded
         """
         if isinstance(source, IOBase):
             self.source = BufferedReader(source)
@@ -99,6 +290,8 @@ class WriteHandler(object):
         self.connection_timeout = connection_timeout or CONNECTION_TIMEOUT
         self.write_timeout = write_timeout or CHUNK_TIMEOUT
         self.read_timeout = read_timeout or CLIENT_TIMEOUT
+        self.pipeline_depth = pipeline_depth or PUT_PIPELINE_DEPTH
+        self.pipeline_buffer = pipeline_buffer or PUT_PIPELINE_BUFFER
 
     def stream(self):
         """
@@ -110,6 +303,124 @@ class WriteHandler(object):
         """
         raise NotImplementedError()
 
+    def _feed(self, source, size, checksum, errors, meta_checksum=None,
+              first=False):
+        """
+        Read at most `size` bytes from the handler's source
+        and feed them to `source`.
+
+        :param checksum: checksum of the whole content
+        :param meta_checksum: a `DeferredChecksum` to fill with the
+            checksum of the data fed, before the end of the stream
+        :param first: tells the data is the beginning of the content,
+            thus hashed only once, the checksum of the metachunk being
+            a copy of the checksum of the content
+        :returns: the number of bytes read
+        """
+        meta_hash = None
+        if meta_checksum is not None and not first:
+            meta_hash = hashlib.md5()
+        fed = 0
+        try:
+            while fed < size and not errors:
+                read_size = min(WRITE_CHUNK_SIZE, size - fed)
+                with green.SourceReadTimeout(self.read_timeout):
+                    try:
+                        data = self.source.read(read_size)
+                    except (ValueError, IOError) as err:
+                        raise SourceReadError(str(err))
+                if not data:
+                    break
+                checksum.update(data)
+                if meta_hash is not None:
+                    meta_hash.update(data)
+                fed += len(data)
+                source.feed(data)
+        except green.SourceReadTimeout:
+            logger.warn('Source read timeout')
+            source.abort()
+            raise
+        except SourceReadError:
+            logger.warn('Source read error')
+            source.abort()
+            raise
+        if errors:
+            # Another metachunk failed: the upload will fail,
+            # do not let a truncated metachunk be committed.
+            source.abort()
+            return fed
+        if meta_checksum is not None:
+            meta_checksum.checksum = meta_hash or checksum.copy()
+        source.feed('')
+        return fed
+
+    def _source_has_data(self):
+        """Tell if there is data left to read from the handler's source."""
+        try:
+            with green.SourceReadTimeout(self.read_timeout):
+                try:
+                    return len(self.source.peek()) > 0
+                except (ValueError, IOError) as err:
+                    raise SourceReadError(str(err))
+        except green.SourceReadTimeout:
+            logger.warn('Source read timeout')
+            raise
+        except SourceReadError:
+            logger.warn('Source read error')
+            raise
+
+    def _stream_pipeline(self, make_writer, size):
+        """
+        Upload the source, metachunk by metachunk, keeping up to
+        `pipeline_depth` metachunks in flight. The data of a metachunk
+        is read from the source while the previous ones are still
+        being written and acknowledged.
+
+        :param make_writer: function building a `MetachunkWriter`
+            from the list of chunks of a metachunk, and the
+            `DeferredChecksum` of the metachunk, which data is
+            hashed while being fed to the writer
+        :param size: maximum amount of data per metachunk
+        :returns: a tuple of 3 which contains:
+           * the list of the results of `MetachunkWriter.stream()`,
+             in metachunk order
+           * the number of bytes transfered
+           * the actual checksum of the data that went through the stream.
+        """
+        global_checksum = hashlib.md5()
+        total_bytes_transferred = 0
+        errors = []
+        threads = []
+
+        def _write(writer, source):
+            try:
+                return writer.stream(source, size)
+            except (Exception, Timeout) as err:
+                errors.append(err)
+                source.close()
+
+        with green.ContextPool(self.pipeline_depth) as pool:
+            for meta_chunk in self.chunk_prep():
+                source = PipedSource(self.pipeline_buffer)
+                meta_checksum = DeferredChecksum()
+                threads.append(
+                    pool.spawn(_write, make_writer(meta_chunk, meta_checksum),
+                               source))
+                bytes_read = self._feed(source, size, global_checksum,
+                                        errors, meta_checksum=meta_checksum,
+                                        first=len(threads) == 1)
+                total_bytes_transferred += bytes_read
+                if errors or bytes_read < size:
+                    break
+                if not self._source_has_data():
+                    break
+            results = [thread.wait() for thread in threads]
+        if errors:
+            raise errors[0]
+
+        return (results, total_bytes_transferred,
+                global_checksum.hexdigest())
+
 
 def consume(it):
     for _x in it:
@@ -157,6 +468,28 @@ def iters_to_raw_body(parts_iter):
     return wrap(body_iter, parts_iter)
 
 
+def pop_bytes(blocks, size):
+    """
+    Pop `size` bytes from the beginning of a deque of data blocks.
+    Blocks are joined or split only when they do not match `size`.
+    """
+    first = blocks[0]
+    if len(first) == size:
+        return blocks.popleft()
+    if len(first) > size:
+        blocks[0] = first[size:]
+        return first[:size]
+    parts = []
+    while size > 0:
+        block = blocks.popleft()
+        if len(block) > size:
+            blocks.appendleft(block[size:])
+            block = block[:size]
+        parts.append(block)
+        size -= len(block)
+    return ''.join(parts)
+
+
 def discard_bytes(buf_size, start):
     """
     Discard the right amount of bytes so the reader
@@ -172,7 +505,8 @@ class ChunkReader(object):
 
     def __init__(self, chunk_iter, buf_size, headers,
                  connection_timeout=None, read_timeout=None,
-                 align=False, **_kwargs):
+                 align=False, hedge_percentile=HEDGE_PERCENTILE,
+                 latencies=None, **_kwargs):
         """
         :param chunk_iter:
         :param buf_size: size of the read buffer
@@ -181,6 +515,11 @@ class ChunkReader(object):
         :param read_timeout: timeout to read a buffer of data
         :param align: if True, the reader will skip some bytes to align
                       on `buf_size`
+        :param hedge_percentile: when a chunk takes longer to answer than
+            this percentile of its service's latencies, send a backup
+            request to the next chunk and use the first response
+            (None to try the chunks one after the other)
+        :param latencies: a `LatencyTracker`, defaults to `RAWX_LATENCIES`
         """
         self.chunk_iter = chunk_iter
         self.source = None
@@ -195,6 +534,8 @@ class ChunkReader(object):
         self.align = align
         self.connection_timeout = connection_timeout or CONNECTION_TIMEOUT
         self.read_timeout = read_timeout or CHUNK_TIMEOUT
+        self.hedge_percentile = hedge_percentile
+        self.latencies = latencies or RAWX_LATENCIES
         self._resp_by_chunk = dict()
 
     def recover(self, nb_bytes):
@@ -240,11 +581,13 @@ class ChunkReader(object):
             # just add an offset to the request
             self.request_headers['Range'] = 'bytes=%d-' % nb_bytes
 
-    def _get_request(self, chunk):
+    def _connect(self, chunk):
         """
         Connect to a chunk, fetch headers but don't read data.
-        Save the response object in `self.sources` list.
+
+        :returns: the response object, or None on failure
         """
+        start = time.time()
         try:
             with green.ConnectionTimeout(self.connection_timeout):
                 raw_url = chunk["url"]
@@ -257,25 +600,45 @@ class ChunkReader(object):
         except (Exception, Timeout) as error:
             logger.exception('Connection failed to %s', chunk)
             self._resp_by_chunk[chunk["url"]] = (0, str(error))
-            return False
+            return None
 
         if source.status in (200, 206):
-            self.status = source.status
-            self._headers = source.getheaders()
-            self.sources.append((source, chunk))
-            return True
+            # Only successful responses tell how fast the service is:
+            # failures may be immediate (refused) or cut by a timeout.
+            self.latencies.record(parsed.netloc, time.time() - start)
+            return source
         else:
             logger.warn("Invalid response from %s: %d %s",
                         chunk, source.status, source.reason)
             self._resp_by_chunk[chunk["url"]] = (source.status,
                                                  str(source.reason))
-        return False
+            close_source(source)
+        return None
+
+    def _set_source(self, source, chunk):
+        self.status = source.status
+        self._headers = source.getheaders()
+        self.sources.append((source, chunk))
+
+    def _get_request(self, chunk):
+        """
+        Connect to a chunk, fetch headers but don't read data.
+        Save the response object in `self.sources` list.
+        """
+        source = self._connect(chunk)
+        if source is None:
+            return False
+        self._set_source(source, chunk)
+        return True
 
     def _get_source(self):
         """
         Iterate on chunks until one answers,
         and return the response object.
         """
+        if self.hedge_percentile is not None:
+            return self._get_source_hedged()
+
         for chunk in self.chunk_iter:
             # continue to iterate until we find a valid source
             if self._get_request(chunk):
@@ -286,9 +649,68 @@ class ChunkReader(object):
             return source, chunk
         return None, None
 
+    def _get_source_hedged(self):
+        """
+        Iterate on chunks until one answers, sending a request to the
+        next chunk when the current one fails, or when it is slower
+        than usual. Return the first valid response object.
+        """
+        results = Queue()
+        done = list()
+
+        def _request(chunk):
+            source = self._connect(chunk)
+            if done:
+                # a faster request already won
+                if source is not None:
+                    close_source(source)
+                return
+            results.put((source, chunk))
+
+        chunk_iter = iter(self.chunk_iter)
+        pending = 0
+        threads = list()
+        try:
+            while True:
+                chunk = next(chunk_iter, None)
+                if chunk is not None:
+                    threads.append(spawn(_request, chunk))
+                    pending += 1
+                    delay = self.latencies.hedge_delay(
+                        chunk, self.hedge_percentile)
+                elif not pending:
+                    break
+                else:
+                    # no more chunks to try, wait for the others
+                    delay = None
+                try:
+                    source, chunk = results.get(timeout=delay)
+                except Empty:
+                    # the request is slow, send a backup request
+                    continue
+                pending -= 1
+                if source is not None:
+                    self._set_source(source, chunk)
+                    break
+        finally:
+            done.append(True)
+            # Stop the slower requests, and their timeouts
+            for thread in threads:
+                thread.kill()
+            while results.qsize():
+                source, _chunk = results.get_nowait()
+                if source is not None:
+                    close_source(source)
+
+        if self.sources:
+            source, chunk = self.sources.pop()
+            return source, chunk
+        return None, None
+
     def get_iter(self):
         source, chunk = self._get_source()
         if source:
+            self.source = source
             return self._get_iter(chunk, source)
         errors = group_chunk_errors(self._resp_by_chunk.items())
         if len(errors) == 1:
@@ -328,7 +750,10 @@ class ChunkReader(object):
             try:
                 orig_ranges = ranges_from_http_header(
                     self.request_headers['Range'])
-                new_ranges = [(start, end)] + orig_ranges[1:]
+                # drop the ranges already served by previous parts
+                new_ranges = [(start, end)] + [
+                    (r_start, r_end) for r_start, r_end in orig_ranges[1:]
+                    if r_start is not None and r_start > end]
             except ValueError:
                 new_ranges = [(start, end)]
         else:
@@ -341,9 +766,7 @@ class ChunkReader(object):
     def get_next_part(parts_iter):
         """
         Gets next part of the body
-
-        NOTE: for the moment only return one part
-              (single range only)
+        (multipart responses have one part per range)
         """
         while True:
             try:
@@ -355,16 +778,29 @@ class ChunkReader(object):
                 # TODO recover
                 raise StopIteration
 
+    def _read_size(self, buffered):
+        """
+        Amount of data to read so the reads end on `buf_size` boundaries,
+        which lets us yield the data blocks without joining or slicing.
+        """
+        if self.buf_size is not None:
+            missing = self.buf_size - buffered
+            if 0 < missing < READ_CHUNK_SIZE:
+                return missing
+        return READ_CHUNK_SIZE
+
     def iter_from_resp(self, source, parts_iter, part, chunk):
         bytes_consumed = 0
         count = 0
-        buf = ''
+        # data blocks not yielded yet, only joined when
+        # a yielded buffer spans several blocks
+        buf = deque()
+        buf_len = 0
         while True:
             try:
                 with green.ChunkReadTimeout(self.read_timeout):
-                    data = part.read(READ_CHUNK_SIZE)
+                    data = part.read(self._read_size(buf_len))
                     count += 1
-                    buf += data
             except green.ChunkReadTimeout as crto:
                 try:
                     self.recover(bytes_consumed)
@@ -373,7 +809,8 @@ class ChunkReader(object):
                 except exc.EmptyByteRange:
                     # we are done already
                     break
-                buf = ''
+                buf.clear()
+                buf_len = 0
                 # find a new source to perform recovery
                 new_source, new_chunk = self._get_source()
                 if new_source:
@@ -398,37 +835,39 @@ class ChunkReader(object):
                     # no valid source found to recover
                     raise
             else:
-                # discard bytes
-                if buf and self.discard_bytes:
-                    if self.discard_bytes < len(buf):
-                        buf = buf[self.discard_bytes:]
-                        bytes_consumed += self.discard_bytes
-                        self.discard_bytes = 0
-                    else:
-                        self.discard_bytes -= len(buf)
-                        bytes_consumed += len(buf)
-                        buf = ''
-
                 # no data returned
                 # flush out buffer
                 if not data:
-                    if buf:
-                        bytes_consumed += len(buf)
-                        yield buf
-                    buf = ''
+                    if buf_len:
+                        read_d = pop_bytes(buf, buf_len)
+                        bytes_consumed += len(read_d)
+                        yield read_d
                     break
 
+                # discard bytes
+                if self.discard_bytes:
+                    if self.discard_bytes < len(data):
+                        data = data[self.discard_bytes:]
+                        bytes_consumed += self.discard_bytes
+                        self.discard_bytes = 0
+                    else:
+                        self.discard_bytes -= len(data)
+                        bytes_consumed += len(data)
+                        data = ''
+
                 # If buf_size is defined, yield bounded data buffers
                 if self.buf_size is not None:
-                    while len(buf) >= self.buf_size:
-                        read_d = buf[:self.buf_size]
-                        buf = buf[self.buf_size:]
+                    if data:
+                        buf.append(data)
+                        buf_len += len(data)
+                    while buf_len >= self.buf_size:
+                        read_d = pop_bytes(buf, self.buf_size)
+                        buf_len -= self.buf_size
                         yield read_d
                         bytes_consumed += len(read_d)
-                else:
-                    yield buf
-                    bytes_consumed += len(buf)
-                    buf = ''
+                elif data:
+                    yield data
+                    bytes_consumed += len(data)
 
                 # avoid starvation by forcing sleep()
                 # every once in a while
@@ -467,6 +906,15 @@ class ChunkReader(object):
         finally:
             close_source(source[0])
 
+    def close(self):
+        """
+        Release the response object found by `get_iter()`,
+        when the iterator it returned has not been used.
+        """
+        if self.source is not None:
+            close_source(self.source)
+            self.source = None
+
     @property
     def headers(self):
         if not self._headers:
@@ -522,6 +970,100 @@ class MetachunkWriter(object):
                 (len(successes), self.quorum, errors))
 
 
+class _ResponseReader(object):
+    """
+    Buffered reader over the body of a response, adding `readline`.
+    """
+
+    def __init__(self, resp):
+        self.resp = resp
+        self.buf = ''
+
+    def readline(self, limit=8192):
+        while '\n' not in self.buf and len(self.buf) < limit:
+            data = self.resp.read(1024)
+            if not data:
+                break
+            self.buf += data
+        index = self.buf.find('\n')
+        if index < 0:
+            index = len(self.buf)
+        line, self.buf = self.buf[:index + 1], self.buf[index + 1:]
+        return line
+
+    def read(self, size):
+        if self.buf:
+            data, self.buf = self.buf[:size], self.buf[size:]
+            return data
+        return self.resp.read(size)
+
+
+class _PartReader(object):
+    """
+    Read the body of one part of a multipart/byteranges response.
+    """
+
+    def __init__(self, reader, length):
+        self.reader = reader
+        self.remaining = length
+
+    def read(self, size=None):
+        if size is None or size > self.remaining:
+            size = self.remaining
+        if size <= 0:
+            return ''
+        data = self.reader.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def discard(self):
+        while self.remaining > 0 and self.read(READ_CHUNK_SIZE):
+            pass
+
+
+def iter_multipart_byteranges(resp, boundary):
+    """
+    Iterate over the parts of a multipart/byteranges response.
+
+    iterator return tuples:
+
+    (start, end, length, headers, body_file)
+    """
+    reader = _ResponseReader(resp)
+    delimiter = '--' + boundary
+
+    def _next_delimiter():
+        """Skip lines until a delimiter, tell if this is the last one"""
+        while True:
+            line = reader.readline()
+            if not line:
+                raise exc.OioException(
+                    'Truncated multipart/byteranges response')
+            line = line.rstrip('\r\n')
+            if line == delimiter:
+                return False
+            if line == delimiter + '--':
+                return True
+
+    if _next_delimiter():
+        return
+    while True:
+        headers = []
+        while True:
+            line = reader.readline().rstrip('\r\n')
+            if not line:
+                break
+            key, value = line.split(':', 1)
+            headers.append((key.strip().lower(), value.strip()))
+        start, end, _ = parse_content_range(dict(headers)['content-range'])
+        part = _PartReader(reader, end - start + 1)
+        yield (start, end, end - start + 1, headers, part)
+        # the caller may not have read the whole part
+        part.discard()
+        if _next_delimiter():
+            return
+
+
 def make_iter_from_resp(resp):
     """
     Makes a part iterator from a HTTP response
@@ -539,6 +1081,8 @@ def make_iter_from_resp(resp):
         start, end, _ = parse_content_range(
             resp.getheader('Content-Range'))
         return iter([(start, end, end-start+1, resp.getheaders(), resp)])
-    else:
+    boundary = dict(params).get('boundary')
+    if not boundary:
         raise ValueError("Invalid response with code %d and content-type %s" %
-                         resp.status, content_type)
+                         (resp.status, content_type))
+    return iter_multipart_byteranges(resp, boundary.strip('"'))
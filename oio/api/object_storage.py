@@ -16,6 +16,7 @@
 
 from __future__ import absolute_import
 from io import BytesIO
+from collections import deque
 import logging
 import os
 import warnings
@@ -35,6 +36,7 @@ from oio.common.easy_value import float_value
 from oio.common.logger import get_logger
 from oio.common.decorators import ensure_headers, ensure_request_id
 from oio.common.storage_method import STORAGE_METHODS
+from oio.common import ec_offload
 from oio.common.constants import OIO_VERSION
 from oio.common.decorators import handle_account_not_found, \
     handle_container_not_found, handle_object_not_found
@@ -61,6 +63,8 @@ class ObjectStorageApi(object):
         - `write_timeout`: `float`
     """
     TIMEOUT_KEYS = ('connection_timeout', 'read_timeout', 'write_timeout')
+    # maximum number of metachunks to prepare in one request
+    MAX_PREPARE_BATCH = 32
 
     def __init__(self, namespace, logger=None, **kwargs):
         """
@@ -79,6 +83,15 @@ class ObjectStorageApi(object):
         :keyword pool_manager: a pooled connection manager that will be used
             for all HTTP based APIs (except rawx)
         :type pool_manager: `urllib3.PoolManager`
+        :keyword ec_offload: where to run erasure-code computations of this
+            process: 'inline' (default), 'thread' or 'process'
+        :type ec_offload: `str`
+        :keyword ec_offload_workers: number of threads or processes
+            running erasure-code computations
+        :type ec_offload_workers: `int`
+        :keyword ec_offload_batch: number of segments sent at once
+            to a thread or a process
+        :type ec_offload_batch: `int`
         """
         self.namespace = namespace
         conf = {"namespace": self.namespace}
@@ -86,6 +99,14 @@ class ObjectStorageApi(object):
         self.timeouts = {tok: float_value(tov, None)
                          for tok, tov in kwargs.items()
                          if tok in self.__class__.TIMEOUT_KEYS}
+        # chunk size of the namespace, learnt from content_prepare
+        self._chunk_size = None
+        if 'ec_offload' in kwargs:
+            ec_offload.configure(
+                kwargs['ec_offload'],
+                workers=kwargs.get('ec_offload_workers'),
+                batch=kwargs.get('ec_offload_batch',
+                                 ec_offload.DEFAULT_EC_OFFLOAD_BATCH))
 
         from oio.account.client import AccountClient
         from oio.container.client import ContainerClient
@@ -416,6 +437,9 @@ class ObjectStorageApi(object):
         """
         if (data, file_or_path) == (None, None):
             raise exc.MissingData()
+        if isinstance(data, unicode):
+            # Upload (and count) bytes, not characters
+            data = data.encode('utf-8')
         src = data if data is not None else file_or_path
         if src is file_or_path:
             if isinstance(file_or_path, basestring):
@@ -444,7 +468,8 @@ class ObjectStorageApi(object):
             return self._object_create(
                 account, container, obj_name, BytesIO(data), sysmeta,
                 properties=metadata, policy=policy,
-                key_file=key_file, append=append, **kwargs)
+                key_file=key_file, append=append,
+                content_length=len(data), **kwargs)
         elif hasattr(file_or_path, "read"):
             return self._object_create(
                 account, container, obj_name, src, sysmeta,
@@ -455,7 +480,8 @@ class ObjectStorageApi(object):
                 return self._object_create(
                     account, container, obj_name, f, sysmeta,
                     properties=metadata, policy=policy,
-                    key_file=key_file, append=append, **kwargs)
+                    key_file=key_file, append=append,
+                    content_length=os.fstat(f.fileno()).st_size, **kwargs)
 
     @ensure_headers
     @ensure_request_id
@@ -693,33 +719,70 @@ class ObjectStorageApi(object):
             version=version, **kwargs)
 
     def _content_preparer(self, account, container, obj_name,
-                          policy=None, **kwargs):
-        # TODO: optimize by asking more than one metachunk at a time
+                          policy=None, content_length=None, **kwargs):
+        """
+        Prepare the upload of an object.
+
+        Placement of several metachunks is requested per call: the first
+        request is sized from `content_length` (when known, and when the
+        chunk size has been learnt from a previous request), and the
+        following ones double in size, up to `MAX_PREPARE_BATCH`
+        metachunks per request, as long as the data stream goes on.
+
+        :returns: a tuple with the object metadata and a generator
+            function yielding the list of chunks of each metachunk
+        """
+        if content_length and self._chunk_size:
+            # Do not ask meta2 to place too many metachunks at once
+            first_size = min(content_length,
+                             self.MAX_PREPARE_BATCH * self._chunk_size)
+        else:
+            # Chunk size not known yet: ask for one metachunk
+            first_size = 1
         obj_meta, first_body = self.container.content_prepare(
-            account, container, obj_name, size=1, stgpol=policy,
-            autocreate=True, **kwargs)
+            account, container, obj_name, size=first_size,
+            stgpol=policy, autocreate=True, **kwargs)
         storage_method = STORAGE_METHODS.load(obj_meta['chunk_method'])
+        if obj_meta.get('chunk_size'):
+            self._chunk_size = int(obj_meta['chunk_size'])
+        # amount of data meta2 places in one metachunk
+        metachunk_size = obj_meta.get('chunk_size') or 1
+        if storage_method.ec:
+            metachunk_size *= storage_method.ec_nb_data
 
-        def _fix_mc_pos(chunks, mc_pos):
+        def _split_metachunks(chunks):
+            """Group chunks by metachunk, in position order."""
+            by_pos = dict()
             for chunk in chunks:
                 raw_pos = chunk["pos"].split(".")
                 if storage_method.ec:
                     chunk['num'] = int(raw_pos[1])
+                by_pos.setdefault(int(raw_pos[0]), []).append(chunk)
+            return [by_pos[pos] for pos in sorted(by_pos)]
+
+        def _fix_mc_pos(chunks, mc_pos):
+            for chunk in chunks:
+                if storage_method.ec:
                     chunk["pos"] = "%d.%d" % (mc_pos, chunk['num'])
                 else:
                     chunk["pos"] = str(mc_pos)
 
         def _metachunk_preparer():
             mc_pos = kwargs.get('meta_pos', 0)
-            _fix_mc_pos(first_body, mc_pos)
-            yield first_body
+            queue = deque(_split_metachunks(first_body))
+            batch = 1
             while True:
-                mc_pos += 1
-                _, next_body = self.container.content_prepare(
-                        account, container, obj_name, 1, stgpol=policy,
+                if not queue:
+                    batch = min(batch * 2, self.MAX_PREPARE_BATCH)
+                    _, next_body = self.container.content_prepare(
+                        account, container, obj_name,
+                        batch * metachunk_size, stgpol=policy,
                         autocreate=True, **kwargs)
-                _fix_mc_pos(next_body, mc_pos)
-                yield next_body
+                    queue.extend(_split_metachunks(next_body))
+                meta_chunk = queue.popleft()
+                _fix_mc_pos(meta_chunk, mc_pos)
+                yield meta_chunk
+                mc_pos += 1
 
         return obj_meta, _metachunk_preparer
 
@@ -731,11 +794,11 @@ class ObjectStorageApi(object):
 
     def _object_create(self, account, container, obj_name, source,
                        sysmeta, properties=None, policy=None,
-                       key_file=None, **kwargs):
+                       key_file=None, content_length=None, **kwargs):
         self._patch_timeouts(kwargs)
         obj_meta, chunk_prep = self._content_preparer(
             account, container, obj_name,
-            policy=policy, **kwargs)
+            policy=policy, content_length=content_length, **kwargs)
         obj_meta.update(sysmeta)
         obj_meta['content_path'] = obj_name
         obj_meta['container_id'] = cid_from_name(account, container).upper()
@@ -22,35 +22,28 @@ from oio.common import exceptions as exc
 from oio.common.exceptions import SourceReadError
 from oio.common.http import headers_from_object_metadata
 from oio.api import io
+from oio.api.io import FakeChecksum  # noqa: F401 (used by other modules)
 from oio.common.constants import chunk_headers
 from oio.common import green
 
 logger = logging.getLogger(__name__)
 
 
-class FakeChecksum(object):
-    """Acts as a checksum object but does not compute anything"""
-
-    def __init__(self, actual_checksum):
-        self.checksum = actual_checksum
-
-    def hexdigest(self):
-        """Returns the checksum passed as constructor parameter"""
-        return self.checksum
-
-    def update(self, *_args, **_kwargs):
-        pass
-
-
 class ReplicatedMetachunkWriter(io.MetachunkWriter):
     def __init__(self, sysmeta, meta_chunk, checksum, storage_method,
                  quorum=None, connection_timeout=None, write_timeout=None,
-                 read_timeout=None, headers=None):
+                 read_timeout=None, headers=None, meta_checksum=None):
+        """
+        :param checksum: checksum of the whole content, to update
+        :param meta_checksum: checksum of the metachunk, when the data
+            is hashed by the caller (an MD5 is computed otherwise)
+        """
         super(ReplicatedMetachunkWriter, self).__init__(
             storage_method=storage_method, quorum=quorum)
         self.sysmeta = sysmeta
         self.meta_chunk = meta_chunk
         self.checksum = checksum
+        self.meta_checksum = meta_checksum
         self.connection_timeout = connection_timeout or io.CONNECTION_TIMEOUT
         self.write_timeout = write_timeout or io.CHUNK_TIMEOUT
         self.read_timeout = read_timeout or io.CLIENT_TIMEOUT
@@ -59,7 +52,7 @@ class ReplicatedMetachunkWriter(io.MetachunkWriter):
     def stream(self, source, size=None):
         bytes_transferred = 0
         meta_chunk = self.meta_chunk
-        meta_checksum = hashlib.md5()
+        meta_checksum = self.meta_checksum or hashlib.md5()
         pile = GreenPile(len(meta_chunk))
         failed_chunks = []
         current_conns = []
@@ -251,28 +244,23 @@ class ReplicatedWriteHandler(io.WriteHandler):
     """
 
     def stream(self):
-        global_checksum = hashlib.md5()
-        total_bytes_transferred = 0
-        content_chunks = []
+        size = self.sysmeta['chunk_size']
 
-        for meta_chunk in self.chunk_prep():
-            size = self.sysmeta['chunk_size']
-            handler = ReplicatedMetachunkWriter(
-                self.sysmeta, meta_chunk, global_checksum, self.storage_method,
+        def _make_writer(meta_chunk, meta_checksum):
+            # the checksums are computed by the pipeline
+            return ReplicatedMetachunkWriter(
+                self.sysmeta, meta_chunk, FakeChecksum(None),
+                self.storage_method,
                 connection_timeout=self.connection_timeout,
                 write_timeout=self.write_timeout,
                 read_timeout=self.read_timeout,
-                headers=self.headers)
-            bytes_transferred, _checksum, chunks = handler.stream(self.source,
-                                                                  size)
-            content_chunks += chunks
+                headers=self.headers, meta_checksum=meta_checksum)
 
-            total_bytes_transferred += bytes_transferred
-            if bytes_transferred < size:
-                break
-            if len(self.source.peek()) == 0:
-                break
+        results, total_bytes_transferred, content_checksum = \
+            self._stream_pipeline(_make_writer, size)
 
-        content_checksum = global_checksum.hexdigest()
+        content_chunks = []
+        for _bytes_transferred, _checksum, chunks in results:
+            content_chunks += chunks
 
         return content_chunks, total_bytes_transferred, content_checksum
@@ -16,26 +16,49 @@
 
 from contextlib import closing
 import hashlib
+import multiprocessing
+import os
 import time
+import zlib
 
 from oio.blob.utils import check_volume, read_chunk_metadata
 from oio.container.client import ContainerClient
+from oio.common.cache import LruTtlCache
 from oio.common.daemon import Daemon
 from oio.common import exceptions as exc
 from oio.common.utils import paths_gen
-from oio.common.easy_value import int_value
+from oio.common.easy_value import float_value, int_value
 from oio.common.logger import get_logger
 from oio.common.green import ratelimit
 
 
 SLEEP_TIME = 30
+READ_BLOCK_SIZE = 65536
+
+
+def _shard_of(path, shards):
+    return (zlib.crc32(os.path.basename(path)) & 0xffffffff) % shards
+
+
+def _find_chunk(chunks, chunk_id):
+    for chunk in chunks:
+        if chunk['url'].endswith(chunk_id):
+            return chunk
+    return None
 
 
 class BlobAuditorWorker(object):
-    def __init__(self, conf, logger, volume):
+    """
+    Audit the chunks of a volume, or of one shard of a volume
+    when several workers share the volume.
+    """
+
+    def __init__(self, conf, logger, volume, shard=0, shards=1):
         self.conf = conf
         self.logger = logger
         self.volume = volume
+        self.shard = shard
+        self.shards = shards
         self.run_time = 0
         self.passes = 0
         self.errors = 0
@@ -50,11 +73,49 @@ class BlobAuditorWorker(object):
         self.total_chunks_processed = 0
         self.report_interval = int_value(
             conf.get('report_interval'), 3600)
-        self.max_chunks_per_second = int_value(
-            conf.get('chunks_per_second'), 30)
-        self.max_bytes_per_second = int_value(
-            conf.get('bytes_per_second'), 10000000)
+        # The workers auditing the shards of a volume share its budget
+        self.max_chunks_per_second = self._share(int_value(
+            conf.get('chunks_per_second'), 30))
+        self.max_bytes_per_second = self._share(int_value(
+            conf.get('bytes_per_second'), 10000000))
+        self.read_block_size = int_value(
+            conf.get('read_block_size'), READ_BLOCK_SIZE)
         self.container_client = ContainerClient(conf, logger=self.logger)
+        # Locations of the contents, shared by their chunks
+        self.content_cache = LruTtlCache(
+            max_size=int_value(conf.get('content_cache_size'), 1024),
+            ttl=float_value(conf.get('content_cache_ttl'), 300.0))
+
+    def _share(self, rate):
+        if rate <= 0:
+            return rate
+        return max(1, rate // self.shards)
+
+    def _paths_gen(self):
+        if self.shards <= 1:
+            return paths_gen(self.volume)
+        return self._shard_paths_gen()
+
+    def _shard_paths_gen(self):
+        """
+        Yield the paths of the chunks of the shard. The top-level (hash)
+        directories of the volume are shared among the shards, so each
+        worker only walks its own subtrees.
+        """
+        try:
+            names = os.listdir(self.volume)
+        except OSError as err:
+            self.logger.warn('Failed to list %s: %s', self.volume, err)
+            return
+        for name in sorted(names):
+            if _shard_of(name, self.shards) != self.shard:
+                continue
+            path = os.path.join(self.volume, name)
+            if os.path.isdir(path):
+                for chunk_path in paths_gen(path):
+                    yield chunk_path
+            else:
+                yield path
 
     def audit_pass(self):
         self.namespace, self.address = check_volume(self.volume)
@@ -67,7 +128,7 @@ class BlobAuditorWorker(object):
         total_faulty = 0
         audit_time = 0
 
-        paths = paths_gen(self.volume)
+        paths = self._paths_gen()
 
         for path in paths:
             loop_time = time.time()
@@ -168,7 +229,8 @@ class BlobAuditorWorker(object):
                     'Missing extended attribute %s' % e)
             size = int(meta['chunk_size'])
             md5_checksum = meta['chunk_hash'].lower()
-            reader = ChunkReader(f, size, md5_checksum)
+            reader = ChunkReader(f, size, md5_checksum,
+                                 block_size=self.read_block_size)
             with closing(reader):
                 for buf in reader:
                     buf_len = len(buf)
@@ -180,18 +242,7 @@ class BlobAuditorWorker(object):
                     self.total_bytes_processed += buf_len
 
             try:
-                container_id = meta['container_id']
-                content_path = meta['content_path']
-                content_attr, data = self.container_client.content_locate(
-                    cid=container_id, path=content_path)
-
-                # Check chunk data
-                chunk_data = None
-                metachunks = set()
-                for c in data:
-                    if c['url'].endswith(meta['chunk_id']):
-                        metachunks.add(c['pos'].split('.', 2)[0])
-                        chunk_data = c
+                chunk_data = self._locate_chunk(meta)
                 if not chunk_data:
                     raise exc.OrphanChunk('Not found in content')
 
@@ -207,6 +258,25 @@ class BlobAuditorWorker(object):
             except exc.NotFound:
                 raise exc.OrphanChunk('Chunk not found in container')
 
+    def _locate_chunk(self, meta):
+        """
+        Find the description of a chunk in the location of its content.
+        The location is cached, to be reused for the other chunks
+        of the content.
+        """
+        key = (meta['container_id'], meta['content_path'],
+               meta['content_id'])
+        data = self.content_cache.get(key)
+        if data is not None:
+            chunk_data = _find_chunk(data, meta['chunk_id'])
+            if chunk_data:
+                return chunk_data
+            # The content may have changed since it was cached
+        _, data = self.container_client.content_locate(
+            cid=meta['container_id'], path=meta['content_path'])
+        self.content_cache.set(key, data)
+        return _find_chunk(data, meta['chunk_id'])
+
 
 class BlobAuditor(Daemon):
     def __init__(self, conf, **kwargs):
@@ -216,11 +286,34 @@ class BlobAuditor(Daemon):
         if not volume:
             raise exc.ConfigurationException('No volume specified for auditor')
         self.volume = volume
+        self.processes = int_value(conf.get('processes'), 1)
 
     def run(self, *args, **kwargs):
+        if self.processes <= 1:
+            return self._run_worker()
+        # Audit one shard of the volume in each process
+        children = dict()
+        while True:
+            for shard in range(self.processes):
+                child = children.get(shard)
+                if child is not None and child.is_alive():
+                    continue
+                if child is not None:
+                    self.logger.warn(
+                        'Auditor of shard %d exited (code %s), restarting',
+                        shard, child.exitcode)
+                child = multiprocessing.Process(
+                    target=self._run_worker, args=(shard, ))
+                child.daemon = True
+                child.start()
+                children[shard] = child
+            self._sleep()
+
+    def _run_worker(self, shard=0):
         while True:
             try:
-                worker = BlobAuditorWorker(self.conf, self.logger, self.volume)
+                worker = BlobAuditorWorker(self.conf, self.logger, self.volume,
+                                           shard=shard, shards=self.processes)
                 worker.audit_pass()
             except Exception as e:
                 self.logger.exception('ERROR in audit: %s' % e)
@@ -231,17 +324,18 @@ class BlobAuditor(Daemon):
 
 
 class ChunkReader(object):
-    def __init__(self, fp, size, md5_checksum):
+    def __init__(self, fp, size, md5_checksum, block_size=READ_BLOCK_SIZE):
         self.fp = fp
         self.size = size
         self.md5_checksum = md5_checksum
+        self.block_size = block_size
         self.bytes_read = 0
         self.iter_md5 = None
 
     def __iter__(self):
         self.iter_md5 = hashlib.md5()
         while True:
-            buf = self.fp.read()
+            buf = self.fp.read(self.block_size)
             if buf:
                 self.iter_md5.update(buf)
                 self.bytes_read += len(buf)
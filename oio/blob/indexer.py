@@ -19,7 +19,7 @@ from datetime import datetime
 from random import random
 
 from oio.blob.utils import check_volume, read_chunk_metadata
-from oio.rdir.client import RdirClient
+from oio.rdir.client import RdirClient, RDIR_BATCH_SIZE
 from oio.common.daemon import Daemon
 from oio.common import exceptions as exc
 from oio.common.utils import paths_gen
@@ -48,23 +48,50 @@ class BlobIndexer(Daemon):
             conf.get('report_interval'), 3600)
         self.max_chunks_per_second = int_value(
             conf.get('chunks_per_second'), 30)
+        self.batch_size = int_value(
+            conf.get('batch_size'), RDIR_BATCH_SIZE)
+        # Only index the chunks of the directories modified
+        # since the previous pass
+        self.walk_checkpoint = conf.get('walk_checkpoint')
         self.index_client = RdirClient(conf, logger=self.logger)
         self.namespace, self.volume_id = check_volume(self.volume)
 
     def index_pass(self):
 
-        def safe_update_index(path):
+        def safe_read_record(path):
             try:
-                self.update_index(path)
-                self.successes += 1
-                self.logger.debug('Updated %s', path)
-            except OioNetworkException as exc:
-                self.errors += 1
-                self.logger.warn('ERROR while updating %s: %s', path, exc)
+                batch.append((path, self.chunk_record(path)))
             except Exception:
                 self.errors += 1
                 self.logger.exception('ERROR while updating %s', path)
 
+        def safe_flush_batch():
+            if not batch:
+                return
+            paths, records = zip(*batch)
+            del batch[:]
+            try:
+                statuses = self.index_client.chunk_push_many(
+                    self.volume_id, records, batch_size=self.batch_size)
+            except OioNetworkException as exc:
+                self.errors += len(paths)
+                self.logger.warn('ERROR while updating %d chunks: %s',
+                                 len(paths), exc)
+                return
+            except Exception:
+                self.errors += len(paths)
+                self.logger.exception('ERROR while updating %d chunks',
+                                      len(paths))
+                return
+            for path, status in zip(paths, statuses):
+                if status.get('status') // 100 == 2:
+                    self.successes += 1
+                    self.logger.debug('Updated %s', path)
+                else:
+                    self.errors += 1
+                    self.logger.warn('ERROR while updating %s: %s',
+                                     path, status.get('message'))
+
         def report(tag):
             total = self.errors + self.successes
             now = time.time()
@@ -92,10 +119,20 @@ class BlobIndexer(Daemon):
         self.errors = 0
         self.successes = 0
 
-        paths = paths_gen(self.volume)
+        def commit_walk():
+            # Flush the last batch before the end of the walk is saved,
+            # and save it only if every chunk has been indexed.
+            safe_flush_batch()
+            return not self.errors
+
+        batch = list()
+        paths = paths_gen(self.volume, checkpoint_path=self.walk_checkpoint,
+                          commit=commit_walk)
         report('started')
         for path in paths:
-            safe_update_index(path)
+            safe_read_record(path)
+            if len(batch) >= self.batch_size:
+                safe_flush_batch()
             self.chunks_run_time = ratelimit(
                 self.chunks_run_time,
                 self.max_chunks_per_second
@@ -103,21 +140,29 @@ class BlobIndexer(Daemon):
             now = time.time()
             if now - self.last_reported >= self.report_interval:
                 report('running')
+        safe_flush_batch()
         report('ended')
 
-    def update_index(self, path):
+    def chunk_record(self, path):
+        """Build the rdir record of the chunk at `path`."""
         with open(path) as f:
             try:
                 meta = read_chunk_metadata(f)
             except exc.MissingAttribute as e:
                 raise exc.FaultyChunk(
                     'Missing extended attribute %s' % e)
-            data = {'mtime': int(time.time())}
-            self.index_client.chunk_push(self.volume_id,
-                                         meta['container_id'],
-                                         meta['content_id'],
-                                         meta['chunk_id'],
-                                         **data)
+        return {'container_id': meta['container_id'],
+                'content_id': meta['content_id'],
+                'chunk_id': meta['chunk_id'],
+                'mtime': int(time.time())}
+
+    def update_index(self, path):
+        record = self.chunk_record(path)
+        self.index_client.chunk_push(self.volume_id,
+                                     record.pop('container_id'),
+                                     record.pop('content_id'),
+                                     record.pop('chunk_id'),
+                                     **record)
 
     def run(self, *args, **kwargs):
         time.sleep(random() * self.interval)
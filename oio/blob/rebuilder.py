@@ -14,10 +14,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import errno
+import itertools
 import json
+import os
 import time
+from collections import deque
 from datetime import datetime
 from socket import gethostname
+from urlparse import urlparse
+
+from eventlet import GreenPool, sleep
 
 from oio.common.easy_value import int_value, true_value
 from oio.common.logger import get_logger
@@ -28,10 +35,129 @@ from oio.event.beanstalk import Beanstalk, ConnectionError
 from oio.rdir.client import RdirClient
 
 
+def _chunk_key(container_id, content_id, chunk_id):
+    return '|'.join((container_id, content_id, chunk_id))
+
+
+class RebuildCheckpoint(object):
+    """
+    Durable progress of a rebuild.
+
+    The checkpoint file records the key of the last chunk before which
+    every chunk has been processed (the marker), and the result of each
+    chunk processed after it. A rebuild resumed from the checkpoint
+    starts after the marker and skips the chunks already processed.
+    Each marker line lists the chunks it covers, whose results
+    become useless, and the chunks it leaves behind because they
+    failed, to be processed again when the rebuild is resumed.
+    """
+
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.marker = None
+        self.results = dict()
+        # keys of the failed chunks before the marker
+        self.failed = set()
+        self._in_progress = deque()
+        self._finished = set()
+        self._last_sync = 0
+        self._load()
+        self._file = open(self.path, 'a')
+
+    def _write_line(self, out, record):
+        out.write(json.dumps(record))
+        out.write('\n')
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as in_:
+                for line in in_:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line truncated by a crash
+                        continue
+                    if 'marker' in record:
+                        self.marker = record['marker']
+                        for key in record.get('covered', ()):
+                            self.results.pop(key, None)
+                        for key in record.get('failed', ()):
+                            self.results.pop(key, None)
+                            self.failed.add(key)
+                    elif record['chunk'] in self.failed:
+                        if record['status'] == 'ok':
+                            self.failed.discard(record['chunk'])
+                    else:
+                        self.results[record['chunk']] = record['status']
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        # Compact the checkpoint, dropping the results before the marker
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as out:
+            if self.marker:
+                self._write_line(out, {'marker': self.marker,
+                                       'failed': sorted(self.failed)})
+            for key, status in self.results.iteritems():
+                self._write_line(out, {'chunk': key, 'status': status})
+            out.flush()
+            os.fsync(out.fileno())
+        os.rename(tmp_path, self.path)
+
+    def is_done(self, key):
+        """Tell if the chunk `key` has been successfully processed."""
+        return self.results.get(key) == 'ok'
+
+    def start(self, key):
+        """Declare the chunk `key` is being processed."""
+        if key not in self.failed:
+            self._in_progress.append(key)
+
+    def finish(self, key, status):
+        """Save the result of the processing of the chunk `key`."""
+        self._write_line(self._file, {'chunk': key, 'status': status})
+        if key in self.failed:
+            # Processed again, after the marker went past it
+            if status == 'ok':
+                self.failed.discard(key)
+        else:
+            self.results[key] = status
+            self._finished.add(key)
+        covered = list()
+        failed = list()
+        while self._in_progress and self._in_progress[0] in self._finished:
+            marker = self._in_progress.popleft()
+            self._finished.discard(marker)
+            if self.results.pop(marker, None) == 'ok':
+                covered.append(marker)
+            else:
+                self.failed.add(marker)
+                failed.append(marker)
+            self.marker = marker
+        if covered or failed:
+            self._write_line(self._file, {'marker': self.marker,
+                                          'covered': covered,
+                                          'failed': failed})
+        now = time.time()
+        if now - self._last_sync >= self.sync_interval:
+            self.sync()
+            self._last_sync = now
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
 class BlobRebuilderWorker(object):
     def __init__(self, conf, logger, volume,
                  input_file=None, try_chunk_delete=False,
-                 beanstalkd_addr=None):
+                 beanstalkd_addr=None, checkpoint_file=None):
         self.conf = conf
         self.logger = logger or get_logger(conf)
         self.volume = volume
@@ -52,6 +178,10 @@ class BlobRebuilderWorker(object):
             conf.get('chunks_per_second'), 30)
         self.max_bytes_per_second = int_value(
             conf.get('bytes_per_second'), 10000000)
+        self.max_rawx_chunks_per_second = int_value(
+            conf.get('rawx_chunks_per_second'), 0)
+        self.concurrency = int_value(
+            conf.get('concurrency'), 10)
         self.rdir_fetch_limit = int_value(
             conf.get('rdir_fetch_limit'), 100)
         self.allow_same_rawx = true_value(
@@ -62,6 +192,11 @@ class BlobRebuilderWorker(object):
         self.try_chunk_delete = try_chunk_delete
         self.beanstalkd_addr = beanstalkd_addr
         self.beanstalkd_tube = conf.get('beanstalkd_tube', 'rebuild')
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint = None
+        self.pool = GreenPool(self.concurrency)
+        # rawx address -> earliest time of the next operation on it
+        self._rawx_next_time = dict()
 
     def _fetch_chunks_from_event(self, job_id, data):
         env = json.loads(data)
@@ -81,6 +216,8 @@ class BlobRebuilderWorker(object):
         try:
             for chunk in self._fetch_chunks_from_event(job_id, data):
                 yield chunk
+            # Delete the job only once its chunks have been processed
+            self.pool.waitall()
             self.beanstalk.delete(job_id)
         except Exception:
             self.logger.exception("handling event %s (bury)", job_id)
@@ -95,22 +232,28 @@ class BlobRebuilderWorker(object):
             for chunk in self._handle_beanstalk_event(conn_error):
                 yield chunk
 
-    def _fetch_chunks_from_file(self):
+    def _fetch_chunks_from_file(self, start_after=None):
         with open(self.input_file, 'r') as ifile:
             for line in ifile:
                 stripped = line.strip()
                 if stripped and not stripped.startswith('#'):
-                    yield stripped.split('|', 3)[:3] + [None]
+                    chunk = stripped.split('|', 3)[:3]
+                    if start_after:
+                        if _chunk_key(*chunk) == start_after:
+                            start_after = None
+                        continue
+                    yield chunk + [None]
 
-    def _fetch_chunks(self):
+    def _fetch_chunks(self, start_after=None):
         if self.input_file:
-            return self._fetch_chunks_from_file()
+            return self._fetch_chunks_from_file(start_after=start_after)
         elif self.beanstalkd_addr:
             return self._fetch_chunks_from_beanstalk()
         else:
             return self.rdir_client.chunk_fetch(self.volume,
                                                 limit=self.rdir_fetch_limit,
-                                                rebuild=True)
+                                                rebuild=True,
+                                                start_after=start_after)
 
     def rebuilder_pass_with_lock(self):
         self.rdir_client.admin_lock(self.volume,
@@ -120,24 +263,108 @@ class BlobRebuilderWorker(object):
         finally:
             self.rdir_client.admin_unlock(self.volume)
 
+    def _open_checkpoint(self):
+        if not self.checkpoint_file:
+            return None
+        if self.beanstalkd_addr:
+            self.logger.warn('Checkpoint ignored with beanstalkd input')
+            return None
+        checkpoint = RebuildCheckpoint(self.checkpoint_file)
+        if checkpoint.marker or checkpoint.results:
+            self.logger.info(
+                'Resuming rebuild after %s (%d chunks already processed, '
+                '%d failed chunks to retry)',
+                checkpoint.marker, len(checkpoint.results),
+                len(checkpoint.failed))
+        return checkpoint
+
+    def _fetch_failed_chunks(self):
+        """Yield the chunks that failed before the marker of the checkpoint."""
+        for key in sorted(self.checkpoint.failed):
+            yield key.split('|', 2) + [None]
+
+    def _group_by_content(self, chunks):
+        """
+        Group the consecutive chunks of a same content, so the lost
+        chunks of an erasure coded metachunk are rebuilt together.
+        """
+        if self.beanstalkd_addr:
+            # The chunks of an event must be processed before the event
+            # is deleted, they cannot wait for the next event.
+            for container_id, content_id, chunk_id, _ in chunks:
+                yield container_id, content_id, [chunk_id]
+            return
+        group = None
+        for container_id, content_id, chunk_id, _ in chunks:
+            if group and group[:2] == (container_id, content_id):
+                group[2].append(chunk_id)
+                continue
+            if group:
+                yield group
+            group = (container_id, content_id, [chunk_id])
+        if group:
+            yield group
+
+    def _process_chunks(self, container_id, content_id, chunk_ids):
+        keys = [_chunk_key(container_id, content_id, chunk_id)
+                for chunk_id in chunk_ids]
+        if self.checkpoint:
+            for key in keys:
+                self.checkpoint.start(key)
+        if self.dry_run:
+            for chunk_id in chunk_ids:
+                self.dryrun_chunk_rebuild(container_id, content_id, chunk_id)
+            results = [True] * len(chunk_ids)
+        elif len(chunk_ids) > 1:
+            results = self.safe_chunks_rebuild(container_id, content_id,
+                                               chunk_ids)
+        else:
+            results = [self.safe_chunk_rebuild(container_id, content_id,
+                                               chunk_ids[0])]
+        if self.checkpoint:
+            for key, success in zip(keys, results):
+                self.checkpoint.finish(key, 'ok' if success else 'error')
+
     def rebuilder_pass(self):
-        start_time = report_time = time.time()
+        start_time = time.time()
+
+        self.checkpoint = self._open_checkpoint()
+        try:
+            rebuilder_time = self._rebuilder_loop(start_time)
+        finally:
+            self.pool.waitall()
+            if self.checkpoint:
+                self.checkpoint.close()
+                self.checkpoint = None
+        self._report_done(start_time, rebuilder_time)
 
+    def _rebuilder_loop(self, start_time):
+        report_time = start_time
         rebuilder_time = 0
 
-        chunks = self._fetch_chunks()
-        for container_id, content_id, chunk_id, _ in chunks:
+        marker = self.checkpoint.marker if self.checkpoint else None
+        chunks = self._fetch_chunks(start_after=marker)
+        if self.checkpoint and self.checkpoint.failed:
+            chunks = itertools.chain(self._fetch_failed_chunks(), chunks)
+        for container_id, content_id, chunk_ids in \
+                self._group_by_content(chunks):
             loop_time = time.time()
-            if self.dry_run:
-                self.dryrun_chunk_rebuild(container_id, content_id, chunk_id)
-            else:
-                self.safe_chunk_rebuild(container_id, content_id, chunk_id)
+            if self.checkpoint:
+                chunk_ids = [
+                    chunk_id for chunk_id in chunk_ids
+                    if not self.checkpoint.is_done(
+                        _chunk_key(container_id, content_id, chunk_id))]
+                if not chunk_ids:
+                    continue
+            self.pool.spawn_n(self._process_chunks,
+                              container_id, content_id, chunk_ids)
 
-            self.chunks_run_time = ratelimit(
-                self.chunks_run_time,
-                self.max_chunks_per_second
-            )
-            self.total_chunks_processed += 1
+            for _ in chunk_ids:
+                self.chunks_run_time = ratelimit(
+                    self.chunks_run_time,
+                    self.max_chunks_per_second
+                )
+            self.total_chunks_processed += len(chunk_ids)
             now = time.time()
 
             if now - self.last_reported >= self.report_interval:
@@ -171,6 +398,9 @@ class BlobRebuilderWorker(object):
                 self.bytes_processed = 0
                 self.last_reported = now
             rebuilder_time += (now - loop_time)
+        return rebuilder_time
+
+    def _report_done(self, start_time, rebuilder_time):
         end_time = time.time()
         elapsed = (end_time - start_time) or 0.000001
         self.logger.info(
@@ -210,56 +440,159 @@ class BlobRebuilderWorker(object):
         self.passes += 1
 
     def safe_chunk_rebuild(self, container_id, content_id, chunk_id):
+        """
+        Rebuild a chunk, logging the errors.
+
+        :returns: True if the chunk has been rebuilt
+        """
+        success = True
         try:
             self.chunk_rebuild(container_id, content_id, chunk_id)
         except Exception as e:
+            success = False
             self.errors += 1
             self.logger.error('ERROR while rebuilding chunk %s|%s|%s): %s',
                               container_id, content_id, chunk_id, e)
 
         self.passes += 1
+        return success
 
-    def chunk_rebuild(self, container_id, content_id, chunk_id):
-        self.logger.info('Rebuilding (container %s, content %s, chunk %s)',
-                         container_id, content_id, chunk_id)
+    def safe_chunks_rebuild(self, container_id, content_id, chunk_ids):
+        """
+        Rebuild several chunks of a same content, logging the errors.
+        The chunks of an erasure coded content are rebuilt together,
+        the replicated chunks one by one.
+
+        :returns: a list telling, for each chunk, if it has been rebuilt
+        """
+        try:
+            content = self._get_content(container_id, content_id)
+        except Exception:
+            # let the chunks be rebuilt (or fail) one by one
+            content = None
+        if content is None or not content.storage_method.ec:
+            return [self.safe_chunk_rebuild(container_id, content_id,
+                                            chunk_id)
+                    for chunk_id in chunk_ids]
+
+        success = True
+        try:
+            self.chunks_rebuild(content, chunk_ids)
+        except Exception as e:
+            success = False
+            self.errors += len(chunk_ids)
+            self.logger.error('ERROR while rebuilding chunks %s|%s|%s): %s',
+                              container_id, content_id, ','.join(chunk_ids),
+                              e)
+
+        self.passes += len(chunk_ids)
+        return [success] * len(chunk_ids)
+
+    def _throttle_rawx(self, hosts):
+        """
+        Wait until an operation is allowed on each of the rawx services
+        in `hosts`, according to the per-rawx rate limit.
+        """
+        if self.max_rawx_chunks_per_second <= 0:
+            return
+        now = time.time()
+        interval = 1.0 / self.max_rawx_chunks_per_second
+        delay = 0
+        for host in set(hosts):
+            # Book a slot on the rawx before sleeping, so the concurrent
+            # rebuilds get the next slots
+            next_time = max(self._rawx_next_time.get(host, 0), now)
+            self._rawx_next_time[host] = next_time + interval
+            delay = max(delay, next_time - now)
+        if delay > 0:
+            sleep(delay)
+
+    def _throttle_spare_chunks(self, spare_urls):
+        """Throttle the rawx services selected to host rebuilt chunks."""
+        self._throttle_rawx(urlparse(url).netloc for url in spare_urls)
+
+    def _get_content(self, container_id, content_id):
         try:
             content = self.content_factory.get(container_id, content_id)
         except ContentNotFound:
             raise OrphanChunk('Content not found: possible orphan chunk')
+        return content
+
+    def _get_lost_chunk(self, content, chunk_id):
+        chunk = content.chunks.filter(id=chunk_id).one()
+        if chunk is None:
+            raise OrphanChunk(("Chunk not found in content:"
+                              "possible orphan chunk"))
+        elif self.volume and chunk.host != self.volume:
+            raise ValueError("Chunk does not belong to this volume")
+        return chunk
+
+    def _chunk_rebuilt(self, content, chunk):
+        if self.try_chunk_delete:
+            try:
+                content.blob_client.chunk_delete(chunk.url)
+                self.logger.info("Chunk %s deleted", chunk.url)
+            except NotFound as exc:
+                self.logger.debug("Chunk %s: %s", chunk.url, exc)
 
-        chunk_size = 0
+        # This call does not raise exception if chunk is not referenced
+        self.rdir_client.chunk_delete(chunk.host, content.container_id,
+                                      content.content_id, chunk.id)
+
+        self.bytes_processed += chunk.size
+        self.total_bytes_processed += chunk.size
+
+    def chunk_rebuild(self, container_id, content_id, chunk_id):
+        self.logger.info('Rebuilding (container %s, content %s, chunk %s)',
+                         container_id, content_id, chunk_id)
+        content = self._get_content(container_id, content_id)
+
+        chunk = None
         chunk_pos = None
         if len(chunk_id) < 32:
             chunk_pos = chunk_id
             chunk_id = None
             metapos = int(chunk_pos.split('.', 1)[0])
-            chunk_size = content.chunks.filter(metapos=metapos).all()[0].size
+            sources = content.chunks.filter(metapos=metapos).all()
+            chunk_size = sources[0].size
         else:
             if '/' in chunk_id:
                 chunk_id = chunk_id.rsplit('/', 1)[-1]
+            chunk = self._get_lost_chunk(content, chunk_id)
+            sources = content.chunks.filter(
+                metapos=chunk.metapos).exclude(id=chunk_id).all()
 
-            chunk = content.chunks.filter(id=chunk_id).one()
-            if chunk is None:
-                raise OrphanChunk(("Chunk not found in content:"
-                                  "possible orphan chunk"))
-            elif self.volume and chunk.host != self.volume:
-                raise ValueError("Chunk does not belong to this volume")
-            chunk_size = chunk.size
-
+        self._throttle_rawx(c.host for c in sources)
         content.rebuild_chunk(chunk_id, allow_same_rawx=self.allow_same_rawx,
-                              chunk_pos=chunk_pos)
+                              chunk_pos=chunk_pos,
+                              throttle=self._throttle_spare_chunks)
 
-        if self.try_chunk_delete:
-            try:
-                content.blob_client.chunk_delete(chunk.url)
-                self.logger.info("Chunk %s deleted", chunk.url)
-            except NotFound as exc:
-                self.logger.debug("Chunk %s: %s", chunk.url, exc)
+        if chunk is not None:
+            self._chunk_rebuilt(content, chunk)
+        else:
+            self.bytes_processed += chunk_size
+            self.total_bytes_processed += chunk_size
 
-        # This call does not raise exception if chunk is not referenced
-        if chunk_pos is None:
-            self.rdir_client.chunk_delete(chunk.host, container_id,
-                                          content_id, chunk_id)
+    def chunks_rebuild(self, content, chunk_ids):
+        """
+        Rebuild several chunks of an erasure coded `content`. The lost
+        chunks of a metachunk are rebuilt from a single read of the
+        remaining ones.
+        """
+        self.logger.info('Rebuilding (container %s, content %s, chunks %s)',
+                         content.container_id, content.content_id,
+                         ','.join(chunk_ids))
+        chunks = [self._get_lost_chunk(content, chunk_id.rsplit('/', 1)[-1])
+                  for chunk_id in chunk_ids]
+
+        lost_ids = set(c.id for c in chunks)
+        metaposes = set(c.metapos for c in chunks)
+        self._throttle_rawx(c.host for c in content.chunks
+                            if c.metapos in metaposes
+                            and c.id not in lost_ids)
+        content.rebuild_chunks([c.id for c in chunks],
+                               allow_same_rawx=self.allow_same_rawx,
+                               throttle=self._throttle_spare_chunks)
 
-        self.bytes_processed += chunk_size
-        self.total_bytes_processed += chunk_size
+        for chunk in chunks:
+            self._chunk_rebuilt(content, chunk)
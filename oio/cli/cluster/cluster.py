@@ -243,7 +243,8 @@ class ClusterWait(lister.Lister):
         while True:
             all_descr = []
             for type_ in types:
-                tmp = self.app.client_manager.cluster.all_services(type_)
+                tmp = self.app.client_manager.cluster.all_services(
+                    type_, use_cache=False)
                 for s in tmp:
                     s['type'] = type_
                 all_descr += tmp
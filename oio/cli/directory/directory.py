@@ -149,11 +149,44 @@ class DirectoryList(DirectoryCmd):
 class DirectoryRebalance(DirectoryCmd):
     """Rebalance the container prefixes."""
 
+    def get_parser(self, prog_name):
+        parser = super(DirectoryRebalance, self).get_parser(prog_name)
+        parser.add_argument(
+            '--tolerance', metavar='<RATIO>', type=float, default=0.0,
+            help=("Accepted relative gap between the number of bases "
+                  "of a service and its target (0.0 by default)"))
+        parser.add_argument(
+            '--weighted', action='store_true',
+            help="Use the score of the services as their weight")
+        parser.add_argument(
+            '--drain', action='store_true',
+            help=("Move all the bases of the services whose score is "
+                  "zero (by default they keep their bases)"))
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help=("Only display the number of moves and the resulting "
+                  "imbalance, do not change the mapping"))
+        return parser
+
     def take_action(self, parsed_args):
         self.log.debug('take_action(%s)', parsed_args)
         mapping = self.get_prefix_mapping(parsed_args)
         mapping.load(read_timeout=parsed_args.meta0_timeout)
-        moved = mapping.rebalance()
+        if parsed_args.dry_run:
+            plan = mapping.compute_rebalance(
+                tolerance=parsed_args.tolerance,
+                weighted=parsed_args.weighted,
+                drain=parsed_args.drain)
+            print "Moves: %d (%d bases)" % (
+                len(plan['moves']),
+                len({move[0] for move in plan['moves']}))
+            print "Imbalance: %.2f%% -> %.2f%%" % (
+                plan['imbalance_before'] * 100.0,
+                plan['imbalance_after'] * 100.0)
+            return
+        moved = mapping.rebalance(tolerance=parsed_args.tolerance,
+                                  weighted=parsed_args.weighted,
+                                  drain=parsed_args.drain)
         mapping.apply(moved, read_timeout=parsed_args.meta0_timeout)
         self.log.info("Moved %s", moved)
 
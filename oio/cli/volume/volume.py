@@ -208,6 +208,12 @@ class BootstrapVolume(lister.Lister):
             metavar='<N>',
             type=int,
             help="Maximum number of databases per rdir service")
+        parser.add_argument(
+            '--min-dist',
+            metavar='<N>',
+            type=int,
+            help=("Minimum distance between the location of a rawx "
+                  "service and the location of its rdir service"))
         return parser
 
     def take_action(self, parsed_args):
@@ -217,7 +223,7 @@ class BootstrapVolume(lister.Lister):
 
         try:
             all_rawx = self.app.client_manager.volume.rdir_lb.assign_all_rawx(
-                    parsed_args.max_per_rdir)
+                    parsed_args.max_per_rdir, min_dist=parsed_args.min_dist)
         except ClientException as exc:
             if exc.status != 481:
                 raise
@@ -0,0 +1,86 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import time
+from collections import OrderedDict
+
+
+class LruTtlCache(object):
+    """
+    Bounded cache, evicting the least recently used entries,
+    whose entries expire after a time-to-live.
+
+    Cache hits, misses and evictions are counted in `hits`, `misses`
+    and `evictions`.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.time()
+
+    def get(self, key, default=None):
+        """
+        Get the value cached for `key`, or `default`
+        if there is no such value or if it has expired.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return default
+        # move the entry to the most recently used position
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Cache `value` for `key`, during `ttl` seconds
+        (or the default time-to-live of the cache).
+        Nothing is cached if the time-to-live is not positive.
+        """
+        self._entries.pop(key, None)
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, time.time() + ttl)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Forget the value cached for `key`, if any."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Get the counters of the cache, as a dictionary."""
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
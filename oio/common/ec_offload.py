@@ -0,0 +1,264 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+"""
+Run erasure-code computations out of the eventlet hub.
+
+By default, segments are encoded and decoded inline, which blocks
+every green thread of the process during the computation.
+The 'thread' mode runs the computations in native threads,
+the 'process' mode dispatches batches of segments to a pool of
+worker processes, each one owning its own `ECDriver`.
+"""
+
+import multiprocessing
+from eventlet import GreenPile, tpool
+from eventlet.hubs import trampoline
+from eventlet.queue import LightQueue
+from oio.common.exceptions import ConfigurationException
+
+
+EC_OFFLOAD_INLINE = 'inline'
+EC_OFFLOAD_THREAD = 'thread'
+EC_OFFLOAD_PROCESS = 'process'
+EC_OFFLOAD_MODES = (EC_OFFLOAD_INLINE, EC_OFFLOAD_THREAD, EC_OFFLOAD_PROCESS)
+
+# Maximum number of segments sent to a worker in one dispatch
+DEFAULT_EC_OFFLOAD_BATCH = 4
+
+_conf = {'mode': EC_OFFLOAD_INLINE,
+         'workers': None,
+         'batch': DEFAULT_EC_OFFLOAD_BATCH}
+_executors = {}
+
+
+def configure(mode=EC_OFFLOAD_INLINE, workers=None,
+              batch=DEFAULT_EC_OFFLOAD_BATCH):
+    """
+    Configure how erasure-code computations are run in this process.
+
+    :param mode: one of 'inline', 'thread' or 'process'
+    :param workers: number of native threads or worker processes,
+        defaults to the number of CPUs
+    :param batch: maximum number of segments per dispatch
+    """
+    if mode not in EC_OFFLOAD_MODES:
+        raise ConfigurationException(
+            'Invalid EC offload mode %r, expected one of %s' %
+            (mode, ', '.join(EC_OFFLOAD_MODES)))
+    try:
+        batch = int(batch)
+        workers = int(workers) if workers else None
+    except (TypeError, ValueError) as err:
+        raise ConfigurationException('Invalid EC offload setting: %s' % err)
+    if batch < 1:
+        raise ConfigurationException('EC offload batch must be positive')
+    shutdown()
+    _conf.update(mode=mode, workers=workers, batch=batch)
+    if mode == EC_OFFLOAD_THREAD and workers:
+        tpool.set_num_threads(workers)
+
+
+def shutdown():
+    """Stop the worker processes."""
+    for executor in _executors.values():
+        executor.close()
+    _executors.clear()
+
+
+def batch_size():
+    """Number of segments worth gathering before encoding or decoding."""
+    if _conf['mode'] == EC_OFFLOAD_INLINE:
+        return 1
+    return _conf['batch']
+
+
+def get_executor(storage_method):
+    """
+    Get the executor for the EC parameters of `storage_method`,
+    according to the current configuration.
+    """
+    mode = _conf['mode']
+    key = (mode, storage_method.ec_type,
+           storage_method.ec_nb_data, storage_method.ec_nb_parity)
+    executor = _executors.get(key)
+    if executor is None:
+        if mode == EC_OFFLOAD_PROCESS:
+            executor = ProcessExecutor(storage_method, _conf['workers'],
+                                       _conf['batch'])
+        elif mode == EC_OFFLOAD_THREAD:
+            executor = ThreadExecutor(storage_method.driver)
+        else:
+            executor = InlineExecutor(storage_method.driver)
+        _executors[key] = executor
+    return executor
+
+
+class InlineExecutor(object):
+    """Run the computations in the calling green thread."""
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def encode(self, segments):
+        """
+        :returns: the list of fragments of each segment, in order
+        """
+        return [self.driver.encode(segment) for segment in segments]
+
+    def decode(self, fragment_sets):
+        """
+        :returns: the segment decoded from each set of fragments, in order
+        """
+        return [self.driver.decode(fragments) for fragments in fragment_sets]
+
+    def close(self):
+        pass
+
+
+class ThreadExecutor(InlineExecutor):
+    """Run the computations in the native thread pool of eventlet."""
+
+    def encode(self, segments):
+        return tpool.execute(super(ThreadExecutor, self).encode, segments)
+
+    def decode(self, fragment_sets):
+        return tpool.execute(super(ThreadExecutor, self).decode,
+                             fragment_sets)
+
+
+def _worker_loop(requests, results, ec_nb_data, ec_nb_parity, ec_type):
+    """
+    Main loop of a worker process: run the functions received on
+    `requests`, send their result (or error) on `results`.
+    Only blocking calls are made here, never green ones.
+    """
+    from pyeclib.ec_iface import ECDriver
+    driver = ECDriver(k=ec_nb_data, m=ec_nb_parity, ec_type=ec_type)
+    while True:
+        try:
+            request = requests.recv()
+        except (EOFError, IOError):
+            break
+        if request is None:
+            break
+        method, items = request
+        try:
+            results.send((True, [getattr(driver, method)(item)
+                                 for item in items]))
+        except Exception as exc:
+            results.send((False, exc))
+
+
+class _Worker(object):
+    """A worker process and the pipes to talk to it."""
+
+    def __init__(self, ec_params):
+        # One-way pipes are plain OS pipes: unlike socket pairs,
+        # they are not made non-blocking by eventlet's monkey patching.
+        req_recv, self.requests = multiprocessing.Pipe(duplex=False)
+        self.results, res_send = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=_worker_loop, args=(req_recv, res_send) + ec_params)
+        self.process.daemon = True
+        self.process.start()
+        req_recv.close()
+        res_send.close()
+
+    def call(self, method, items):
+        """
+        :returns: a tuple telling if the call succeeded,
+            and its result or exception
+        """
+        self.requests.send((method, items))
+        # Wait for the result without blocking the other green threads
+        trampoline(self.results.fileno(), read=True)
+        return self.results.recv()
+
+    def close(self, graceful=True):
+        if graceful:
+            try:
+                self.requests.send(None)
+            except (IOError, OSError):
+                pass
+            self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.requests.close()
+        self.results.close()
+
+
+class ProcessExecutor(object):
+    """
+    Run the computations in a pool of worker processes.
+
+    The segments are split in batches, dispatched to the workers,
+    and the results are delivered in the order of the segments.
+    The workers are waited for through their pipes, from the hub,
+    so this works whether or not eventlet has monkey-patched
+    the standard library.
+    """
+
+    def __init__(self, storage_method, workers=None,
+                 batch=DEFAULT_EC_OFFLOAD_BATCH):
+        from oio.common.storage_method import ec_type_to_pyeclib_type
+        self.batch = batch
+        self.ec_params = (storage_method.ec_nb_data,
+                          storage_method.ec_nb_parity,
+                          ec_type_to_pyeclib_type[storage_method.ec_type])
+        workers = workers or multiprocessing.cpu_count()
+        self.workers = [_Worker(self.ec_params) for _j in range(workers)]
+        self.idle = LightQueue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def _call(self, method, items):
+        worker = self.idle.get()
+        done = False
+        try:
+            success, result = worker.call(method, items)
+            done = True
+        finally:
+            if not done:
+                # Interrupted or dead: the worker may still send
+                # a result we would read later, replace it.
+                self.workers.remove(worker)
+                worker.close(graceful=False)
+                worker = _Worker(self.ec_params)
+                self.workers.append(worker)
+            self.idle.put(worker)
+        if not success:
+            raise result
+        return result
+
+    def _run(self, method, items):
+        if not items:
+            return []
+        pile = GreenPile(len(self.workers))
+        for i in range(0, len(items), self.batch):
+            pile.spawn(self._call, method, items[i:i + self.batch])
+        return [res for batch in pile for res in batch]
+
+    def encode(self, segments):
+        return self._run('encode', segments)
+
+    def decode(self, fragment_sets):
+        return self._run('decode', fragment_sets)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
@@ -28,6 +28,11 @@ _ext_pattern = re.compile(
 
 
 def parse_content_type(raw_content_type):
+    """
+    Split a Content-Type header into the actual content type
+    and a list of (key, value) parameters.
+    """
+    content_type = raw_content_type
     param_list = []
     if raw_content_type:
         if ';' in raw_content_type:
@@ -37,7 +42,8 @@ def parse_content_type(raw_content_type):
                 k = p[0].strip()
                 v = p[1].strip()
                 param_list.append((k, v))
-    return raw_content_type, param_list
+        content_type = content_type.strip()
+    return content_type, param_list
 
 
 _content_range_pattern = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
@@ -15,10 +15,29 @@
 
 import logging
 import socket
+import time
+from collections import deque
 
 from urllib import quote
+from eventlet import patcher, Timeout
 from eventlet.green.httplib import HTTPConnection, HTTPResponse, _UNKNOWN, \
-        CONTINUE, HTTPMessage
+        CONTINUE, HTTPMessage, BadStatusLine
+
+
+# Maximum number of idle connections kept per host
+DEFAULT_POOL_MAXIDLE = 32
+# Idle connections older than this (in seconds) are closed.
+# Must stay below the keep-alive timeout of the services.
+DEFAULT_POOL_IDLE_TIMEOUT = 3.0
+# Maximum size of a response body we accept to read
+# in order to recycle a connection
+MAX_DRAIN_SIZE = 4096
+# Maximum time (in seconds) spent reading the rest of a response body
+# in order to recycle a connection
+DRAIN_TIMEOUT = 0.1
+
+# Health checks must not yield to the hub, even in monkey-patched processes
+_select = patcher.original('select')
 
 
 class CustomHTTPResponse(HTTPResponse):
@@ -75,6 +94,16 @@ class CustomHTTPResponse(HTTPResponse):
 class CustomHttpConnection(HTTPConnection):
     response_class = CustomHTTPResponse
 
+    def __init__(self, *args, **kwargs):
+        HTTPConnection.__init__(self, *args, **kwargs)
+        # pool this connection will be released to when closed
+        self.pool = None
+        self.reused = False
+        self._last_response = None
+        # (method, path, headers) of the current request,
+        # if it can be sent again (no body sent)
+        self._request = None
+
     def connect(self):
         r = HTTPConnection.connect(self)
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -83,26 +112,191 @@ class CustomHttpConnection(HTTPConnection):
     def putrequest(self, method, url, skip_host=0, skip_accept_encoding=0):
         self._method = method
         self._path = url
+        self._last_response = None
+        self._request = None
         return HTTPConnection.putrequest(self, method, url, skip_host,
                                          skip_accept_encoding)
 
+    def send(self, data):
+        # Once a body has been sent, the request cannot be sent again
+        self._request = None
+        return HTTPConnection.send(self, data)
+
     def getresponse(self):
-        response = HTTPConnection.getresponse(self)
+        try:
+            response = HTTPConnection.getresponse(self)
+        except BadStatusLine:
+            request = self._request
+            if not self.reused or request is None:
+                raise
+            # The peer closed the pooled connection before answering,
+            # send the request again, once, on a new connection.
+            HTTPConnection.close(self)
+            self.reused = False
+            if self.pool is not None:
+                self.pool.stats['unhealthy'] += 1
+                self.pool.stats['created'] += 1
+            _send_request(self, *request)
+            response = HTTPConnection.getresponse(self)
+        self._last_response = response
         logging.debug('HTTP %s %s:%s %s',
                       self._method, self.host, self.port, self._path)
         return response
 
+    def reusable(self):
+        """
+        Tell if the connection can be used to send another request,
+        reading the remaining bytes of a small response body if required
+        (within `DRAIN_TIMEOUT` seconds).
+        """
+        resp = self._last_response
+        if self.sock is None or resp is None or resp.will_close:
+            return False
+        if not resp.isclosed():
+            if resp.chunked or resp.length is None or \
+                    resp.length > MAX_DRAIN_SIZE:
+                return False
+            try:
+                # A silent timeout: the body is left unread
+                with Timeout(DRAIN_TIMEOUT, False):
+                    resp.read()
+            except Exception:
+                return False
+        return resp.isclosed()
 
-def http_connect(host, method, path, headers=None, query_string=None):
-    if isinstance(path, unicode):
+    def close(self):
+        """
+        Release the connection to its pool if it can be reused,
+        close it otherwise.
+        """
+        pool, self.pool = self.pool, None
+        if pool is not None and self.reusable():
+            pool.put(self)
+        else:
+            HTTPConnection.close(self)
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of keep-alive connections to a single host.
+
+    Connections are checked out by `get()` and given back by `put()`
+    (which is called by `CustomHttpConnection.close()`).
+    Checking out and releasing never yields to the hub,
+    thus the pool is safe to share between green threads.
+    """
+
+    def __init__(self, host, max_idle=DEFAULT_POOL_MAXIDLE,
+                 idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT,
+                 connection_class=CustomHttpConnection):
+        """
+        :param host: the "ip:port" string of the service
+        :param max_idle: maximum number of idle connections to keep
+        :param idle_timeout: close connections idle for longer than this
+        """
+        self.host = host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connection_class = connection_class
+        # (last use, connection), most recently used on the right
+        self._idle = deque()
+        self.stats = {'created': 0, 'reused': 0, 'released': 0,
+                      'evicted': 0, 'unhealthy': 0}
+
+    def __len__(self):
+        return len(self._idle)
+
+    @staticmethod
+    def _is_healthy(conn):
+        """
+        An idle connection must not be readable: if it is,
+        the peer either closed it or sent unexpected data.
+        """
         try:
-            path = path.encode('utf-8')
-        except UnicodeError as e:
-            logging.exception('ERROR encoding to UTF-8: %s', str(e))
-    path = quote('/' + path)
-    conn = CustomHttpConnection(host)
-    if query_string:
-        path += '?' + query_string
+            readable, _, _ = _select.select([conn.sock], [], [], 0)
+            return not readable
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        while self._idle and \
+                now - self._idle[0][0] > self.idle_timeout:
+            _, conn = self._idle.popleft()
+            self.stats['evicted'] += 1
+            HTTPConnection.close(conn)
+
+    def get(self):
+        """Get an idle healthy connection, or create a new one."""
+        self._evict_idle(time.time())
+        while self._idle:
+            _, conn = self._idle.pop()
+            if self._is_healthy(conn):
+                self.stats['reused'] += 1
+                conn.pool = self
+                conn.reused = True
+                return conn
+            self.stats['unhealthy'] += 1
+            HTTPConnection.close(conn)
+        return self.new_connection()
+
+    def new_connection(self):
+        """Create a new connection, bound to the pool."""
+        self.stats['created'] += 1
+        conn = self.connection_class(self.host)
+        conn.pool = self
+        return conn
+
+    def put(self, conn):
+        """Give back a connection which is ready to send a new request."""
+        now = time.time()
+        self._evict_idle(now)
+        if len(self._idle) >= self.max_idle:
+            self.stats['evicted'] += 1
+            HTTPConnection.close(conn)
+            return
+        self.stats['released'] += 1
+        self._idle.append((now, conn))
+
+    def clear(self):
+        """Close all idle connections."""
+        while self._idle:
+            _, conn = self._idle.pop()
+            HTTPConnection.close(conn)
+
+
+class ConnectionPoolManager(object):
+    """
+    Manage one `ConnectionPool` per host.
+    """
+
+    def __init__(self, max_idle=DEFAULT_POOL_MAXIDLE,
+                 idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.pools = dict()
+
+    def get_pool(self, host):
+        pool = self.pools.get(host)
+        if pool is None:
+            pool = ConnectionPool(host, max_idle=self.max_idle,
+                                  idle_timeout=self.idle_timeout)
+            self.pools[host] = pool
+        return pool
+
+    def get(self, host):
+        return self.get_pool(host).get()
+
+    def stats(self):
+        """Get the metrics of each pool, indexed by host."""
+        return {host: dict(pool.stats, idle=len(pool))
+                for host, pool in self.pools.iteritems()}
+
+    def clear(self):
+        for pool in self.pools.itervalues():
+            pool.clear()
+
+
+def _send_request(conn, method, path, headers):
     conn.path = path
     conn.putrequest(method, path)
     if headers:
@@ -113,4 +307,42 @@ def http_connect(host, method, path, headers=None, query_string=None):
             else:
                 conn.putheader(header, str(value))
     conn.endheaders()
+    # No body has been sent yet, the request can be replayed
+    conn._request = (method, path, headers)
+
+
+def http_connect(host, method, path, headers=None, query_string=None,
+                 pool_manager=None):
+    """
+    Open a connection to `host` and send the request line and headers.
+
+    :param pool_manager: if set, reuse an idle keep-alive connection
+        from this `ConnectionPoolManager` instead of opening a new one.
+        The connection is given back to the pool when closed.
+    """
+    if isinstance(path, unicode):
+        try:
+            path = path.encode('utf-8')
+        except UnicodeError as e:
+            logging.exception('ERROR encoding to UTF-8: %s', str(e))
+    path = quote('/' + path)
+    if query_string:
+        path += '?' + query_string
+    if pool_manager is None:
+        conn = CustomHttpConnection(host)
+        _send_request(conn, method, path, headers)
+        return conn
+
+    conn = pool_manager.get(host)
+    try:
+        _send_request(conn, method, path, headers)
+    except (socket.error, IOError):
+        if not conn.reused:
+            raise
+        # The peer closed the connection while it was idle,
+        # retry once with a new connection.
+        conn.pool = None
+        conn.close()
+        conn = pool_manager.get_pool(host).new_connection()
+        _send_request(conn, method, path, headers)
     return conn
@@ -15,15 +15,30 @@
 
 
 import random
+from collections import deque
 
+from eventlet import Timeout
+from eventlet.queue import Queue
 from oio.api.io import ChunkReader, READ_CHUNK_SIZE
 from oio.api.ec import ECChunkDownloadHandler
 from oio.common import exceptions as exc
+from oio.common import green
 from oio.common.constants import OBJECT_METADATA_PREFIX
 from oio.common.http import http_header_from_ranges
 from oio.common.decorators import ensure_headers
 
 
+# number of metachunks opened and read in advance by fetch functions
+READ_AHEAD = 1
+# maximum amount of data buffered for each metachunk read in advance
+READ_AHEAD_BUFFER = 8 * 1024 * 1024
+# ranges of a metachunk separated by at most this amount of bytes
+# are read as a single range
+RANGE_COALESCE_GAP = READ_CHUNK_SIZE
+# maximum number of ranges sent in one request
+MAX_RANGES_PER_REQUEST = 64
+
+
 def obj_range_to_meta_chunk_range(obj_start, obj_end, meta_sizes):
     """
     Convert a requested object range into a list of meta_chunk ranges.
@@ -95,6 +110,77 @@ def get_meta_ranges(ranges, chunks):
     return range_infos
 
 
+def group_meta_ranges(meta_range_list):
+    """
+    Group the metachunk ranges of successive object ranges,
+    so each group can be read with a single (multi-range) request.
+
+    :param meta_range_list: a list of dictionaries of metachunk ranges
+        indexed by metachunk positions, as returned by `get_meta_ranges`
+    :returns: a list of (position, ranges) tuples, in the order the data
+        must be returned. In each group, ranges are sorted and do not
+        overlap.
+    """
+    groups = []
+    for meta_range_dict in meta_range_list:
+        for pos in sorted(meta_range_dict.keys()):
+            meta_range = meta_range_dict[pos]
+            if groups and groups[-1][0] == pos:
+                ranges = groups[-1][1]
+                if meta_range[0] > ranges[-1][1] and \
+                        len(ranges) < MAX_RANGES_PER_REQUEST:
+                    ranges.append(meta_range)
+                    continue
+            groups.append((pos, [meta_range]))
+    return groups
+
+
+def coalesce_ranges(ranges, mergeable):
+    """
+    Merge sorted ranges.
+
+    :param mergeable: function telling, from the end of a range and
+        the start of the next one, if both ranges must be merged
+    """
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if mergeable(merged[-1][1], start):
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def extract_ranges(parts, ranges):
+    """
+    Extract the data of `ranges` from the parts of a response,
+    which may cover more data than requested.
+
+    :param parts: iterable of dicts with 'start' and 'iter' keys
+    :param ranges: sorted, non overlapping list of (start, end) tuples
+    """
+    ranges = deque(ranges)
+    want = ranges[0][0] if ranges else None
+    for part in parts:
+        offset = part['start']
+        for data in part['iter']:
+            end_offset = offset + len(data)
+            while ranges and want < end_offset:
+                if want < offset:
+                    raise exc.OioException(
+                        "Missing data at offset %d" % want)
+                stop = min(ranges[0][1] + 1, end_offset)
+                yield data[want - offset:stop - offset]
+                want = stop
+                if want > ranges[0][1]:
+                    ranges.popleft()
+                    if ranges:
+                        want = ranges[0][0]
+            offset = end_offset
+    if ranges:
+        raise exc.OioException("Missing data at offset %d" % want)
+
+
 def wrand_choice_index(scores):
     """Choose an element from the `scores` sequence and return its index"""
     scores = list(scores)
@@ -188,48 +274,158 @@ def _make_object_metadata(headers):
     return meta
 
 
+def _prefetch(open_stream, queue):
+    """
+    Read the data of a metachunk into `queue`, then put `None`
+    (or the exception that occurred).
+    """
+    stream = None
+    try:
+        stream = open_stream()
+        for data in stream:
+            queue.put(data)
+    except (Exception, Timeout) as err:
+        queue.put(err)
+    else:
+        queue.put(None)
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def _iter_read_ahead(openers, read_ahead, max_blocks):
+    """
+    Iterate over the data of successive metachunks, reading up to
+    `read_ahead` of the next metachunks in parallel.
+
+    :param openers: functions returning an iterator over
+        the data of each metachunk, in order
+    :param read_ahead: number of metachunks to read in advance
+    :param max_blocks: number of data blocks buffered per metachunk
+    """
+    if read_ahead <= 0:
+        for open_stream in openers:
+            stream = open_stream()
+            try:
+                for data in stream:
+                    yield data
+            finally:
+                stream.close()
+        return
+
+    openers = iter(openers)
+    queues = deque()
+    # closing the generator kills the prefetching coroutines
+    with green.ContextPool(read_ahead + 1) as pool:
+        while True:
+            while len(queues) <= read_ahead:
+                open_stream = next(openers, None)
+                if open_stream is None:
+                    break
+                queue = Queue(max_blocks)
+                pool.spawn(_prefetch, open_stream, queue)
+                queues.append(queue)
+            if not queues:
+                break
+            queue = queues.popleft()
+            while True:
+                data = queue.get()
+                if data is None:
+                    break
+                if isinstance(data, (Exception, Timeout)):
+                    raise data
+                yield data
+
+
+def _max_blocks(buffer_size, block_size):
+    return max(1, int(buffer_size) // block_size)
+
+
 @ensure_headers
 def fetch_stream(chunks, ranges, storage_method, headers=None,
+                 read_ahead=READ_AHEAD, read_ahead_buffer=READ_AHEAD_BUFFER,
                  **kwargs):
+    """
+    Download the data of a replicated object.
+
+    Successive ranges falling in the same metachunk are read
+    with a single multi-range request.
+
+    :keyword read_ahead: number of metachunks read in advance
+    :keyword read_ahead_buffer: maximum amount of data buffered
+        for each metachunk read in advance
+    """
     ranges = ranges or [(None, None)]
     meta_range_list = get_meta_ranges(ranges, chunks)
 
-    for meta_range_dict in meta_range_list:
-        for pos in sorted(meta_range_dict.keys()):
-            meta_start, meta_end = meta_range_dict[pos]
-            if meta_start is not None and meta_end is not None:
-                headers['Range'] = http_header_from_ranges(
-                    (meta_range_dict[pos], ))
-            reader = ChunkReader(
-                iter(chunks[pos]), READ_CHUNK_SIZE, headers=headers,
-                **kwargs)
-            try:
-                it = reader.get_iter()
-            except exc.NotFound as err:
-                raise exc.UnrecoverableContent(
-                    "Cannot download position %d: %s" %
-                    (pos, err))
-            except Exception as err:
-                raise exc.OioException(
-                    "Error while downloading position %d: %s" %
-                    (pos, err))
-            for part in it:
-                for dat in part['iter']:
-                    yield dat
+    def _mergeable(end, next_start):
+        return next_start - end - 1 <= RANGE_COALESCE_GAP
+
+    def _open(pos, meta_ranges):
+        reader_headers = headers.copy()
+        reader_headers['Range'] = http_header_from_ranges(
+            coalesce_ranges(meta_ranges, _mergeable))
+        reader = ChunkReader(
+            iter(chunks[pos]), READ_CHUNK_SIZE, headers=reader_headers,
+            **kwargs)
+        try:
+            it = reader.get_iter()
+        except exc.NotFound as err:
+            raise exc.UnrecoverableContent(
+                "Cannot download position %d: %s" %
+                (pos, err))
+        except Exception as err:
+            raise exc.OioException(
+                "Error while downloading position %d: %s" %
+                (pos, err))
+        try:
+            for dat in extract_ranges(it, meta_ranges):
+                yield dat
+        finally:
+            it.close()
+
+    openers = [lambda pos=pos, meta_ranges=meta_ranges:
+               _open(pos, meta_ranges)
+               for pos, meta_ranges in group_meta_ranges(meta_range_list)]
+    return _iter_read_ahead(
+        openers, read_ahead, _max_blocks(read_ahead_buffer, READ_CHUNK_SIZE))
 
 
 @ensure_headers
-def fetch_stream_ec(chunks, ranges, storage_method, **kwargs):
+def fetch_stream_ec(chunks, ranges, storage_method, read_ahead=READ_AHEAD,
+                    read_ahead_buffer=READ_AHEAD_BUFFER, **kwargs):
+    """
+    Download the data of an erasure coded object.
+
+    Successive ranges falling in the same metachunk are read
+    with a single multi-range request to each fragment,
+    and only the segments they touch are decoded.
+
+    :keyword read_ahead: number of metachunks read in advance
+    :keyword read_ahead_buffer: maximum amount of data buffered
+        for each metachunk read in advance
+    """
     ranges = ranges or [(None, None)]
     meta_range_list = get_meta_ranges(ranges, chunks)
-    for meta_range_dict in meta_range_list:
-        for pos in sorted(meta_range_dict.keys()):
-            meta_start, meta_end = meta_range_dict[pos]
-            handler = ECChunkDownloadHandler(
-                storage_method, chunks[pos],
-                meta_start, meta_end, **kwargs)
-            stream = handler.get_stream()
-            for part_info in stream:
-                for dat in part_info['iter']:
-                    yield dat
+    segment_size = storage_method.ec_segment_size
+
+    def _mergeable(end, next_start):
+        # ranges touching the same or adjacent segments
+        return next_start // segment_size <= end // segment_size + 1
+
+    def _open(pos, meta_ranges):
+        handler = ECChunkDownloadHandler(
+            storage_method, chunks[pos], None, None,
+            meta_ranges=coalesce_ranges(meta_ranges, _mergeable), **kwargs)
+        stream = handler.get_stream()
+        try:
+            for dat in extract_ranges(stream, meta_ranges):
+                yield dat
+        finally:
             stream.close()
+
+    openers = [lambda pos=pos, meta_ranges=meta_ranges:
+               _open(pos, meta_ranges)
+               for pos, meta_ranges in group_meta_ranges(meta_range_list)]
+    return _iter_read_ahead(
+        openers, read_ahead, _max_blocks(read_ahead_buffer, segment_size))
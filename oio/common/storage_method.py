@@ -15,6 +15,7 @@
 
 import sys
 from oio.common import exceptions
+from oio.common import ec_offload
 
 
 EC_SEGMENT_SIZE = 1048576
@@ -175,6 +176,22 @@ class ECStorageMethod(StorageMethod):
     def ec_segment_size(self):
         return self._ec_segment_size
 
+    def encode_segments(self, segments):
+        """
+        Encode several segments, possibly out of the eventlet hub.
+
+        :returns: the list of fragments of each segment
+        """
+        return ec_offload.get_executor(self).encode(segments)
+
+    def decode_segments(self, fragment_sets):
+        """
+        Decode several sets of fragments, possibly out of the eventlet hub.
+
+        :returns: the list of decoded segments
+        """
+        return ec_offload.get_executor(self).decode(fragment_sets)
+
     @property
     def ec_fragment_size(self):
         return self.driver.get_segment_info(
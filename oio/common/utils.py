@@ -15,15 +15,25 @@
 
 import os
 import grp
+import errno
 import pwd
 import fcntl
 from hashlib import sha256
 from random import getrandbits
 from io import RawIOBase
-from itertools import islice
 from codecs import getdecoder, getencoder
 from urllib import quote as _quote
 from oio.common.exceptions import OioException
+from oio.common.json import json
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # python-scandir, the backport of os.scandir()
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 try:
@@ -80,10 +90,104 @@ def drop_privileges(user):
     os.umask(0o22)
 
 
-def paths_gen(volume_path):
-    for root, dirs, files in os.walk(volume_path):
-        for name in files:
-            yield os.path.join(root, name)
+class _DirEntry(object):
+    """Minimal replacement of the entries yielded by `scandir`."""
+
+    __slots__ = ('name', 'path', '_is_dir')
+
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self._is_dir = None
+
+    def is_dir(self):
+        if self._is_dir is None:
+            self._is_dir = os.path.isdir(self.path)
+        return self._is_dir
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def _listdir_entries(path):
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+if scandir is None:
+    scandir = _listdir_entries
+
+
+def _load_walk_checkpoint(path):
+    try:
+        with open(path, 'r') as in_:
+            return json.load(in_)
+    except IOError as err:
+        if err.errno != errno.ENOENT:
+            raise
+    except ValueError:
+        # corrupted checkpoint, do a full walk
+        pass
+    return dict()
+
+
+def _save_walk_checkpoint(path, dirs):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        json.dump(dirs, out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.rename(tmp_path, path)
+
+
+def paths_gen(volume_path, checkpoint_path=None, commit=None):
+    """
+    Yield the path of each file under `volume_path`.
+
+    In incremental mode (when `checkpoint_path` is set), the modification
+    time and the subdirectories of each directory are saved at the end of
+    the walk, and the next walks do not list the directories unchanged
+    since then: their subdirectories are visited, but their files are
+    not yielded.
+
+    :param volume_path: root of the directory tree to walk
+    :param checkpoint_path: path of the file where the state of the
+        directories is persisted between two walks
+    :param commit: a function called at the end of the walk, telling
+        if the state of the directories can be saved (e.g. once every
+        file yielded has been successfully processed)
+    """
+    previous = dict()
+    if checkpoint_path:
+        previous = _load_walk_checkpoint(checkpoint_path)
+    current = dict()
+    stack = [volume_path]
+    while stack:
+        root = stack.pop()
+        if checkpoint_path:
+            try:
+                mtime = os.stat(root).st_mtime
+            except OSError:
+                continue
+            known = previous.get(root)
+            if known and known[0] == mtime:
+                current[root] = known
+                stack.extend(os.path.join(root, name) for name in known[1])
+                continue
+        subdirs = list()
+        try:
+            entries = scandir(root)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.name)
+                stack.append(entry.path)
+            else:
+                yield entry.path
+        if checkpoint_path:
+            current[root] = (mtime, subdirs)
+    if checkpoint_path and (commit is None or commit()):
+        _save_walk_checkpoint(checkpoint_path, current)
 
 
 def statfs(volume):
@@ -181,37 +285,95 @@ class GeneratorIO(RawIOBase):
     """
 
     def __init__(self, gen, sub_generator=True):
-        self.generator = self._wrap(gen)
+        self.generator = iter(gen)
         self._sub_gen = sub_generator
-
-    def _wrap(self, gen):
+        # part being read, and position of the next byte to read in it
+        self._part = ''
+        self._pos = 0
+        # element that could not be handled as a sequence of bytes
+        self._pending = None
+        self._eof = False
+
+    def _next_part(self):
         """
-        Wrap the provided generator so it yields bytes
-        instead of sequences of bytes
+        Load the next non-empty part of the generator.
+
+        :returns: False when the generator is exhausted
         """
-        for part in gen:
-            if part:
-                if self._sub_gen:
-                    try:
-                        for byte in part:
-                            yield byte
-                    except TypeError:
-                        # The yielded elements do not support iteration
-                        # thus we will disable it
-                        self._sub_gen = False
-                        yield part
-                else:
-                    yield part
+        if self._eof:
+            return False
+        try:
+            part = next(self.generator)
+        except StopIteration:
+            part = None
+        if not part:
+            # an empty part marks the end of the stream
+            self._eof = True
+            return False
+        if self._sub_gen and not isinstance(part, (str, bytearray)):
+            try:
+                part = ''.join(part)
+            except TypeError:
+                # The yielded elements do not support iteration
+                # thus we will disable it
+                self._sub_gen = False
+                self._pending = part
+                return False
+        self._part = part
+        self._pos = 0
+        return True
+
+    def _read_items(self, size):
+        """Read at most `size` elements of the generator, as they come."""
+        items = list()
+        if self._pending is not None:
+            items.append(self._pending)
+            self._pending = None
+        while (size is None or len(items) < size) and not self._eof:
+            try:
+                part = next(self.generator)
+            except StopIteration:
+                part = None
+            if not part:
+                self._eof = True
             else:
-                raise StopIteration
+                items.append(part)
+        return "".join(items)
 
     def readable(self):
         return True
 
     def read(self, size=None):
-        if size is not None:
-            return "".join(islice(self.generator, size))
-        return "".join(self.generator)
+        if size is not None and size < 0:
+            size = None
+        if not self._sub_gen:
+            return self._read_items(size)
+
+        parts = list()
+        while size is None or size > 0:
+            avail = len(self._part) - self._pos
+            if avail <= 0:
+                if not self._next_part():
+                    if not self._sub_gen:
+                        parts.append(self._read_items(size))
+                    break
+            elif size is None or size >= avail:
+                # serve the remaining of the part without copying
+                if self._pos:
+                    parts.append(self._part[self._pos:])
+                else:
+                    parts.append(self._part)
+                self._part = ''
+                self._pos = 0
+                if size is not None:
+                    size -= avail
+            else:
+                parts.append(self._part[self._pos:self._pos + size])
+                self._pos += size
+                size = 0
+        if len(parts) == 1:
+            return parts[0]
+        return "".join(parts)
 
     def readinto(self, b):  # pylint: disable=invalid-name
         read_len = len(b)
@@ -220,8 +382,23 @@ class GeneratorIO(RawIOBase):
         return len(read_data)
 
     def __iter__(self):
-        for chunk in self.generator:
-            yield chunk
+        if self._pending is not None or not self._sub_gen:
+            data = self._read_items(None)
+            if data:
+                yield data
+            return
+        while True:
+            if self._pos < len(self._part):
+                data = self._part[self._pos:]
+                self._part = ''
+                self._pos = 0
+                yield data
+            if not self._next_part():
+                break
+        if self._pending is not None:
+            data = self._read_items(None)
+            if data:
+                yield data
 
 
 def group_chunk_errors(chunk_err_iter):
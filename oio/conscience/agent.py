@@ -15,9 +15,12 @@
 
 import re
 import os
+import random
+from collections import OrderedDict
+from copy import deepcopy
 
 import pkg_resources
-from eventlet import GreenPool, sleep
+from eventlet import GreenPile, GreenPool, sleep
 
 from oio.common.daemon import Daemon
 from oio.common.http_urllib3 import get_pool_manager
@@ -26,7 +29,7 @@ from oio.common.configuration import parse_config, validate_service_conf
 from oio.common.logger import get_logger
 from oio.common.client import ProxyClient
 from oio.conscience.client import ConscienceClient
-from oio.common.exceptions import OioException
+from oio.common.exceptions import ClientException, OioException
 
 
 def load_modules(group_name):
@@ -37,10 +40,104 @@ def load_modules(group_name):
     return modules
 
 
+class ServiceRegistrar(object):
+    """
+    Collect the registrations of all the watchers of the agent,
+    and send them in batches, with one request per tick.
+    """
+
+    def __init__(self, conf, logger=None):
+        self.conf = conf
+        self.logger = logger or get_logger(conf)
+        self.interval = float_value(conf.get('register_interval'),
+                                    float_value(conf.get('check_interval'), 1))
+        # fraction of the interval by which ticks are randomly shifted
+        self.jitter = float_value(conf.get('register_jitter'), 0.2)
+        self.batch = true_value(conf.get('register_batch', True))
+        self.running = False
+        # (type, addr) -> latest service definition
+        self.pending = OrderedDict()
+        self.cs = ConscienceClient(self.conf, pool_manager=get_pool_manager(),
+                                   logger=self.logger)
+
+    def push(self, service_definition):
+        """Queue a registration, replacing the previous one if any."""
+        key = (service_definition['type'], service_definition['addr'])
+        self.pending.pop(key, None)
+        self.pending[key] = deepcopy(service_definition)
+
+    def _register_each(self, definitions):
+        """Register services one by one, return the number of failures."""
+        failures = 0
+        for definition in definitions:
+            try:
+                self.cs.register(definition['type'], definition,
+                                 retries=False)
+            except OioException as exc:
+                failures += 1
+                self.logger.warn("Failed to register service %s: %s",
+                                 definition['addr'], exc)
+        return failures
+
+    def flush(self):
+        """Send the pending registrations."""
+        if not self.pending:
+            return
+        definitions = self.pending.values()
+        self.pending = OrderedDict()
+        if not self.batch:
+            self._register_each(definitions)
+            return
+        try:
+            self.cs.register(None, definitions, retries=False)
+            return
+        except ClientException as exc:
+            if not 400 <= exc.http_status < 500:
+                self.logger.warn("Failed to register %d services: %s",
+                                 len(definitions), exc)
+                return
+            self.logger.warn("Batch of %d registrations rejected (%s), "
+                             "registering services one by one",
+                             len(definitions), exc)
+        except OioException as exc:
+            self.logger.warn("Failed to register %d services: %s",
+                             len(definitions), exc)
+            return
+        if not self._register_each(definitions):
+            # Each service is accepted alone, the proxy cannot
+            # handle batches: stop sending them.
+            self.logger.warn("Proxy does not accept batches of "
+                             "registrations, disabling them")
+            self.batch = False
+
+    def run(self):
+        self.running = True
+        # Start at a random time, so that the agents of
+        # a cluster do not all register at the same time.
+        sleep(random.uniform(0, self.interval))
+        while self.running:
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception("Failed to send registrations")
+            sleep(self.interval *
+                  random.uniform(1.0 - self.jitter, 1.0 + self.jitter))
+
+    def stop(self):
+        self.running = False
+        self.pending.clear()
+
+
 class ServiceWatcher(object):
-    def __init__(self, conf, service, **kwargs):
+    def __init__(self, conf, service, registrar=None, **kwargs):
+        """
+        :param registrar: if set, the `ServiceRegistrar` sending the
+            registrations of the service (otherwise, the watcher sends
+            its own registrations)
+        """
         self.conf = conf
         self.running = False
+        self.registrar = registrar
 
         for k in ['host', 'port', 'type']:
             if k not in service:
@@ -99,16 +196,21 @@ class ServiceWatcher(object):
             self.logger.info('watcher "%s" deregister service', self.name)
             try:
                 self.last_status = False
-                self.register()
+                self.register(batch=False)
             except Exception as e:
                 self.logger.warn('Failed to register service: %s', e)
         self.running = False
 
     def check(self):
-        status = True
-        for service_check in (x for x in self.service_checks if self.running):
-            if not service_check.service_status():
-                status = False
+        """Run all the checks concurrently, each within its timeout."""
+        checks = [x for x in self.service_checks if self.running]
+        pile = GreenPile(len(checks) or 1)
+        for service_check in checks:
+            pile.spawn(service_check.service_status)
+        status = all(list(pile))
+        for service_check in checks:
+            self.logger.debug('%s check took %.3fs',
+                              service_check.name, service_check.duration)
 
         if status != self.last_status:
             if status:
@@ -118,20 +220,39 @@ class ServiceWatcher(object):
             self.last_status = status
 
     def get_stats(self):
-        """Update service definition with all configured stats"""
+        """
+        Update service definition with all configured stats, fetched
+        concurrently. Stats which could not be fetched in time keep
+        their last known values, whose age is given by the
+        "stat.<type>.age" tag.
+        """
         if not self.last_status:
             return
-        for stat in (x for x in self.service_stats if self.running):
-            stats = stat.get_stats()
-            self.service_definition['tags'].update(stats)
+        stats = [x for x in self.service_stats if self.running]
+        pile = GreenPile(len(stats) or 1)
+        for stat in stats:
+            pile.spawn(stat.collect)
+        tags = self.service_definition['tags']
+        for stat, (values, age) in zip(stats, pile):
+            self.logger.debug('%s %s stats took %.3fs',
+                              self.name, stat.name, stat.duration)
+            tags.update(values)
+            age_key = 'stat.%s.age' % stat.name
+            if age:
+                tags[age_key] = age
+            else:
+                tags.pop(age_key, None)
 
-    def register(self):
+    def register(self, batch=True):
         # only accept a final zero/down-registration when exiting
         if not self.running and self.last_status:
             return
 
         # Use a boolean so we can easily convert it to a number in conscience
         self.service_definition['tags']['tag.up'] = self.last_status
+        if batch and self.registrar is not None:
+            self.registrar.push(self.service_definition)
+            return
         try:
             self.cs.register(self.service['type'], self.service_definition,
                              retries=False)
@@ -193,6 +314,7 @@ class ConscienceAgent(Daemon):
         self.running = True
         self.conf = conf
         self.logger = get_logger(conf)
+        self.registrar = ServiceRegistrar(self.conf, logger=self.logger)
         self.load_services()
         self.init_watchers(self.conf['services'])
 
@@ -203,7 +325,8 @@ class ConscienceAgent(Daemon):
         try:
             self.logger.info('conscience agent: starting')
 
-            pool = GreenPool(len(self.watchers))
+            pool = GreenPool(len(self.watchers) + 1)
+            pool.spawn(self.registrar.run)
             for watcher in self.watchers:
                 pool.spawn(watcher.start)
 
@@ -214,7 +337,8 @@ class ConscienceAgent(Daemon):
                     if w.failed:
                         self.watchers.remove(w)
                         self.logger.warn('restart watcher "%s"', w.name)
-                        new_w = ServiceWatcher(self.conf, w.service)
+                        new_w = ServiceWatcher(self.conf, w.service,
+                                               registrar=self.registrar)
                         self.watchers.append(new_w)
                         pool.spawn(new_w.start)
 
@@ -224,13 +348,16 @@ class ConscienceAgent(Daemon):
         finally:
             self.logger.warn('conscience agent: stopping')
             self.running = False
+            # Pending registrations would tell the services are up
+            self.registrar.stop()
             self.stop_watchers()
 
     def init_watchers(self, services):
         watchers = []
         for _name, conf in services.iteritems():
             try:
-                watchers.append(ServiceWatcher(self.conf, conf))
+                watchers.append(ServiceWatcher(self.conf, conf,
+                                               registrar=self.registrar))
             except Exception:
                 self.logger.exception("Failed to load configuration from %s",
                                       conf.get('cfgfile', 'main config file'))
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
 from eventlet import Timeout
 from oio.common.utils import RingBuffer
 from oio.common.easy_value import float_value
@@ -32,6 +34,8 @@ class BaseChecker(object):
         self.name = checker_conf.get('name')
         self.srv_type = agent.service['type']
         self.last_result = None
+        # Duration of the last check
+        self.duration = 0.0
         self.configure()
 
     def configure(self):
@@ -41,6 +45,7 @@ class BaseChecker(object):
     def service_status(self):
         """Do the check and set `last_result` accordingly"""
         result = False
+        start = time.time()
         try:
             with Timeout(self.timeout):
                 result = self.check()
@@ -48,6 +53,8 @@ class BaseChecker(object):
             self.logger.warn('check timed out')
         except Exception as e:
             self.logger.warn('check failed: %s', str(e.message))
+        finally:
+            self.duration = time.time() - start
 
         if self.last_result is None:
             self.last_result = result
@@ -13,11 +13,130 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.
 
+import logging
+import time
+from copy import deepcopy
+from functools import partial
+
+import eventlet
 from oio.common.client import ProxyClient
+from oio.common.easy_value import float_value
 from oio.common.exceptions import OioException
 from oio.common.json import json
 
 
+# How long (in seconds) service listings are served from the cache
+# without being refreshed (0 disables the cache)
+SERVICE_CACHE_TTL = 0.0
+# How long (in seconds) after expiration an outdated listing is served
+# while a fresh one is fetched in the background
+SERVICE_CACHE_MAX_STALE = 60.0
+
+
+def diff_services(old, new):
+    """
+    Compare two listings of services.
+
+    :returns: a tuple with the lists of services which appeared,
+        disappeared, and whose score changed
+    """
+    old_by_addr = {srv['addr']: srv for srv in old}
+    new_by_addr = {srv['addr']: srv for srv in new}
+    added = [srv for addr, srv in new_by_addr.iteritems()
+             if addr not in old_by_addr]
+    removed = [srv for addr, srv in old_by_addr.iteritems()
+               if addr not in new_by_addr]
+    changed = [srv for addr, srv in new_by_addr.iteritems()
+               if addr in old_by_addr and
+               srv.get('score') != old_by_addr[addr].get('score')]
+    return added, removed, changed
+
+
+class ServiceListCache(object):
+    """
+    Listings of services, shared by all the `ConscienceClient` instances
+    of the process.
+
+    A listing older than its time-to-live is still returned while a
+    background green thread fetches a new one, unless it has been
+    outdated for more than `max_stale` seconds.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        # key -> (services, fetch time)
+        self._entries = dict()
+        self._refreshing = set()
+        # key -> callbacks
+        self._watchers = dict()
+
+    def get(self, key, fetch, ttl, max_stale=SERVICE_CACHE_MAX_STALE):
+        """
+        Get the listing cached for `key`, calling `fetch()`
+        to get a new one when required.
+
+        :param key: a tuple whose second item is the service type
+        """
+        entry = self._entries.get(key)
+        age = time.time() - entry[1] if entry else None
+        if entry is None or age > ttl + max_stale:
+            return self._refresh(key, fetch)
+        if age > ttl and key not in self._refreshing:
+            self._refreshing.add(key)
+            eventlet.spawn_n(self._background_refresh, key, fetch)
+        return entry[0]
+
+    def _refresh(self, key, fetch):
+        services = fetch()
+        old = self._entries.get(key)
+        self._entries[key] = (services, time.time())
+        if old is not None:
+            self._notify(key, old[0], services)
+        return services
+
+    def _background_refresh(self, key, fetch):
+        try:
+            self._refresh(key, fetch)
+        except Exception as exc:
+            self.logger.warn("Failed to refresh the list of %s services: %s",
+                             key[1], exc)
+        finally:
+            self._refreshing.discard(key)
+
+    def _notify(self, key, old, new):
+        callbacks = self._watchers.get(key)
+        if not callbacks:
+            return
+        added, removed, changed = diff_services(old, new)
+        if not (added or removed or changed):
+            return
+        for callback in callbacks:
+            try:
+                callback(key[1], added, removed, changed)
+            except Exception:
+                self.logger.exception("Service watcher %r failed", callback)
+
+    def watch(self, key, callback):
+        """
+        Call `callback(type_, added, removed, changed)` each time a new
+        listing cached for `key` differs from the previous one.
+        Each variant of a listing (see `get`) is watched separately,
+        so a change is reported once.
+        """
+        self._watchers.setdefault(key, list()).append(callback)
+
+    def unwatch(self, key, callback):
+        callbacks = self._watchers.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def clear(self):
+        self._entries.clear()
+
+
+SERVICE_LIST_CACHE = ServiceListCache()
+
+
 class LbClient(ProxyClient):
     """Simple load balancer client"""
 
@@ -87,12 +206,24 @@ class LbClient(ProxyClient):
 class ConscienceClient(ProxyClient):
     """Conscience client. Some calls are actually redirected to LbClient."""
 
-    def __init__(self, conf, **kwargs):
+    def __init__(self, conf, service_cache_ttl=None, **kwargs):
+        """
+        :param service_cache_ttl: how long (in seconds) listings of
+            services are served from the cache shared by the process
+            (defaults to the "service_cache_ttl" key of `conf`, or 0
+            which disables the cache)
+        """
         super(ConscienceClient, self).__init__(
             conf, request_prefix="/conscience", **kwargs)
         lb_kwargs = dict(kwargs)
         lb_kwargs.pop("pool_manager", None)
         self.lb = LbClient(conf, pool_manager=self.pool_manager, **lb_kwargs)
+        if service_cache_ttl is None:
+            service_cache_ttl = conf.get('service_cache_ttl')
+        self.service_cache_ttl = float_value(service_cache_ttl,
+                                             SERVICE_CACHE_TTL)
+        self.service_cache_max_stale = float_value(
+            conf.get('service_cache_max_stale'), SERVICE_CACHE_MAX_STALE)
 
     def next_instances(self, pool, **kwargs):
         """
@@ -120,7 +251,39 @@ class ConscienceClient(ProxyClient):
         """
         return self.lb.poll(pool, **kwargs)
 
-    def all_services(self, type_, full=False):
+    def all_services(self, type_, full=False, use_cache=True):
+        """
+        Get the list of services of the specified type.
+
+        :param full: also get the tags of the services
+        :param use_cache: allow the listing to come from the cache
+            shared by the process (see `service_cache_ttl`)
+        """
+        if use_cache and self.service_cache_ttl > 0:
+            services = SERVICE_LIST_CACHE.get(
+                (self.endpoint, type_, bool(full)),
+                partial(self._all_services, type_, full),
+                self.service_cache_ttl, self.service_cache_max_stale)
+            # Callers are allowed to alter the listing
+            return deepcopy(services)
+        return self._all_services(type_, full)
+
+    def watch_services(self, type_, callback, full=False):
+        """
+        Call `callback(type_, added, removed, changed)` each time the
+        cached listing of services of type `type_` gets services which
+        appeared, disappeared or whose score changed.
+        Only listings obtained through the cache are compared, and only
+        those with (or without, depending on `full`) the tags.
+        """
+        SERVICE_LIST_CACHE.watch((self.endpoint, type_, bool(full)),
+                                 callback)
+
+    def unwatch_services(self, type_, callback, full=False):
+        SERVICE_LIST_CACHE.unwatch((self.endpoint, type_, bool(full)),
+                                   callback)
+
+    def _all_services(self, type_, full=False):
         params = {'type': type_}
         if full:
             params['full'] = '1'
@@ -150,6 +313,12 @@ class ConscienceClient(ProxyClient):
                                resp.text)
 
     def register(self, pool, service_definition, **kwargs):
+        """
+        Register a service, or several services at once.
+
+        :param service_definition: the description of the service,
+            or a list of descriptions
+        """
         data = json.dumps(service_definition)
         resp, body = self._request('POST', '/register', data=data, **kwargs)
 
@@ -13,6 +13,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
+from eventlet import Timeout
+from oio.common.easy_value import float_value
+
 
 class BaseStat(object):
     """Base class for all service stat"""
@@ -21,6 +26,15 @@ class BaseStat(object):
         self.agent = agent
         self.stat_conf = stat_conf
         self.logger = logger
+        self.name = stat_conf.get('type', self.__class__.__name__)
+        # By default, a stat must not delay the next registration
+        self.timeout = float_value(stat_conf.get('timeout'),
+                                   getattr(agent, 'check_interval', 1.0))
+        # Values and time of the last successful fetch
+        self.last_stats = {}
+        self.last_success = None
+        # Duration of the last fetch, successful or not
+        self.duration = 0.0
         self.configure()
 
     def configure(self):
@@ -30,3 +44,31 @@ class BaseStat(object):
     def stat(self):
         """Actually do the service stat"""
         return {}
+
+    def collect(self):
+        """
+        Call `get_stats` within `timeout` seconds. If it fails or takes
+        longer, fall back to the values of the last successful call.
+
+        :returns: a tuple with the stats and their age in seconds
+            (0 if they have just been fetched, None if never)
+        """
+        start = time.time()
+        success = False
+        try:
+            with Timeout(self.timeout):
+                self.last_stats = self.get_stats()
+            self.last_success = start
+            success = True
+        except Timeout:
+            self.logger.debug('%s stats timed out after %.3fs',
+                              self.name, self.timeout)
+        except Exception as exc:
+            self.logger.debug('%s stats error: %s', self.name, exc)
+        now = time.time()
+        self.duration = now - start
+        if success:
+            return self.last_stats, 0.0
+        if self.last_success is None:
+            return self.last_stats, None
+        return self.last_stats, now - self.last_success
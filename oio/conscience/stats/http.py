@@ -62,21 +62,19 @@ class HttpStat(BaseStat):
         return {'stat.' + k: body[k] for k in body.keys()}
 
     def get_stats(self):
-        result = {}
+        conn = None
         resp = None
         try:
             conn = http_connect(self.netloc, 'GET', self.path)
             resp = conn.getresponse()
-            if resp.status == 200:
-                result = self._parse_func(resp.read())
-            else:
+            if resp.status != 200:
                 raise Exception("status code != 200: %s" % resp.status)
-        except Exception as e:
-            self.logger.debug("get_stats error: %s", e)
+            return self._parse_func(resp.read())
         finally:
             if resp:
                 try:
                     resp.force_close()
                 except Exception:
                     pass
-            return result
+            elif conn:
+                conn.close()
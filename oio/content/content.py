@@ -81,7 +81,14 @@ class Content(object):
             raise ValueError("'value' must be a dict")
         self.metadata['properties'] = value
 
-    def _get_spare_chunk(self, chunks_notin, chunks_broken):
+    def _get_spare_chunk(self, chunks_notin, chunks_broken, throttle=None):
+        """
+        Select services to host new chunks.
+
+        :param throttle: a function called with the list of the selected
+            chunk URLs, before anything is sent to them (e.g. to limit
+            the rate of operations on each service)
+        """
         spare_data = {
             "notin": ChunksHelper(chunks_notin, False).raw(),
             "broken": ChunksHelper(chunks_broken, False).raw()
@@ -97,6 +104,8 @@ class Content(object):
         for c in spare_resp["chunks"]:
             url_list.append(c["id"])
 
+        if throttle:
+            throttle(url_list)
         return url_list
 
     def _add_raw_chunk(self, current_chunk, url):
@@ -150,7 +159,8 @@ class Content(object):
             mime_type=self.mime_type, data=data,
             **kwargs)
 
-    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None):
+    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None,
+                      throttle=None):
         raise NotImplementedError()
 
     def create(self, stream, **kwargs):
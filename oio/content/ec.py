@@ -13,8 +13,9 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.
 
-from oio.common.exceptions import OrphanChunk
-from oio.content.content import Content, Chunk
+from eventlet import GreenPile
+from oio.common.exceptions import OrphanChunk, SpareChunkException
+from oio.content.content import Content, Chunk, ChunksHelper
 from oio.api.ec import ECWriteHandler, ECRebuildHandler
 from oio.common.storage_functions import _sort_chunks, fetch_stream_ec
 from oio.common.utils import GeneratorIO
@@ -22,7 +23,8 @@ from oio.common.constants import OIO_VERSION
 
 
 class ECContent(Content):
-    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None):
+    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None,
+                      throttle=None):
         current_chunk = self.chunks.filter(id=chunk_id).one()
 
         if current_chunk is None and chunk_pos is None:
@@ -38,17 +40,66 @@ class ECContent(Content):
             current_chunk.size = chunks[0].size
             current_chunk.checksum = chunks[0].checksum
 
+        self._rebuild_metachunk(chunks, [current_chunk],
+                                allow_same_rawx=allow_same_rawx,
+                                throttle=throttle)
+
+    def rebuild_chunks(self, chunk_ids, allow_same_rawx=False,
+                       throttle=None):
+        """
+        Rebuild several chunks of the content. The chunks of a same
+        metachunk are rebuilt together, reading the metachunk once.
+        """
+        by_metapos = dict()
+        for chunk_id in chunk_ids:
+            current_chunk = self.chunks.filter(id=chunk_id).one()
+            if current_chunk is None:
+                raise OrphanChunk("Chunk %s not found in content" % chunk_id)
+            by_metapos.setdefault(current_chunk.metapos, list()).append(
+                current_chunk)
+
+        for metapos in sorted(by_metapos):
+            current_chunks = by_metapos[metapos]
+            lost_ids = set(c.id for c in current_chunks)
+            chunks = [c for c in self.chunks.filter(metapos=metapos)
+                      if c.id not in lost_ids]
+            self._rebuild_metachunk(ChunksHelper(chunks, False),
+                                    current_chunks,
+                                    allow_same_rawx=allow_same_rawx,
+                                    throttle=throttle)
+
+    def _rebuild_metachunk(self, chunks, current_chunks,
+                           allow_same_rawx=False, throttle=None):
+        """
+        Rebuild the `current_chunks` of a metachunk from its
+        remaining `chunks`, and upload them in parallel.
+        """
         broken_list = list()
         if not allow_same_rawx:
-            broken_list.append(current_chunk)
-        spare_url = self._get_spare_chunk(chunks.all(), broken_list)
+            broken_list.extend(current_chunks)
+        spare_urls = self._get_spare_chunk(chunks.all(), broken_list,
+                                           throttle=throttle)
+        if len(spare_urls) < len(current_chunks):
+            raise SpareChunkException(
+                "Not enough spare chunks (%d/%d)" %
+                (len(spare_urls), len(current_chunks)))
 
         handler = ECRebuildHandler(
-            chunks.raw(), current_chunk.subpos, self.storage_method)
-
-        new_chunk = {'pos': current_chunk.pos, 'url': spare_url[0]}
+            chunks.raw(), [c.subpos for c in current_chunks],
+            self.storage_method)
+        streams = handler.rebuild_all()
+
+        pile = GreenPile(len(current_chunks))
+        for current_chunk, spare_url in zip(current_chunks, spare_urls):
+            pile.spawn(self._put_rebuilt_chunk, current_chunk, spare_url,
+                       streams[current_chunk.subpos])
+        errors = [err for err in pile if err is not None]
+        if errors:
+            raise errors[0]
+
+    def _put_rebuilt_chunk(self, current_chunk, spare_url, stream):
+        new_chunk = {'pos': current_chunk.pos, 'url': spare_url}
         new_chunk = Chunk(new_chunk)
-        stream = handler.rebuild()
 
         meta = {}
         meta['chunk_id'] = new_chunk.id
@@ -77,11 +128,20 @@ class ECContent(Content):
         meta['metachunk_size'] = current_chunk.size
         meta['full_path'] = self.full_path
         meta['oio_version'] = OIO_VERSION
-        self.blob_client.chunk_put(spare_url[0], meta, GeneratorIO(stream))
-        if chunk_id is None:
-            self._add_raw_chunk(current_chunk, spare_url[0])
-        else:
-            self._update_spare_chunk(current_chunk, spare_url[0])
+        try:
+            self.blob_client.chunk_put(spare_url, meta, GeneratorIO(stream))
+            if not current_chunk.url:
+                self._add_raw_chunk(current_chunk, spare_url)
+            else:
+                self._update_spare_chunk(current_chunk, spare_url)
+        except Exception as err:
+            self.logger.warn("Failed to rebuild chunk %s at position %s: %s",
+                             current_chunk.url, current_chunk.pos, err)
+            return err
+        finally:
+            # let the other chunks be rebuilt
+            stream.close()
+        return None
 
     def fetch(self):
         chunks = _sort_chunks(self.chunks.raw(), self.storage_method.ec)
@@ -46,7 +46,8 @@ class PlainContent(Content):
         self._create_object(**kwargs)
         return final_chunks, bytes_transferred, content_checksum
 
-    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None):
+    def rebuild_chunk(self, chunk_id, allow_same_rawx=False, chunk_pos=None,
+                      throttle=None):
         current_chunk = self.chunks.filter(id=chunk_id).one()
         if current_chunk is None and chunk_pos is None:
             raise exc.OrphanChunk("Chunk not found in content")
@@ -70,7 +71,7 @@ class PlainContent(Content):
         if not allow_same_rawx:
             broken_list.append(current_chunk)
         spare_urls = self._get_spare_chunk(
-            duplicate_chunks, broken_list)
+            duplicate_chunks, broken_list, throttle=throttle)
 
         uploaded = False
         for src in duplicate_chunks:
@@ -15,7 +15,10 @@
 
 
 """Meta0 client and meta1 balancing operations"""
+import heapq
+import math
 import random
+from collections import defaultdict, deque
 
 from oio.common.json import json
 from oio.common.client import ProxyClient
@@ -445,8 +448,267 @@ class PrefixMapping(object):
         svc["score"] = saved_score
         return moved
 
-    def rebalance(self, max_loops=65536):
-        """Reassign bases from the services which manage the most"""
+    def get_weight(self, svc, weighted=False):
+        """
+        Get the weight of a service when balancing bases:
+        0 if its score is not positive, else its score if `weighted`
+        is set, else 1.
+        """
+        score = self.get_score(svc)
+        if score <= 0:
+            return 0.0
+        return float(score) if weighted else 1.0
+
+    def compute_rebalance(self, tolerance=0.0, weighted=False,
+                          max_moves=None, drain=False):
+        """
+        Compute a minimal list of base moves bringing the number of bases
+        managed by each service within `tolerance` of its target,
+        without modifying the mapping.
+
+        The target of a service is proportional to its weight
+        (see `get_weight`). Services without a positive score do not
+        receive bases, and keep theirs unless `drain` is set.
+        A move replaces one service of one base, which means copying one
+        meta1 database, so the number of moves is kept to the minimum
+        allowed by the distance constraints (`min_dist`). At least one
+        of the current peers of a base is kept, so it can be copied.
+
+        :param tolerance: accepted relative gap between the number of bases
+            of a service and its target (e.g. 0.05 for 5%)
+        :param weighted: use the score of the services as their weight
+        :param max_moves: maximum number of moves to compute
+        :param drain: move all the bases of the services without
+            a positive score to the other services
+        :returns: a `dict` with the list of moves as (base, old service,
+            new service) tuples, and the imbalance before and after them
+            (the greatest gap between the number of bases of a service
+            and its target, relative to the target)
+        """
+        peers_by_base = {base: [svc['addr'] for svc in services]
+                         for base, services in self.svc_by_base.iteritems()}
+        bases_by_svc = {addr: set() for addr in self.services}
+        for base, peers in peers_by_base.iteritems():
+            for addr in peers:
+                bases_by_svc.setdefault(addr, set()).add(base)
+        weights = {addr: self.get_weight(addr, weighted)
+                   for addr in bases_by_svc}
+        receivers = [addr for addr, weight in weights.iteritems() if weight]
+        if not receivers:
+            raise OioException("No meta1 service with a positive score")
+        total = sum(len(peers) for peers in peers_by_base.itervalues())
+        total_weight = sum(weights.itervalues())
+        if drain:
+            kept = dict()
+        else:
+            # The services without a positive score keep their bases,
+            # the others share the rest.
+            kept = {addr: len(bases)
+                    for addr, bases in bases_by_svc.iteritems()
+                    if not weights[addr]}
+            total -= sum(kept.itervalues())
+        targets = {addr: total * weight / total_weight
+                   for addr, weight in weights.iteritems()}
+        targets.update(kept)
+        lower = {addr: int(math.floor(target * (1.0 - tolerance)))
+                 for addr, target in targets.iteritems()}
+        upper = {addr: int(math.ceil(target * (1.0 + tolerance)))
+                 for addr, target in targets.iteritems()}
+        lower.update(kept)
+        upper.update(kept)
+        # Gap of drained services is relative to the average target
+        mean_target = float(total) / len(receivers)
+        locations = {addr: self.get_loc(addr) for addr in bases_by_svc}
+        far_enough = dict()
+        moves_by_base = defaultdict(int)
+        moves = list()
+
+        def _count(addr):
+            return len(bases_by_svc[addr])
+
+        def _gap(addr):
+            return ((_count(addr) - targets[addr]) /
+                    (targets[addr] or mean_target))
+
+        def _imbalance():
+            return max(abs(_gap(addr)) for addr in bases_by_svc)
+
+        def _movable(base):
+            # Keep at least one of the current peers to copy the base from
+            max_moves_base = max(1, len(self.svc_by_base[base]) - 1)
+            return moves_by_base[base] < max_moves_base
+
+        def _compatible(base, src, dst):
+            peers = peers_by_base[base]
+            if dst in peers:
+                return False
+            for peer in peers:
+                if peer == src:
+                    continue
+                key = (locations[dst], locations[peer])
+                if key not in far_enough:
+                    far_enough[key] = (self.dist_between(*key) >=
+                                       self.min_dist)
+                if not far_enough[key]:
+                    return False
+            return True
+
+        def _move(base, src, dst):
+            peers = peers_by_base[base]
+            peers[peers.index(src)] = dst
+            bases_by_svc[src].remove(base)
+            bases_by_svc[dst].add(base)
+            moves_by_base[base] += 1
+            moves.append((base, src, dst))
+
+        def _done():
+            return max_moves is not None and len(moves) >= max_moves
+
+        def _pop(heap, accept):
+            """Pop the first accepted service, put back the rejected."""
+            rejected = list()
+            found = None
+            while heap:
+                item = heapq.heappop(heap)
+                if accept(item[-1]):
+                    found = item[-1]
+                    break
+                rejected.append(item)
+            for item in rejected:
+                heapq.heappush(heap, item)
+            return found
+
+        imbalance_before = _imbalance()
+
+        # Each move from a service above its upper limit to a service
+        # below its lower limit fixes both: do these first.
+        def _dest_key(addr):
+            return (_count(addr) >= lower[addr], _gap(addr), addr)
+
+        dests = [_dest_key(addr) for addr in receivers
+                 if _count(addr) < upper[addr]]
+        heapq.heapify(dests)
+        sources = sorted((addr for addr in bases_by_svc
+                          if _count(addr) > upper[addr]),
+                         key=lambda addr: (upper[addr] - _count(addr), addr))
+        for src in sources:
+            for base in sorted(bases_by_svc[src]):
+                if _count(src) <= upper[src] or _done():
+                    break
+                if not _movable(base):
+                    continue
+                dst = _pop(dests,
+                           lambda addr, base=base: _compatible(base, src,
+                                                               addr))
+                if dst is None:
+                    continue
+                _move(base, src, dst)
+                if _count(dst) < upper[dst]:
+                    heapq.heappush(dests, _dest_key(dst))
+
+        # Then fill the services still below their lower limit
+        # with bases of the most loaded services.
+        def _src_key(addr):
+            return (-_gap(addr), addr)
+
+        srcs = [_src_key(addr) for addr in bases_by_svc
+                if _count(addr) > lower[addr]]
+        heapq.heapify(srcs)
+        dests = sorted((addr for addr in receivers
+                        if _count(addr) < lower[addr]),
+                       key=lambda addr: (_count(addr) - lower[addr], addr))
+        for dst in dests:
+            while _count(dst) < lower[dst] and not _done():
+                found = dict()
+
+                def _accept(src, dst=dst, found=found):
+                    for base in sorted(bases_by_svc[src]):
+                        if _movable(base) and _compatible(base, src, dst):
+                            found['base'] = base
+                            return True
+                    return False
+                src = _pop(srcs, _accept)
+                if src is None:
+                    break
+                _move(found['base'], src, dst)
+                if _count(src) > lower[src]:
+                    heapq.heappush(srcs, _src_key(src))
+
+        # Finally, when no single move can help, look for the shortest
+        # chains of moves (A gives a base to B, which gives another base
+        # to C...) from a loaded service to a service with room.
+        def _find_chain(starts, is_end):
+            parents = {addr: None for addr in starts}
+            queue = deque(starts)
+            while queue:
+                src = queue.popleft()
+                # Bases already moved by the chain leading to src
+                used = set()
+                node = src
+                while parents[node]:
+                    base, node = parents[node]
+                    used.add(base)
+                unvisited = [addr for addr in receivers
+                             if addr not in parents]
+                for base in bases_by_svc[src]:
+                    if not unvisited:
+                        break
+                    if base in used or not _movable(base):
+                        continue
+                    for dst in [addr for addr in unvisited
+                                if _compatible(base, src, addr)]:
+                        unvisited.remove(dst)
+                        parents[dst] = (base, src)
+                        if is_end(dst):
+                            chain = list()
+                            while parents[dst]:
+                                base, src = parents[dst]
+                                chain.append((base, src, dst))
+                                dst = src
+                            return chain[::-1]
+                        queue.append(dst)
+            return None
+
+        def _is_under_upper(addr):
+            return _count(addr) < upper[addr]
+
+        def _is_under_lower(addr):
+            return _count(addr) < lower[addr]
+
+        while True:
+            chain = None
+            starts = [addr for addr in bases_by_svc
+                      if _count(addr) > upper[addr]]
+            if starts:
+                chain = _find_chain(starts, _is_under_upper)
+            if not chain and any(_is_under_lower(addr)
+                                 for addr in receivers):
+                starts = [addr for addr in bases_by_svc
+                          if _count(addr) > lower[addr]]
+                chain = _find_chain(starts, _is_under_lower)
+            if not chain or (max_moves is not None and
+                             len(moves) + len(chain) > max_moves):
+                break
+            for base, src, dst in chain:
+                _move(base, src, dst)
+
+        return {'moves': moves,
+                'imbalance_before': imbalance_before,
+                'imbalance_after': _imbalance()}
+
+    def rebalance(self, max_loops=65536, tolerance=0.0, weighted=False,
+                  dry_run=False, drain=False):
+        """
+        Reassign bases from the services which manage the most,
+        with a minimal number of moves (see `compute_rebalance`).
+
+        :param max_loops: maximum number of base moves
+        :param dry_run: only compute and report the moves,
+            do not modify the mapping
+        :param drain: move all the bases of the services without
+            a positive score
+        :returns: the set of bases that have moved (or would have)
+        """
 
         if self.digits == 0:
             if self.logger:
@@ -454,12 +716,6 @@ class PrefixMapping(object):
                                  "meta1_digits is set to 0")
             return None
 
-        loops = 0
-        moved_bases = set()
-        ideal_bases_by_svc = (self.num_bases() * self.replicas /
-                              len([x for x in self.services.itervalues()
-                                   if self.get_score(x) > 0]))
-        upper_limit = ideal_bases_by_svc + 1
         if self.logger:
             self.logger.info("META1 Digits = %d", self.digits)
             self.logger.info("Replicas = %d", self.replicas)
@@ -467,42 +723,35 @@ class PrefixMapping(object):
                 "Scored positively = %d",
                 len([x for x in self.services.itervalues()
                      if self.get_score(x) > 0]))
+        plan = self.compute_rebalance(tolerance=tolerance, weighted=weighted,
+                                      max_moves=max_loops, drain=drain)
+        moved_bases = set()
+        for base, src, dst in plan['moves']:
+            moved_bases.add(base)
+            if not dry_run:
+                self._move_base(base, src, dst)
+        if self.logger:
             self.logger.info(
-                "Ideal number of bases per meta1: %d, limit: %d",
-                ideal_bases_by_svc, upper_limit)
-        while loops < max_loops:
-            candidates = self.services.values()
-            candidates.sort(key=(lambda x: len(self.get_managed_bases(x))))
-            already_balanced = 0
-            while candidates:
-                svc = candidates.pop()  # service with most bases
-                svc_bases = self.get_managed_bases(svc)
-                if len(svc_bases) <= upper_limit:
-                    already_balanced += 1
-                    continue
-                if self.logger:
-                    self.logger.info("meta1 %s has %d bases, moving some",
+                "%s bases moved (%d moves), imbalance %.2f%% -> %.2f%%%s",
+                len(moved_bases), len(plan['moves']),
+                plan['imbalance_before'] * 100.0,
+                plan['imbalance_after'] * 100.0,
+                " (dry run)" if dry_run else "")
+            if not dry_run:
+                for svc in sorted(self.services.values(),
+                                  key=lambda x: x['addr']):
+                    svc_bases = self.get_managed_bases(svc)
+                    self.logger.info("meta1 %s has %d bases",
                                      svc['addr'], len(svc_bases))
-                while (len(svc_bases) > upper_limit and
-                       loops < max_loops):
-                    bases = {base
-                             for base in random.sample(
-                                 svc_bases, len(svc_bases) - upper_limit)
-                             if base not in moved_bases}
-                    if bases:
-                        moved = self.decommission(svc, bases)
-                        for base in moved:
-                            moved_bases.add(base)
-                            loops += 1
-                    else:
-                        loops += 1  # safeguard against infinite loops
-            if already_balanced >= len(self.services):
-                break
-        if self.logger:
-            self.logger.info("%s bases moved",
-                             len(moved_bases))
-            for svc in sorted(self.services.values(), key=lambda x: x['addr']):
-                svc_bases = self.get_managed_bases(svc)
-                self.logger.info("meta1 %s has %d bases",
-                                 svc['addr'], len(svc_bases))
         return moved_bases
+
+    def _move_base(self, base, src, dst):
+        """Replace the service `src` by the service `dst` for `base`."""
+        services = self.svc_by_base[base]
+        idx = [svc['addr'] for svc in services].index(src)
+        self.get_managed_bases(services[idx]).discard(base)
+        new_svc = self.services.get(dst, {'addr': dst})
+        base_set = new_svc.get('bases') or set()
+        base_set.add(base)
+        new_svc['bases'] = base_set
+        services[idx] = new_svc
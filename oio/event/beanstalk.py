@@ -17,6 +17,7 @@
 import os
 import sys
 import yaml
+from collections import deque
 from eventlet.green import socket
 from eventlet.queue import Empty, LifoQueue
 from urlparse import urlparse
@@ -308,7 +309,11 @@ class Connection(object):
         return ''.join(output)
 
     def send_command(self, command, *args, **kwargs):
-        command = self.pack_command(command, kwargs.get('body'), *args)
+        self.send_packed(
+            self.pack_command(command, kwargs.get('body'), *args))
+
+    def send_packed(self, command):
+        """Send one or several commands packed with `pack_command`."""
         if not self._sock:
             self.connect()
         try:
@@ -383,10 +388,12 @@ def parse_body(connection, response, **kwargs):
 class Beanstalk(object):
     RESPONSE_CALLBACKS = dict_merge(
         {'reserve': parse_body,
+         'reserve-with-timeout': parse_body,
          'stats-tube': parse_yaml}
     )
     EXPECTED_OK = dict_merge(
         {'reserve': ['RESERVED'],
+         'reserve-with-timeout': ['RESERVED'],
          'delete': ['DELETED'],
          'release': ['RELEASED'],
          'bury': ['BURIED'],
@@ -395,11 +402,13 @@ class Beanstalk(object):
          'watch': ['WATCHING'],
          'stats-tube': ['OK'],
          'kick': ['KICKED'],
-         'kick-job': ['KICKED']}
+         'kick-job': ['KICKED'],
+         'touch': ['TOUCHED']}
 
     )
     EXPECTED_ERR = dict_merge(
         {'reserve': ['DEADLINE_SOON', 'TIMED_OUT'],
+         'reserve-with-timeout': ['DEADLINE_SOON', 'TIMED_OUT'],
          'delete': ['NOT_FOUND'],
          'release': ['BURIED', 'NOT_FOUND', 'OUT_OF_MEMORY'],
          'bury': ['NOT_FOUND', 'OUT_OF_MEMORY'],
@@ -408,7 +417,8 @@ class Beanstalk(object):
          'watch': [],
          'put': ['JOB_TOO_BIG', 'BURIED', 'DRAINING', 'OUT_OF_MEMORY'],
          'kick': ['OUT_OF_MEMORY'],
-         'kick-job': ['NOT_FOUND', 'OUT_OF_MEMORY']}
+         'kick-job': ['NOT_FOUND', 'OUT_OF_MEMORY'],
+         'touch': ['NOT_FOUND']}
     )
 
     @classmethod
@@ -440,6 +450,10 @@ class Beanstalk(object):
         self.response_callbacks = self.__class__.RESPONSE_CALLBACKS.copy()
         self.expected_ok = self.__class__.EXPECTED_OK.copy()
         self.expected_err = self.__class__.EXPECTED_ERR.copy()
+        # Names of the commands sent without waiting for their reply
+        self._pending = deque()
+        # Errors replied to these commands, not reported yet
+        self._deferred_errors = list()
 
     def _get_connection(self):
         try:
@@ -451,18 +465,78 @@ class Beanstalk(object):
     def _release_connection(self, connection):
         self.conn_queue.put_nowait(connection)
 
+    def _disconnect(self, connection):
+        connection.disconnect()
+        # The replies to the pending commands are lost. The jobs reserved
+        # by the connection are released by the server.
+        self._pending.clear()
+
+    def _read_pending_responses(self, connection):
+        """Read the replies to the commands sent without waiting."""
+        while self._pending:
+            command_name = self._pending[0]
+            try:
+                self.parse_response(connection, command_name)
+            except (ResponseError, InvalidResponse) as exc:
+                self._deferred_errors.append(exc)
+            self._pending.popleft()
+
     def execute_command(self, *args, **kwargs):
         connection = self._get_connection()
         command_name = args[0]
         try:
             connection.send_command(*args, **kwargs)
+            self._read_pending_responses(connection)
             return self.parse_response(connection, command_name, **kwargs)
         except (ConnectionError, TimeoutError):
-            connection.disconnect()
+            self._disconnect(connection)
+            raise
+        finally:
+            self._release_connection(connection)
+
+    def send_command_nowait(self, *args, **kwargs):
+        """
+        Send a command without waiting for its reply. The reply is read
+        before the reply of the next command, or by `flush`.
+        Only for commands whose reply has no body.
+        """
+        connection = self._get_connection()
+        try:
+            connection.send_command(*args, **kwargs)
+            self._pending.append(args[0])
+        except (ConnectionError, TimeoutError):
+            self._disconnect(connection)
             raise
         finally:
             self._release_connection(connection)
 
+    def _execute_command(self, wait, *args, **kwargs):
+        if wait:
+            return self.execute_command(*args, **kwargs)
+        return self.send_command_nowait(*args, **kwargs)
+
+    def flush(self):
+        """
+        Wait for the replies to the commands sent without waiting.
+
+        :returns: the errors replied to these commands since
+            the last call to `flush` or `reserve_many`
+        """
+        connection = self._get_connection()
+        try:
+            self._read_pending_responses(connection)
+        except (ConnectionError, TimeoutError):
+            self._disconnect(connection)
+            raise
+        finally:
+            self._release_connection(connection)
+        return self.pop_deferred_errors()
+
+    def pop_deferred_errors(self):
+        """Get (and forget) the errors replied to deferred commands."""
+        errors, self._deferred_errors = self._deferred_errors, list()
+        return errors
+
     def parse_response(self, connection, command_name, **kwargs):
         response = connection.read_response()
         status, results = response
@@ -495,14 +569,54 @@ class Beanstalk(object):
         else:
             return self.execute_command('reserve')
 
-    def bury(self, job_id, priority=DEFAULT_PRIORITY):
-        self.execute_command('bury', job_id, priority)
+    def reserve_many(self, count, timeout=None):
+        """
+        Reserve up to `count` jobs already available, in one round trip.
+        If none is available, wait for one at most `timeout` seconds
+        (forever if `timeout` is `None`, not at all if it is 0).
+
+        :returns: a list of (job_id, data) tuples, maybe empty
+        """
+        jobs = list()
+        connection = self._get_connection()
+        try:
+            connection.send_packed(''.join(
+                connection.pack_command('reserve-with-timeout', None, 0)
+                for _ in range(count)))
+            self._read_pending_responses(connection)
+            for _ in range(count):
+                try:
+                    jobs.append(self.parse_response(
+                        connection, 'reserve-with-timeout'))
+                except ResponseError:
+                    # TIMED_OUT (no more ready job) or DEADLINE_SOON
+                    pass
+        except (ConnectionError, TimeoutError):
+            self._disconnect(connection)
+            raise
+        finally:
+            self._release_connection(connection)
+
+        if not jobs and timeout != 0:
+            try:
+                jobs.append(self.reserve(timeout=timeout))
+            except ResponseError:
+                pass
+        return jobs
+
+    def bury(self, job_id, priority=DEFAULT_PRIORITY, wait=True):
+        self._execute_command(wait, 'bury', job_id, priority)
+
+    def release(self, job_id, priority=DEFAULT_PRIORITY, delay=0,
+                wait=True):
+        self._execute_command(wait, 'release', job_id, priority, delay)
 
-    def release(self, job_id, priority=DEFAULT_PRIORITY, delay=0):
-        self.execute_command('release', job_id, priority, delay)
+    def delete(self, job_id, wait=True):
+        self._execute_command(wait, 'delete', job_id)
 
-    def delete(self, job_id):
-        self.execute_command('delete', job_id)
+    def touch(self, job_id, wait=True):
+        """Request more time to process a reserved job (a full TTR)."""
+        self._execute_command(wait, 'touch', job_id)
 
     def kick_job(self, job_id):
         """
@@ -19,6 +19,8 @@ import signal
 import os
 import sys
 
+from collections import deque
+
 import greenlet
 import eventlet
 from eventlet import Timeout, greenthread
@@ -26,9 +28,10 @@ from oio.common.exceptions import OioNetworkException
 
 from oio.conscience.client import ConscienceClient
 from oio.rdir.client import RdirClient
-from oio.event.beanstalk import Beanstalk, ConnectionError
+from oio.event.beanstalk import Beanstalk, ConnectionError, ResponseError, \
+    DEFAULT_TTR
 from oio.common.utils import drop_privileges
-from oio.common.easy_value import true_value, int_value
+from oio.common.easy_value import true_value, int_value, float_value
 from oio.common.json import json
 from oio.event.evob import is_success, is_error
 from oio.event.loader import loadhandlers
@@ -41,6 +44,9 @@ ACCOUNT_SERVICE = 'account'
 DEFAULT_TUBE = 'oio'
 
 BEANSTALK_RECONNECTION = 2.0
+# how long (in seconds) a prefetching worker waits for a job
+# before checking whether it must stop
+RESERVE_TIMEOUT = 1
 # default release delay (in seconds)
 RELEASE_DELAY = 15
 
@@ -136,6 +142,9 @@ class EventWorker(Worker):
     def __init__(self, *args, **kwargs):
         super(EventWorker, self).__init__(*args, **kwargs)
         self.app_env = dict()
+        # TTR of the jobs, to check the prefetched ones
+        self.prefetch_ttr = float_value(self.conf.get('prefetch_ttr'),
+                                        DEFAULT_TTR)
 
     def init(self):
         eventlet.monkey_patch(os=False)
@@ -175,12 +184,16 @@ class EventWorker(Worker):
         coros = []
         queue_url = self.conf.get('queue_url', '127.0.0.1:11300')
         concurrency = int_value(self.conf.get('concurrency'), 10)
+        prefetch = int_value(self.conf.get('prefetch'), 1)
 
         server_gt = greenthread.getcurrent()
 
         for i in range(concurrency):
             beanstalk = Beanstalk.from_url(queue_url)
-            gt = eventlet.spawn(self.handle, beanstalk)
+            if prefetch > 1:
+                gt = eventlet.spawn(self.handle_prefetch, beanstalk, prefetch)
+            else:
+                gt = eventlet.spawn(self.handle, beanstalk)
             gt.link(_eventlet_stop, server_gt, beanstalk)
             coros.append(gt)
             beanstalk, gt = None, None
@@ -221,36 +234,132 @@ class EventWorker(Worker):
                         conn_error = True
                     eventlet.sleep(BEANSTALK_RECONNECTION)
                     continue
+                self.process_job(job_id, data, beanstalk)
+        except StopServe:
+            pass
+
+    def handle_prefetch(self, beanstalk, prefetch):
+        """
+        Like `handle`, but reserve up to `prefetch` jobs at once,
+        and do not wait for the replies to delete, release
+        and bury commands.
+
+        The prefetched jobs are processed one after the other: those
+        waiting for too long are touched, or dropped when their TTR
+        is over (see `check_prefetched_job`). A handler that delays
+        its reply (e.g. the account update filter with a
+        `coalesce_window`) delays all the jobs prefetched after it.
+        """
+        conn_error = False
+        jobs = deque()
+        try:
+            if self.tube:
+                beanstalk.use(self.tube)
+                beanstalk.watch(self.tube)
+            while self.alive:
+                if not jobs:
+                    try:
+                        reserved = beanstalk.reserve_many(
+                            prefetch, timeout=RESERVE_TIMEOUT)
+                        now = time.time()
+                        jobs.extend((job_id, data, now)
+                                    for job_id, data in reserved)
+                        if conn_error:
+                            self.logger.warn("beanstalk reconnected")
+                            conn_error = False
+                    except ConnectionError:
+                        if not conn_error:
+                            self.logger.warn("beanstalk connection error")
+                            conn_error = True
+                        eventlet.sleep(BEANSTALK_RECONNECTION)
+                    for exc in beanstalk.pop_deferred_errors():
+                        self.logger.warn("beanstalk command failed: %s",
+                                         exc)
+                    continue
+                job_id, data, reserved_at = jobs.popleft()
                 try:
-                    event = self.safe_decode_job(job_id, data)
-                    self.process_event(job_id, event, beanstalk)
-                except OioNetworkException as e:
-                    self.logger.warn("handling event %s (bury): %s", job_id, e)
-                    beanstalk.bury(job_id)
-                except ExplicitBury as e:
-                    self.logger.info("handling event %s (bury)", job_id)
-                    beanstalk.bury(job_id)
-                except Exception:
-                    self.logger.exception("handling event %s (bury)", job_id)
-                    beanstalk.bury(job_id)
+                    if not self.check_prefetched_job(job_id, reserved_at,
+                                                     beanstalk):
+                        continue
+                    self.process_job(job_id, data, beanstalk, wait=False)
+                except ConnectionError:
+                    # The server released the jobs of the lost connection
+                    self.logger.warn("beanstalk connection error, "
+                                     "dropping %d prefetched jobs",
+                                     len(jobs))
+                    jobs.clear()
         except StopServe:
             pass
+        finally:
+            self.release_jobs(jobs, beanstalk)
+
+    def check_prefetched_job(self, job_id, reserved_at, beanstalk):
+        """
+        Make sure a prefetched job is still reserved before processing it.
+        A job waiting for more than half its TTR is touched, to get
+        a full TTR to be processed. A job whose TTR is over has been
+        released by the server (and may be processed by another worker),
+        it is dropped.
+
+        :returns: True if the job can be processed
+        """
+        waited = time.time() - reserved_at
+        if waited >= self.prefetch_ttr:
+            self.logger.warn("prefetched job %s waited %.3fs, beyond its "
+                             "TTR, dropped", job_id, waited)
+            return False
+        if waited >= self.prefetch_ttr / 2:
+            try:
+                beanstalk.touch(job_id)
+            except ResponseError as exc:
+                self.logger.warn("prefetched job %s lost, dropped: %s",
+                                 job_id, exc)
+                return False
+        return True
 
-    def process_event(self, job_id, event, beanstalk):
+    def release_jobs(self, jobs, beanstalk):
+        """Release the jobs that have been reserved but not processed."""
+        try:
+            while jobs:
+                job_id, _data, _reserved_at = jobs.popleft()
+                beanstalk.release(job_id, wait=False)
+            for exc in beanstalk.flush():
+                self.logger.warn("beanstalk command failed: %s", exc)
+        except (Exception, greenlet.GreenletExit) as exc:
+            # Jobs of a closed connection are released by the server
+            self.logger.warn("failed to release prefetched jobs: %s", exc)
+
+    def process_job(self, job_id, data, beanstalk, wait=True):
+        try:
+            event = self.safe_decode_job(job_id, data)
+            self.process_event(job_id, event, beanstalk, wait=wait)
+        except ConnectionError:
+            raise
+        except OioNetworkException as e:
+            self.logger.warn("handling event %s (bury): %s", job_id, e)
+            beanstalk.bury(job_id, wait=wait)
+        except ExplicitBury:
+            self.logger.info("handling event %s (bury)", job_id)
+            beanstalk.bury(job_id, wait=wait)
+        except Exception:
+            self.logger.exception("handling event %s (bury)", job_id)
+            beanstalk.bury(job_id, wait=wait)
+
+    def process_event(self, job_id, event, beanstalk, wait=True):
         handler = self.get_handler(event)
         if not handler:
             self.logger.warn('no handler found for %r' % event)
-            beanstalk.delete(job_id)
+            beanstalk.delete(job_id, wait=wait)
             return
 
         def cb(status, msg):
             if is_success(status):
-                beanstalk.delete(job_id)
+                beanstalk.delete(job_id, wait=wait)
             elif is_error(status):
                 self.logger.warn(
                     'event %s handling failure (release with delay): %s',
                     event['job_id'], msg)
-                beanstalk.release(job_id, delay=RELEASE_DELAY)
+                beanstalk.release(job_id, delay=RELEASE_DELAY, wait=wait)
 
         handler(event, cb)
 
@@ -14,7 +14,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from collections import OrderedDict
+
+import eventlet
 from eventlet import Timeout
+from eventlet.event import Event as GreenEvent
+from oio.common.easy_value import float_value, int_value
 from oio.common.exceptions import ClientException
 from oio.common.logger import get_logger
 from oio.account.client import AccountClient
@@ -24,12 +29,48 @@ from oio.event.filters.base import Filter
 
 
 ACCOUNT_TIMEOUT = 30
+# 0 disables coalescing: one container_update request per event
+COALESCE_WINDOW = 0.0
+COALESCE_MAX_BATCH = 256
 
 CONTAINER_EVENTS = [
         EventTypes.CONTAINER_STATE,
         EventTypes.CONTAINER_NEW,
         EventTypes.CONTAINER_DELETED]
 
+NO_UPDATE_NEEDED = "No update needed"
+
+
+def merge_container_update(old, new):
+    """
+    Merge two updates of the same container, so that applying the result
+    has the same effect as applying both updates, in any order.
+    """
+    if not old:
+        return dict(new)
+    merged = dict(old)
+    if new.get('dtime', 0) > merged.get('dtime', 0):
+        merged['dtime'] = new['dtime']
+    if 'mtime' in new and new['mtime'] >= merged.get('mtime', 0):
+        for key in ('mtime', 'bytes', 'objects'):
+            if key in new:
+                merged[key] = new[key]
+            else:
+                merged.pop(key, None)
+    return merged
+
+
+class _PendingBatch(object):
+    """Container updates waiting to be sent to the account service."""
+
+    def __init__(self):
+        self.updates = OrderedDict()
+        self.results = dict()
+        self.error = None
+        self.timer = None
+        self.flushing = False
+        self.done = GreenEvent()
+
 
 class AccountUpdateFilter(Filter):
 
@@ -38,23 +79,84 @@ class AccountUpdateFilter(Filter):
         super(AccountUpdateFilter, self).__init__(app, conf,
                                                   logger=self.logger, **kwargs)
         self.account = AccountClient(conf, logger=self.logger)
+        self.coalesce_window = float_value(
+            conf.get('coalesce_window'), COALESCE_WINDOW)
+        self.coalesce_max_batch = int_value(
+            conf.get('coalesce_max_batch'), COALESCE_MAX_BATCH)
+        self._batch = None
+
+    @staticmethod
+    def _container_update_body(event):
+        mtime = event.when / 1000000.0  # convert to seconds
+        data = event.data
+        body = dict()
+        if event.event_type == EventTypes.CONTAINER_STATE:
+            body['bytes'] = data.get('bytes-count', 0)
+            body['objects'] = data.get('object-count', 0)
+            body['mtime'] = mtime
+        elif event.event_type == EventTypes.CONTAINER_DELETED:
+            body['dtime'] = mtime
+        elif event.event_type == EventTypes.CONTAINER_NEW:
+            body['mtime'] = mtime
+        return body
+
+    def _flush(self, batch):
+        """Send a batch of updates, then wake up the events waiting for it."""
+        if batch.flushing:
+            return
+        batch.flushing = True
+        if self._batch is batch:
+            self._batch = None
+        if batch.timer is not None:
+            batch.timer.cancel()
+        updates = list()
+        for (account, container), body in batch.updates.iteritems():
+            update = dict(body)
+            update['account'] = account
+            update['name'] = container
+            updates.append(update)
+        try:
+            with Timeout(ACCOUNT_TIMEOUT):
+                results = self.account.container_batch_update(updates)
+            # Results come in the order of the updates
+            for key, res in zip(batch.updates.iterkeys(), results):
+                batch.results[key] = res
+        except (Exception, Timeout) as exc:
+            batch.error = exc
+        batch.done.send()
+
+    def _coalesce(self, account, container, body):
+        """
+        Add an update to the pending batch and wait for the batch
+        to be flushed.
+
+        :returns: the result of the update of the container
+        :raises: the error that prevented the batch to be sent
+        """
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _PendingBatch()
+            batch.timer = eventlet.spawn_after(self.coalesce_window,
+                                               self._flush, batch)
+        key = (account, container)
+        batch.updates[key] = merge_container_update(
+            batch.updates.get(key), body)
+        if len(batch.updates) >= self.coalesce_max_batch:
+            eventlet.spawn_n(self._flush, batch)
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results.get(
+            key, {'status': 500, 'message': 'no result for this container'})
 
     def process(self, env, cb):
         event = Event(env)
 
         if event.event_type in CONTAINER_EVENTS:
-            mtime = event.when / 1000000.0  # convert to seconds
-            data = event.data
             url = event.env.get('url')
-            body = dict()
-            if event.event_type == EventTypes.CONTAINER_STATE:
-                body['bytes'] = data.get('bytes-count', 0)
-                body['objects'] = data.get('object-count', 0)
-                body['mtime'] = mtime
-            elif event.event_type == EventTypes.CONTAINER_DELETED:
-                body['dtime'] = mtime
-            elif event.event_type == EventTypes.CONTAINER_NEW:
-                body['mtime'] = mtime
+            body = self._container_update_body(event)
+            if self.coalesce_window > 0:
+                return self._process_coalesced(event, url, body, env, cb)
             try:
                 with Timeout(ACCOUNT_TIMEOUT):
                     self.account.container_update(
@@ -65,7 +167,7 @@ class AccountUpdateFilter(Filter):
                 return resp(env, cb)
             except ClientException as exc:
                 if (exc.http_status == 409 and
-                        "No update needed" in exc.message):
+                        NO_UPDATE_NEEDED in exc.message):
                     self.logger.info("Discarding event %s (%s): %s",
                                      event.job_id,
                                      event.event_type,
@@ -76,6 +178,25 @@ class AccountUpdateFilter(Filter):
                     return resp(env, cb)
         return self.app(env, cb)
 
+    def _process_coalesced(self, event, url, body, env, cb):
+        try:
+            res = self._coalesce(url.get('account'), url.get('user'), body)
+        except (Exception, Timeout) as exc:
+            msg = 'account update failure: %s' % str(exc)
+            resp = EventError(event=Event(env), body=msg)
+            return resp(env, cb)
+        status = res.get('status')
+        if status == 409 and NO_UPDATE_NEEDED in res.get('message', ''):
+            self.logger.info("Discarding event %s (%s): %s",
+                             event.job_id, event.event_type,
+                             res.get('message'))
+        elif not 200 <= status < 300:
+            msg = 'account update failure: %s (HTTP %s)' % (
+                res.get('message'), status)
+            resp = EventError(event=Event(env), body=msg)
+            return resp(env, cb)
+        return self.app(env, cb)
+
 
 def filter_factory(global_conf, **local_conf):
     conf = global_conf.copy()
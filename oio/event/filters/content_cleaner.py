@@ -14,9 +14,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from collections import OrderedDict
 from urlparse import urlparse
-from eventlet import Timeout, GreenPile
-from oio.common.http_eventlet import http_connect
+from eventlet import Timeout, GreenPile, GreenPool
+from eventlet.semaphore import Semaphore
+from oio.api.io import http_connect
+from oio.common.easy_value import int_value
 from oio.event.evob import Event
 from oio.event.consumer import EventTypes
 from oio.event.filters.base import Filter
@@ -27,43 +30,103 @@ from oio.common.storage_method import STORAGE_METHODS, guess_storage_method
 from oio.common.utils import request_id
 
 CHUNK_TIMEOUT = 60
-PARALLEL_CHUNKS_DELETE = 3
+# chunk deletions running at the same time, for all events
+DELETE_CONCURRENCY = 64
+# chunk deletions running at the same time on each rawx service
+RAWX_DELETE_CONCURRENCY = 4
 NB_TRIES = 3
 
 
+def _group_by_host(chunks):
+    """Group chunks by the service hosting them, keeping their order."""
+    by_host = OrderedDict()
+    for chunk in chunks:
+        by_host.setdefault(urlparse(chunk['id']).netloc, list()).append(chunk)
+    return by_host
+
+
 class ContentReaperFilter(Filter):
     """Filter that deletes chunks on content deletion events"""
 
     def __init__(self, *args, **kwargs):
         super(ContentReaperFilter, self).__init__(*args, **kwargs)
+        # Shared by all the events processed by this worker process
+        self.delete_pool = GreenPool(int_value(
+            self.conf.get('delete_concurrency'), DELETE_CONCURRENCY))
+        self.rawx_delete_concurrency = int_value(
+            self.conf.get('rawx_delete_concurrency'),
+            RAWX_DELETE_CONCURRENCY)
+        self._rawx_semaphores = dict()
         self.handlers = {
                 "plain": self._handle_rawx,
                 "ec": self._handle_rawx,
                 "backblaze": self._handle_b2,
         }
 
+    def _rawx_semaphore(self, host):
+        sem = self._rawx_semaphores.get(host)
+        if sem is None:
+            sem = Semaphore(self.rawx_delete_concurrency)
+            self._rawx_semaphores[host] = sem
+        return sem
+
     def delete_chunk(self, chunk, cid, reqid):
         resp = None
         parsed = urlparse(chunk['id'])
         headers = {'X-oio-req-id': reqid,
                    'X-oio-chunk-meta-container-id': cid}
+        conn = None
         try:
             with Timeout(CHUNK_TIMEOUT):
                 conn = http_connect(parsed.netloc, 'DELETE', parsed.path,
                                     headers=headers)
                 resp = conn.getresponse()
+                resp.read()
                 resp.chunk = chunk
         except (Exception, Timeout) as exc:
             self.logger.warn(
                 'error while deleting chunk %s "%s"',
                 chunk['id'], str(exc.message))
+        finally:
+            # Give the connection back to the pool
+            if conn is not None:
+                conn.close()
         return resp
 
+    def _delete_chunk_and_release(self, semaphore, chunk, cid, reqid):
+        try:
+            return self.delete_chunk(chunk, cid, reqid)
+        finally:
+            semaphore.release()
+
+    def _feed_host(self, pile, host, chunks, cid, reqid):
+        """
+        Spawn the deletions of `chunks`, all hosted by `host`,
+        in the shared pool. The semaphore of the host is taken before
+        spawning, so that a deletion waiting for a busy service
+        never holds a slot of the shared pool.
+        """
+        semaphore = self._rawx_semaphore(host)
+        for chunk in chunks:
+            semaphore.acquire()
+            try:
+                pile.spawn(self._delete_chunk_and_release,
+                           semaphore, chunk, cid, reqid)
+            except Exception:
+                semaphore.release()
+                raise
+
     def _handle_rawx(self, url, chunks, headers, storage_method, reqid):
-        pile = GreenPile(PARALLEL_CHUNKS_DELETE)
+        pile = GreenPile(self.delete_pool)
         cid = url.get('id')
-        for chunk in chunks:
-            pile.spawn(self.delete_chunk, chunk, cid, reqid)
+        by_host = _group_by_host(chunks)
+        # One feeder per service, so a busy service
+        # does not delay the deletions on the others.
+        feeders = GreenPool(max(1, len(by_host)))
+        for host, host_chunks in by_host.iteritems():
+            feeders.spawn(self._feed_host, pile, host, host_chunks,
+                          cid, reqid)
+        feeders.waitall()
         resps = [resp for resp in pile if resp]
         for resp in resps:
             if resp.status != 204:
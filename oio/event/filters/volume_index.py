@@ -14,26 +14,50 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from eventlet import spawn_after
+from eventlet.event import Event as GreenEvent
+
 from oio.event.evob import Event, EventError
 from oio.event.consumer import EventTypes
 from oio.event.filters.base import Filter
-from oio.common.exceptions import OioNetworkException, OioException
+from oio.common.easy_value import float_value, int_value
+from oio.common.exceptions import OioNetworkException, OioException, \
+    ServerException, from_status
 
 
 CHUNK_EVENTS = [EventTypes.CHUNK_DELETED, EventTypes.CHUNK_NEW]
 
+# Maximum number of records sent to the rdir in one request
+DEFAULT_BATCH_SIZE = 100
+# Maximum delay (in seconds) a record waits for its batch to fill up
+DEFAULT_BATCH_DELAY = 0.01
+
 
 class VolumeIndexFilter(Filter):
+    """
+    Reference the new chunks and unreference the deleted ones
+    in the reverse directory of their volume.
+
+    The records of the events processed concurrently are gathered
+    into batches, sent to the rdir with one request per batch.
+    """
 
     _attempts_push = 3
     _attempts_delete = 3
 
-    def _chunk_delete(self,
-                      volume_id, container_id, content_id, chunk_id):
+    def init(self):
+        self.batch_size = int_value(
+            self.conf.get('batch_size'), DEFAULT_BATCH_SIZE)
+        self.batch_delay = float_value(
+            self.conf.get('batch_delay'), DEFAULT_BATCH_DELAY)
+        # (action, volume_id) -> (records, waiters, flush timer)
+        self._batches = dict()
+
+    def _chunk_delete_many(self, volume_id, records):
         for i in range(self.__class__._attempts_delete):
             try:
-                return self.app.rdir.chunk_delete(
-                        volume_id, container_id, content_id, chunk_id)
+                return self.app.rdir.chunk_delete_many(
+                        volume_id, records, batch_size=self.batch_size)
             except OioNetworkException:
                 # TODO(jfs): detect the case of a connection timeout
                 if i >= self.__class__._attempts_delete - 1:
@@ -42,37 +66,75 @@ class VolumeIndexFilter(Filter):
                 # management of polled connection that is closed on the
                 # other side.
 
-    def _chunk_push(self,
-                    volume_id, container_id, content_id, chunk_id,
-                    args):
+    def _chunk_push_many(self, volume_id, records):
         for i in range(self.__class__._attempts_push):
             try:
-                return self.app.rdir.chunk_push(
-                        volume_id, container_id, content_id, chunk_id, **args)
+                return self.app.rdir.chunk_push_many(
+                        volume_id, records, batch_size=self.batch_size)
             except OioNetworkException:
                 # TODO(jfs): detect the case of a connection timeout
                 if i >= self.__class__._attempts_push - 1:
                     raise
                 # idem
 
+    def _flush(self, key):
+        batch = self._batches.pop(key, None)
+        if not batch:
+            return
+        records, waiters, timer = batch
+        timer.cancel()
+        action, volume_id = key
+        try:
+            if action == EventTypes.CHUNK_DELETED:
+                statuses = self._chunk_delete_many(volume_id, records)
+            else:
+                statuses = self._chunk_push_many(volume_id, records)
+        except Exception as exc:
+            for waiter in waiters:
+                waiter.send_exception(exc)
+            return
+        statuses = list(statuses or ())
+        for waiter, status in zip(waiters, statuses):
+            waiter.send(status)
+        if len(statuses) != len(waiters):
+            # Never leave a waiter blocked, even on a truncated reply
+            exc = ServerException(
+                "rdir returned %d statuses for %d records" %
+                (len(statuses), len(waiters)))
+            for waiter in waiters[len(statuses):]:
+                waiter.send_exception(exc)
+
+    def _submit(self, action, volume_id, record):
+        """
+        Add `record` to the batch of `action` on `volume_id`,
+        and wait for the batch to be sent.
+        """
+        key = (action, volume_id)
+        batch = self._batches.get(key)
+        if batch is None:
+            timer = spawn_after(self.batch_delay, self._flush, key)
+            batch = self._batches[key] = (list(), list(), timer)
+        waiter = GreenEvent()
+        batch[0].append(record)
+        batch[1].append(waiter)
+        if len(batch[0]) >= self.batch_size:
+            self._flush(key)
+        status = waiter.wait()
+        if status.get('status', 200) // 100 != 2:
+            raise from_status(status.get('status'), status.get('message'))
+
     def process(self, env, cb):
         event = Event(env)
         if event.event_type in CHUNK_EVENTS:
             data = event.data
             volume_id = data.get('volume_id')
-            container_id = data.get('container_id')
-            content_id = data.get('content_id')
-            chunk_id = data.get('chunk_id')
+            record = {'container_id': data.get('container_id'),
+                      'content_id': data.get('content_id'),
+                      'chunk_id': data.get('chunk_id')}
+            if event.event_type == EventTypes.CHUNK_NEW:
+                record['mtime'] = event.when / 1000000  # seconds
             try:
-                if event.event_type == EventTypes.CHUNK_DELETED:
-                    self._chunk_delete(
-                        volume_id, container_id, content_id, chunk_id)
-                else:
-                    args = {
-                        'mtime': event.when / 1000000,  # seconds
-                    }
-                    self._chunk_push(
-                        volume_id, container_id, content_id, chunk_id, args)
+                self._submit(event.event_type, volume_id, record)
             except OioException as exc:
                 resp = EventError(event=event,
                                   body="rdir update error: %s" % exc)
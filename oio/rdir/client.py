@@ -13,22 +13,50 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from eventlet import GreenPool
+
 from oio.api.base import HttpApi
 from oio.common.exceptions import ClientException, NotFound, VolumeException
-from oio.common.exceptions import ServiceUnavailable, ServerException
+from oio.common.exceptions import ServiceUnavailable
 from oio.common.exceptions import OioNetworkException
+from oio.common.cache import LruTtlCache
+from oio.common.easy_value import float_value, int_value
 from oio.common.logger import get_logger
 from oio.conscience.client import ConscienceClient
 from oio.directory.client import DirectoryClient
+from oio.directory.meta0 import PrefixMapping
 
 
 RDIR_ACCT = '_RDIR'
+# Maximum number of records sent in one batch request
+RDIR_BATCH_SIZE = 500
+# Maximum number of volumes whose rdir address is cached
+RDIR_CACHE_SIZE = 4096
+# Time (in seconds) an rdir address is cached
+RDIR_CACHE_TTL = 300.0
+# Time (in seconds) a volume without rdir is remembered as such
+RDIR_CACHE_NEGATIVE_TTL = 10.0
+# Number of rawx services handled in parallel while assigning rdir services
+RDIR_ASSIGN_CONCURRENCY = 16
+# Minimum distance between the locations of a rawx and its rdir service
+RDIR_MIN_DIST = 1
 
 
 def _make_id(ns, type_, addr):
     return "%s|%s|%s" % (ns, type_, addr)
 
 
+def _make_batches(records, batch_size):
+    batch = list()
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
 def _filter_rdir_host(allsrv):
     for srv in allsrv.get('srv', {}):
         if srv['type'] == 'rdir':
@@ -43,6 +71,9 @@ class RdirDispatcher(object):
         self.logger = get_logger(conf)
         self.directory = DirectoryClient(conf, logger=self.logger, **kwargs)
         self.rdir = RdirClient(conf, logger=self.logger, **kwargs)
+        self.concurrency = int_value(conf.get('concurrency'),
+                                     RDIR_ASSIGN_CONCURRENCY)
+        self.min_dist = int_value(conf.get('rdir_min_dist'), RDIR_MIN_DIST)
         self._cs = None
 
     @property
@@ -51,36 +82,60 @@ class RdirDispatcher(object):
             self._cs = ConscienceClient(self.conf, logger=self.logger)
         return self._cs
 
+    def _lookup_rdir_hosts(self, all_rawx):
+        """
+        Resolve concurrently the rdir service linked to each rawx service.
+
+        :returns: a list of (rawx, rdir host) tuples, in the order of
+            `all_rawx`, the rdir host being the lookup error if any
+        """
+        def _lookup(rawx):
+            try:
+                resp = self.directory.list(RDIR_ACCT, rawx['addr'],
+                                           service_type='rdir')
+                return rawx, _filter_rdir_host(resp)
+            except ClientException as exc:
+                return rawx, exc
+
+        pool = GreenPool(self.concurrency)
+        return list(pool.imap(_lookup, all_rawx))
+
     def get_assignation(self):
         all_rawx = self.cs.all_services('rawx')
         all_rdir = self.cs.all_services('rdir', True)
         by_id = {_make_id(self.ns, 'rdir', x['addr']): x
                  for x in all_rdir}
 
-        for rawx in all_rawx:
-            try:
-                # Verify that there is no rdir linked
-                resp = self.directory.list(RDIR_ACCT, rawx['addr'],
-                                           service_type='rdir')
-                rdir_host = _filter_rdir_host(resp)
-                try:
-                    rawx['rdir'] = by_id[_make_id(self.ns, 'rdir', rdir_host)]
-                except KeyError:
-                    self.logger.warn("rdir %s linked to rawx %s seems down",
-                                     rdir_host, rawx['addr'])
-                    rawx['rdir'] = {"addr": rdir_host, "tags": dict()}
-                    by_id[_make_id(self.ns, 'rdir', rdir_host)] = rawx['rdir']
-            except NotFound:
+        for rawx, rdir_host in self._lookup_rdir_hosts(all_rawx):
+            if isinstance(rdir_host, NotFound):
                 self.logger.info("No rdir linked to %s", rawx['addr'])
+                continue
+            elif isinstance(rdir_host, Exception):
+                raise rdir_host
+            try:
+                rawx['rdir'] = by_id[_make_id(self.ns, 'rdir', rdir_host)]
+            except KeyError:
+                self.logger.warn("rdir %s linked to rawx %s seems down",
+                                 rdir_host, rawx['addr'])
+                rawx['rdir'] = {"addr": rdir_host, "tags": dict()}
+                by_id[_make_id(self.ns, 'rdir', rdir_host)] = rawx['rdir']
         return all_rawx, all_rdir
 
-    def assign_all_rawx(self, max_per_rdir=None):
+    def assign_all_rawx(self, max_per_rdir=None, min_dist=None):
         """
         Find a rdir service for all rawx that don't have one already.
 
+        The existing links are resolved concurrently, then the new
+        assignments are computed locally, in a deterministic order,
+        and finally the new links are applied concurrently.
+
         :param max_per_rdir: maximum number or rawx services that an rdir
                              can be linked to
         :type max_per_rdir: `int`
+        :param min_dist: minimum distance between the locations of a rawx
+                         and its rdir service (defaults to the
+                         'rdir_min_dist' configuration value)
+        :type min_dist: `int`
         """
         all_rawx = self.cs.all_services('rawx')
         all_rdir = self.cs.all_services('rdir', True)
@@ -90,83 +145,90 @@ class RdirDispatcher(object):
         by_id = {_make_id(self.ns, 'rdir', x['addr']): x
                  for x in all_rdir}
 
-        for rawx in all_rawx:
+        unassigned = list()
+        for rawx, rdir_host in self._lookup_rdir_hosts(all_rawx):
+            if isinstance(rdir_host, Exception):
+                unassigned.append(rawx)
+                continue
             try:
-                # Verify that there is no rdir linked
-                resp = self.directory.list(RDIR_ACCT, rawx['addr'],
-                                           service_type='rdir')
-                rdir_host = _filter_rdir_host(resp)
-                try:
-                    rawx['rdir'] = by_id[_make_id(self.ns, 'rdir', rdir_host)]
-                except KeyError:
-                    self.logger.warn("rdir %s linked to rawx %s seems down",
-                                     rdir_host, rawx['addr'])
-            except (NotFound, ClientException):
-                if rawx['score'] <= 0:
-                    self.logger.warn("rawx %s has score %s, and thus cannot be"
-                                     " affected a rdir (load balancer "
-                                     "limitation)",
-                                     rawx['addr'], rawx['score'])
-                    continue
-                rdir = self._smart_link_rdir(rawx['addr'], all_rdir,
-                                             max_per_rdir)
-                n_bases = by_id[rdir]['tags'].get("stat.opened_db_count", 0)
-                by_id[rdir]['tags']["stat.opened_db_count"] = n_bases + 1
-                rawx['rdir'] = by_id[rdir]
+                rawx['rdir'] = by_id[_make_id(self.ns, 'rdir', rdir_host)]
+            except KeyError:
+                self.logger.warn("rdir %s linked to rawx %s seems down",
+                                 rdir_host, rawx['addr'])
+
+        links = list()
+        error = None
+        for rawx in sorted(unassigned, key=lambda x: x['addr']):
+            if rawx['score'] <= 0:
+                self.logger.warn("rawx %s has score %s, and thus cannot be"
+                                 " affected a rdir (load balancer "
+                                 "limitation)",
+                                 rawx['addr'], rawx['score'])
+                continue
+            try:
+                rdir = self._select_rdir(rawx, all_rdir, max_per_rdir,
+                                         min_dist)
+            except ClientException as exc:
+                self.logger.warn("Failed to assign a rdir to rawx %s: %s",
+                                 rawx['addr'], exc)
+                error = error or exc
+                continue
+            n_bases = rdir['tags'].get("stat.opened_db_count", 0)
+            rdir['tags']["stat.opened_db_count"] = n_bases + 1
+            rawx['rdir'] = rdir
+            links.append((rawx['addr'], rdir))
+
+        pool = GreenPool(self.concurrency)
+        for _ in pool.starmap(self._link_rdir, links):
+            pass
+        if error:
+            raise error
         return all_rawx
 
-    def _smart_link_rdir(self, volume_id, all_rdir, max_per_rdir=None):
+    def _select_rdir(self, rawx, all_rdir, max_per_rdir=None,
+                     min_dist=None):
         """
-        Force the load balancer to avoid services that already host more
-        bases than the average (or more than `max_per_rdir`)
-        while selecting rdir services.
+        Select the rdir service hosting the fewest bases (or less than
+        `max_per_rdir`), at a distance of at least `min_dist` from
+        the location of the rawx service (as the load balancer would).
+        Ties are broken by address, so the selection is deterministic.
         """
-        opened_db = [x['tags']['stat.opened_db_count'] for x in all_rdir
-                     if x['score'] > 0]
-        if len(opened_db) <= 0:
-            raise ServiceUnavailable(
-                    "No valid rdir service found in %s" % self.ns)
-        if not max_per_rdir:
-            upper_limit = sum(opened_db) / float(len(opened_db))
-        else:
-            upper_limit = max_per_rdir - 1
-        avoids = [_make_id(self.ns, "rdir", x['addr'])
-                  for x in all_rdir
-                  if x['score'] > 0 and
-                  x['tags']['stat.opened_db_count'] > upper_limit]
-        known = [_make_id(self.ns, "rawx", volume_id)]
-        try:
-            polled = self._poll_rdir(avoid=avoids, known=known)
-        except ClientException as exc:
-            if exc.status != 481 or max_per_rdir:
-                raise
-            # Retry without `avoids`, hoping the next iteration will rebalance
-            polled = self._poll_rdir(known=known)
-        forced = {'host': polled['addr'], 'type': 'rdir',
-                  'seq': 1, 'args': "", 'id': polled['id']}
+        if min_dist is None:
+            min_dist = self.min_dist
+        rawx_loc = rawx['tags'].get('tag.loc')
+        candidates = list()
+        for rdir in all_rdir:
+            n_bases = rdir['tags'].get('stat.opened_db_count', 0)
+            if rdir['score'] <= 0:
+                continue
+            rdir_loc = rdir['tags'].get('tag.loc')
+            if rawx_loc and rdir_loc and PrefixMapping.dist_between(
+                    rawx_loc, rdir_loc) < min_dist:
+                continue
+            if max_per_rdir and n_bases >= max_per_rdir:
+                continue
+            candidates.append((n_bases, rdir['addr'], rdir))
+        if not candidates:
+            # Same status as the load balancer of the proxy
+            raise ClientException(
+                503, status=481,
+                message="No valid rdir service found for %s in %s" %
+                (rawx['addr'], self.ns))
+        return min(candidates)[2]
+
+    def _link_rdir(self, volume_id, rdir):
+        """Link `rdir` to the volume, and create its database there."""
+        forced = {'host': rdir['addr'], 'type': 'rdir', 'seq': 1,
+                  'args': "", 'id': _make_id(self.ns, 'rdir', rdir['addr'])}
         self.directory.force(RDIR_ACCT, volume_id, 'rdir',
                              forced, autocreate=True)
+        # Forget any previous (or missing) assignment
+        self.rdir._clear_cache(volume_id)
         try:
             self.rdir.create(volume_id)
         except Exception as exc:
             self.logger.warn("Failed to create database for %s on %s: %s",
-                             volume_id, polled['addr'], exc)
-        return polled['id']
-
-    def _poll_rdir(self, avoid=None, known=None):
-        """Call the special rdir service pool (created if missing)"""
-        try:
-            svcs = self.cs.poll('__rawx_rdir', avoid=avoid, known=known)
-        except ClientException as exc:
-            if exc.status != 400:
-                raise
-            self.cs.lb.create_pool('__rawx_rdir', ((1, 'rawx'), (1, 'rdir')))
-            svcs = self.cs.poll('__rawx_rdir', avoid=avoid, known=known)
-        for svc in svcs:
-            # FIXME: we should include the service type in a dedicated field
-            if 'rdir' in svc['id']:
-                return svc
-        raise ServerException("LB returned incoherent result: %s" % svcs)
+                             volume_id, rdir['addr'], exc)
 
 
 class RdirClient(HttpApi):
@@ -177,25 +239,40 @@ class RdirClient(HttpApi):
     def __init__(self, conf, **kwargs):
         super(RdirClient, self).__init__(conf, **kwargs)
         self.directory = DirectoryClient(conf, **kwargs)
-        self._addr_cache = dict()
+        self._addr_cache = LruTtlCache(
+            max_size=int_value(conf.get('rdir_cache_size'),
+                               RDIR_CACHE_SIZE),
+            ttl=float_value(conf.get('rdir_cache_ttl'), RDIR_CACHE_TTL))
+        self._negative_ttl = float_value(
+            conf.get('rdir_cache_negative_ttl'), RDIR_CACHE_NEGATIVE_TTL)
 
     def _clear_cache(self, volume_id):
-        del self._addr_cache[volume_id]
+        self._addr_cache.invalidate(volume_id)
+
+    def cache_stats(self):
+        """Get the counters of the cache of rdir addresses."""
+        return self._addr_cache.stats()
 
     def _get_rdir_addr(self, volume_id):
         # Initial lookup in the cache
-        if volume_id in self._addr_cache:
-            return self._addr_cache[volume_id]
+        host = self._addr_cache.get(volume_id)
+        if isinstance(host, VolumeException):
+            raise host
+        if host:
+            return host
         # Not cached, try a direct lookup
         try:
             resp = self.directory.list(RDIR_ACCT, volume_id,
                                        service_type='rdir')
             host = _filter_rdir_host(resp)
             # Add the new service to the cache
-            self._addr_cache[volume_id] = host
+            self._addr_cache.set(volume_id, host)
             return host
         except NotFound:
-            raise VolumeException('No rdir assigned to volume %s' % volume_id)
+            exc = VolumeException('No rdir assigned to volume %s' % volume_id)
+            # Remember it for a short time, to avoid hammering the meta1
+            self._addr_cache.set(volume_id, exc, ttl=self._negative_ttl)
+            raise exc
 
     def _make_uri(self, action, volume_id):
         rdir_host = self._get_rdir_addr(volume_id)
@@ -212,6 +289,11 @@ class RdirClient(HttpApi):
         except OioNetworkException:
             self._clear_cache(volume)
             raise
+        except ClientException as exc:
+            # The rdir may have been replaced, look it up again next time
+            if exc.http_status >= 500:
+                self._clear_cache(volume)
+            raise
 
         return resp, body
 
@@ -240,8 +322,55 @@ class RdirClient(HttpApi):
 
         self._rdir_request(volume_id, 'DELETE', 'delete', json=body)
 
+    def _chunk_batch(self, volume_id, method, action, records, batch_size,
+                     **kwargs):
+        statuses = list()
+        for batch in _make_batches(records, batch_size):
+            _, resp_body = self._rdir_request(volume_id, method, action,
+                                              json=batch, **kwargs)
+            statuses.extend(resp_body)
+        return statuses
+
+    def chunk_push_many(self, volume_id, chunks, batch_size=RDIR_BATCH_SIZE,
+                        **data):
+        """
+        Reference several chunks in the reverse directory,
+        with one request per batch of `batch_size` chunks.
+
+        :param chunks: an iterable of dictionaries, with at least
+            'container_id', 'content_id' and 'chunk_id' fields
+        :keyword data: fields to set on each chunk (e.g. 'mtime'),
+            unless already present in the chunk's dictionary
+        :returns: the list of statuses, one per chunk and in the same
+            order, as dictionaries with 'status' and 'message' fields
+        """
+        def _records():
+            for chunk in chunks:
+                record = dict(data)
+                record.update(chunk)
+                yield record
+        return self._chunk_batch(volume_id, 'POST', 'push', _records(),
+                                 batch_size, create=True)
+
+    def chunk_delete_many(self, volume_id, chunks,
+                          batch_size=RDIR_BATCH_SIZE):
+        """
+        Unreference several chunks from the reverse directory,
+        with one request per batch of `batch_size` chunks.
+
+        :param chunks: an iterable of dictionaries, with
+            'container_id', 'content_id' and 'chunk_id' fields
+        :returns: the list of statuses, one per chunk and in the same
+            order, as dictionaries with 'status' and 'message' fields
+        """
+        records = ({'container_id': chunk['container_id'],
+                    'content_id': chunk['content_id'],
+                    'chunk_id': chunk['chunk_id']} for chunk in chunks)
+        return self._chunk_batch(volume_id, 'DELETE', 'delete', records,
+                                 batch_size)
+
     def chunk_fetch(self, volume, limit=100, rebuild=False,
-                    container_id=None):
+                    container_id=None, start_after=None):
         """
         Fetch the list of chunks belonging to the specified volume.
 
@@ -254,12 +383,17 @@ class RdirClient(HttpApi):
         :keyword container_id: get only chunks belonging to
            the specified container
         :type container_id: `str`
+        :keyword start_after: get only chunks after this one,
+           given as 'container_id|content_id|chunk_id'
+        :type start_after: `str`
         """
         req_body = {'limit': limit}
         if rebuild:
             req_body['rebuild'] = True
         if container_id:
             req_body['container_id'] = container_id
+        if start_after:
+            req_body['start_after'] = start_after
 
         while True:
             resp, resp_body = self._rdir_request(volume, 'POST', 'fetch',
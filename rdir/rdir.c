@@ -501,6 +501,27 @@ _db_vol_push(const char *volid, gboolean autocreate, GString *key,
 	return _map_errno_to_gerror(errno, errmsg);
 }
 
+static GError *
+_db_vol_write(const char *volid, gboolean autocreate,
+		leveldb_writebatch_t *batch)
+{
+	struct rdir_base_s *base = NULL;
+	GError *err = _db_get(volid, autocreate, &base);
+	if (err)
+		return err;
+
+	char *errmsg = NULL;
+
+	leveldb_writeoptions_t *options = leveldb_writeoptions_create();
+	leveldb_writeoptions_set_sync(options, 0);
+	leveldb_write(base->base, options, batch, &errmsg);
+	leveldb_writeoptions_destroy(options);
+
+	if (!errmsg)
+		return NULL;
+	return _map_errno_to_gerror(errno, errmsg);
+}
+
 static GError *
 _db_vol_fetch(const char *volid, GString *value,
 		const char *start_after, gint64 limit, gboolean rebuild,
@@ -956,6 +977,63 @@ _request_to_key(struct json_object *jbody, GString **pkey)
 	return NULL;
 }
 
+/* Apply a batch of records, all at once in the database. The reply holds
+ * one status per record, in the order of the request. Malformed records
+ * are reported and skipped, they do not prevent the others to be applied.
+ * An error from the database fails the whole batch. */
+static enum http_rc_e
+_route_vol_batch(struct req_args_s *args, struct json_object *jbody,
+		const char *volid, gboolean autocreate, gboolean do_delete)
+{
+	GError *err = NULL;
+	const int count = json_object_array_length(jbody);
+	GString *value = g_string_sized_new(1024);
+	GString *statuses = g_string_sized_new(64 * (count + 1));
+	leveldb_writebatch_t *batch = leveldb_writebatch_create();
+
+	g_string_append_c(statuses, '[');
+	for (int i = 0; i < count; i++) {
+		struct json_object *jrecord = json_object_array_get_idx(jbody, i);
+		struct rdir_record_s rec = {0};
+
+		if (i > 0)
+			g_string_append_c(statuses, ',');
+		g_string_append_c(statuses, '{');
+		if (!json_object_is_type(jrecord, json_type_object))
+			err = BADREQ("record is not an object");
+		else
+			err = _record_extract(&rec, jrecord);
+		if (err) {
+			_append_status(statuses, err->code, err->message);
+			g_clear_error(&err);
+		} else {
+			GString *key = _record_to_key(&rec);
+			if (do_delete) {
+				leveldb_writebatch_delete(batch, key->str, key->len);
+			} else {
+				g_string_set_size(value, 0);
+				_record_encode(&rec, value);
+				leveldb_writebatch_put(batch,
+						key->str, key->len, value->str, value->len);
+			}
+			g_string_free(key, TRUE);
+			_append_status(statuses, CODE_FINAL_OK, "OK");
+		}
+		g_string_append_c(statuses, '}');
+	}
+	g_string_append_c(statuses, ']');
+
+	err = _db_vol_write(volid, autocreate, batch);
+	leveldb_writebatch_destroy(batch);
+	g_string_free(value, TRUE);
+
+	if (err) {
+		g_string_free(statuses, TRUE);
+		return _reply_common_error(args->rp, err);
+	}
+	return _reply_ok(args->rp, statuses);
+}
+
 static enum http_rc_e
 _route_vol_delete(struct req_args_s *args, struct json_object *jbody,
 		const char *volid)
@@ -964,6 +1042,9 @@ _route_vol_delete(struct req_args_s *args, struct json_object *jbody,
 	if (!volid)
 		return _reply_format_error(args->rp, BADREQ("no volume id"));
 
+	if (jbody && json_object_is_type(jbody, json_type_array))
+		return _route_vol_batch(args, jbody, volid, FALSE, TRUE);
+
 	/* extraction of the parameters */
 	GError *err = NULL;
 	GString *key = NULL;
@@ -983,13 +1064,18 @@ static enum http_rc_e
 _route_vol_push(struct req_args_s *args, struct json_object *jbody,
 		const char *volid, const char *str_autocreate)
 {
-	if (!jbody || !json_object_is_type(jbody, json_type_object))
+	if (!jbody)
 		return _reply_format_error(args->rp, BADREQ("null body"));
 	if (!volid)
 		return _reply_format_error(args->rp, BADREQ("no volume id"));
 
 	gboolean autocreate = oio_str_parse_bool(str_autocreate, FALSE);
 
+	if (json_object_is_type(jbody, json_type_array))
+		return _route_vol_batch(args, jbody, volid, autocreate, FALSE);
+	if (!json_object_is_type(jbody, json_type_object))
+		return _reply_format_error(args->rp, BADREQ("null body"));
+
 	/* extract all the record's fields */
 	GError *err = NULL;
 	struct rdir_record_s rec = {0};
@@ -333,6 +333,31 @@ class TestAccountBackend(BaseTestCase):
         self.assertEqual(
             self.conn.ttl('container:%s:%s' % (account_id, name)), -1)
 
+    def test_update_containers(self):
+        backend = AccountBackend({}, self.conn)
+        account_id = 'test'
+        self.assertEqual(backend.create_account(account_id), account_id)
+        mtime = Timestamp(time()).normal
+
+        updates = [
+            {'account': account_id, 'name': 'c1', 'mtime': mtime,
+             'objects': 1, 'bytes': 10},
+            {'account': account_id, 'name': 'c2', 'mtime': mtime,
+             'objects': 2, 'bytes': 20},
+            {'account': account_id, 'name': 'c1', 'mtime': mtime,
+             'objects': 1, 'bytes': 10},
+            {'account': None, 'name': 'c3', 'mtime': mtime}]
+        res = backend.update_containers(updates)
+        self.assertEqual([200, 200, 409, 400],
+                         [r['status'] for r in res])
+        self.assertEqual(['c1', 'c2', 'c1', 'c3'], [r['name'] for r in res])
+        self.assertIn('message', res[2])
+
+        info = backend.info_account(account_id)
+        self.assertEqual(2, info['containers'])
+        self.assertEqual(3, info['objects'])
+        self.assertEqual(30, info['bytes'])
+
     def test_list_containers(self):
         backend = AccountBackend({}, self.conn)
         account_id = 'test'
@@ -106,6 +106,18 @@ class TestAccountClient(BaseTestCase):
                 return
         self.fail("No container container1")
 
+    def test_container_batch_update(self):
+        mtime = time.time()
+        updates = [{'account': self.account_id, 'name': 'container1',
+                    'mtime': mtime, 'objects': 12, 'bytes': 42},
+                   {'account': self.account_id, 'name': 'container2',
+                    'mtime': mtime, 'objects': 1, 'bytes': 2}]
+        results = self.account_client.container_batch_update(updates)
+        self.assertEqual([200, 200], [r['status'] for r in results])
+        resp = self.account_client.account_show(self.account_id)
+        self.assertEqual(13, resp['objects'])
+        self.assertEqual(44, resp['bytes'])
+
     def test_account_refresh(self):
         metadata = dict()
         metadata["mtime"] = time.time()
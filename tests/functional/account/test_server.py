@@ -77,6 +77,25 @@ class TestAccountServer(BaseTestCase):
                              data=data, query_string={'id': self.account_id})
         self.assertEqual(resp.status_code, 200)
 
+    def test_account_container_batch_update(self):
+        mtime = Timestamp(time()).normal
+        data = {'containers': [
+            {'account': self.account_id, 'name': 'foo', 'mtime': mtime,
+             'objects': 1, 'bytes': 1},
+            {'account': self.account_id, 'name': 'foo', 'mtime': mtime,
+             'objects': 1, 'bytes': 1},
+            {'account': self.account_id, 'name': 'bar',
+             'mtime': 'not a timestamp'}]}
+        resp = self.app.post('/v1.0/account/container/batch_update',
+                             data=json.dumps(data))
+        self.assertEqual(resp.status_code, 200)
+        results = self.json_loads(resp.data)['containers']
+        self.assertEqual([200, 409, 400], [r['status'] for r in results])
+
+        resp = self.app.post('/v1.0/account/container/batch_update',
+                             data=json.dumps({}))
+        self.assertEqual(resp.status_code, 400)
+
     def test_account_containers(self):
         args = {'id': self.account_id}
         resp = self.app.post('/v1.0/account/containers',
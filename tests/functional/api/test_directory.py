@@ -295,3 +295,14 @@ class TestDirectoryAPI(BaseTestCase):
         print "Current repartition: ", by_rdir
         for count in by_rdir.itervalues():
             self.assertLessEqual(count, avg + 1)
+
+    def test_rdir_assignation_idempotent(self):
+        client = RdirDispatcher({'namespace': self.ns})
+        first = {rawx['addr']: rawx['rdir']['addr']
+                 for rawx in client.assign_all_rawx()}
+        second = {rawx['addr']: rawx['rdir']['addr']
+                  for rawx in client.assign_all_rawx()}
+        self.assertEqual(first, second)
+        all_rawx, _ = client.get_assignation()
+        self.assertEqual(first, {rawx['addr']: rawx['rdir']['addr']
+                                 for rawx in all_rawx})
@@ -141,7 +141,7 @@ class TestECContent(BaseTestCase):
     def test_create_6294503_bytes(self):
         self._test_create(6294503)
 
-    def _test_rebuild(self, data_size, broken_pos_list):
+    def _test_rebuild(self, data_size, broken_pos_list, together=False):
         # generate test data
         data = os.urandom(data_size)
         # create initial content
@@ -158,6 +158,7 @@ class TestECContent(BaseTestCase):
 
         # break the content
         old_info = {}
+        chunk_ids_to_rebuild = []
         for pos in broken_pos_list:
             old_info[pos] = {}
             c = uploaded_content.chunks.filter(pos=pos)[0]
@@ -171,8 +172,15 @@ class TestECContent(BaseTestCase):
             # delete the chunk
             self.blob_client.chunk_delete(c.url)
 
-            # rebuild the broken chunks
-            uploaded_content.rebuild_chunk(chunk_id_to_rebuild)
+            if together:
+                chunk_ids_to_rebuild.append(chunk_id_to_rebuild)
+            else:
+                # rebuild the broken chunks
+                uploaded_content.rebuild_chunk(chunk_id_to_rebuild)
+
+        if together:
+            # rebuild all the broken chunks with one read of the content
+            uploaded_content.rebuild_chunks(chunk_ids_to_rebuild)
 
         rebuilt_content = self.content_factory.get(self.container_id,
                                                    uploaded_content.content_id)
@@ -210,6 +218,10 @@ class TestECContent(BaseTestCase):
     def test_content_rebuild_advanced(self):
         self._test_rebuild(DAT_LEGIT_SIZE, self.random_chunks(3))
 
+    def test_content_rebuild_together(self):
+        self._test_rebuild(DAT_LEGIT_SIZE, self.random_chunks(3),
+                           together=True)
+
     def test_content_rebuild_unrecoverable(self):
         self.assertRaises(
             UnrecoverableContent, self._test_rebuild, DAT_LEGIT_SIZE,
@@ -15,6 +15,7 @@
 
 from mock import MagicMock as Mock
 
+from oio.common.exceptions import NotFound, ServiceBusy, VolumeException
 from oio.rdir.client import RdirClient
 from tests.utils import BaseTestCase, random_id
 
@@ -99,3 +100,70 @@ class TestRdirClient(BaseTestCase):
                          self.chunk_id_3, {'mtime': 30}))
         self.assertRaises(StopIteration, gen.next)
         self.assertEqual(self.rdir_client._direct_request.call_count, 3)
+
+    def test_push_many_batches(self):
+        self.rdir_client._direct_request = Mock(
+            side_effect=[
+                (Mock(), [{'status': 200, 'message': 'OK'}] * 2),
+                (Mock(), [{'status': 400, 'message': 'no chunk_id'}]),
+            ])
+        chunks = [{'container_id': self.container_id_1,
+                   'content_id': self.content_id_1,
+                   'chunk_id': chunk_id}
+                  for chunk_id in (self.chunk_id_1, self.chunk_id_2,
+                                   self.chunk_id_3)]
+        statuses = self.rdir_client.chunk_push_many(
+            "volume", chunks, batch_size=2, mtime=10)
+        self.assertEqual([200, 200, 400], [s['status'] for s in statuses])
+        self.assertEqual(self.rdir_client._direct_request.call_count, 2)
+        first, second = self.rdir_client._direct_request.call_args_list
+        self.assertEqual(2, len(first[1]['json']))
+        self.assertEqual(
+            dict(chunks[2], mtime=10), second[1]['json'][0])
+        self.assertEqual('1', second[1]['params'].get('create'))
+
+    def test_delete_many(self):
+        self.rdir_client._direct_request = Mock(
+            return_value=(Mock(), [{'status': 200, 'message': 'OK'}]))
+        statuses = self.rdir_client.chunk_delete_many(
+            "volume", [{'container_id': self.container_id_1,
+                        'content_id': self.content_id_1,
+                        'chunk_id': self.chunk_id_1,
+                        'mtime': 10}])
+        self.assertEqual([{'status': 200, 'message': 'OK'}], statuses)
+        args, kwargs = self.rdir_client._direct_request.call_args
+        self.assertEqual('DELETE', args[0])
+        self.assertNotIn('mtime', kwargs['json'][0])
+
+
+class TestRdirClientCache(BaseTestCase):
+    def setUp(self):
+        super(TestRdirClientCache, self).setUp()
+        self.rdir_client = RdirClient({'namespace': self.ns})
+        self.rdir_client.directory = Mock()
+
+    def test_addr_cached(self):
+        self.rdir_client.directory.list.return_value = {
+            'srv': [{'type': 'rdir', 'host': '0.1.2.3:4567'}]}
+        for _ in range(3):
+            self.assertEqual('0.1.2.3:4567',
+                             self.rdir_client._get_rdir_addr('volume'))
+        self.assertEqual(1, self.rdir_client.directory.list.call_count)
+        stats = self.rdir_client.cache_stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_addr_negative_cache(self):
+        self.rdir_client.directory.list.side_effect = NotFound(404)
+        for _ in range(3):
+            self.assertRaises(VolumeException,
+                              self.rdir_client._get_rdir_addr, 'volume')
+        self.assertEqual(1, self.rdir_client.directory.list.call_count)
+
+    def test_addr_invalidated_on_error(self):
+        self.rdir_client.directory.list.return_value = {
+            'srv': [{'type': 'rdir', 'host': '0.1.2.3:4567'}]}
+        self.rdir_client._direct_request = Mock(
+            side_effect=ServiceBusy())
+        self.assertRaises(ServiceBusy, self.rdir_client.status, 'volume')
+        self.assertNotIn('volume', self.rdir_client._addr_cache)
@@ -263,6 +263,37 @@ class TestRdirServer(RdirTestCase):
             self.assertListEqual(self.json_loads(resp.data), [])
             rec[k] = save
 
+    def test_push_delete_many(self):
+        recs = [self._record() for _ in range(3)]
+        bad = dict(recs[1])
+        del bad['chunk_id']
+
+        # push several records at once, one of them being incomplete
+        resp = self._post(
+                "/v1/rdir/push", params={'vol': self.vol, 'create': True},
+                data=json.dumps([recs[0], bad, recs[2]]))
+        self.assertEqual(resp.status, 200)
+        statuses = [s['status'] for s in self.json_loads(resp.data)]
+        self.assertEqual([200, 400, 200], statuses)
+
+        # only the valid records have been pushed
+        resp = self._post("/v1/rdir/fetch", params={'vol': self.vol})
+        self.assertEqual(resp.status, 200)
+        self.assertItemsEqual(
+            [_key(recs[0]), _key(recs[2])],
+            [key for key, _ in self.json_loads(resp.data)])
+
+        # delete several records at once
+        resp = self._delete(
+                "/v1/rdir/delete", params={'vol': self.vol},
+                data=json.dumps(recs))
+        self.assertEqual(resp.status, 200)
+        statuses = [s['status'] for s in self.json_loads(resp.data)]
+        self.assertEqual([200, 200, 200], statuses)
+        resp = self._post("/v1/rdir/fetch", params={'vol': self.vol})
+        self.assertEqual(resp.status, 200)
+        self.assertListEqual(self.json_loads(resp.data), [])
+
     def test_lock_unlock(self):
         who = random_str(64)
 
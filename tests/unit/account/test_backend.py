@@ -0,0 +1,51 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+from mock import MagicMock as Mock
+from redis.exceptions import ResponseError
+from oio.account.backend import AccountBackend
+
+
+class TestAccountBackend(unittest.TestCase):
+    def test_update_containers_pipelined(self):
+        conn = Mock()
+        backend = AccountBackend({}, conn)
+        pipeline = conn.pipeline.return_value
+        pipeline.execute.return_value = [
+            1, ResponseError('no_update_needed'), ResponseError('boom')]
+
+        updates = [
+            {'account': 'acct', 'name': 'c1', 'mtime': 1.0},
+            {'account': 'acct', 'mtime': 1.0},
+            {'account': 'acct', 'name': 'c2', 'mtime': 1.0},
+            {'account': 'acct', 'name': 'c3', 'dtime': 1.0}]
+        results = backend.update_containers(updates)
+
+        self.assertEqual([200, 400, 409, 500],
+                         [r['status'] for r in results])
+        self.assertEqual(['c1', None, 'c2', 'c3'],
+                         [r['name'] for r in results])
+        self.assertEqual(3, backend.script_update_container.call_count)
+        for call in backend.script_update_container.call_args_list:
+            self.assertIs(pipeline, call[1]['client'])
+        pipeline.execute.assert_called_once_with(raise_on_error=False)
+
+    def test_update_containers_nothing_valid(self):
+        conn = Mock()
+        backend = AccountBackend({}, conn)
+        results = backend.update_containers([{'name': 'c1'}])
+        self.assertEqual(400, results[0]['status'])
+        conn.pipeline.return_value.execute.assert_not_called()
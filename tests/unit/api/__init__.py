@@ -14,7 +14,7 @@
 # License along with this library.
 
 from io import BytesIO
-from eventlet import sleep
+from eventlet import Timeout, sleep
 from oio.common.http import HeadersDict
 from oio.common.http_urllib3 import urllib3
 from oio.api.object_storage import ObjectStorageApi
@@ -100,3 +100,13 @@ def decode_chunked_body(raw_body):
 
 def empty_stream():
     return BytesIO("")
+
+
+def cancelled_timeout(seconds=1.0):
+    """
+    Build a `Timeout` to be raised by a fake, without leaving
+    its timer pending (it would fire into a later test).
+    """
+    timeout = Timeout(seconds)
+    timeout.cancel()
+    return timeout
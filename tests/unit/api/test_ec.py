@@ -15,18 +15,20 @@
 
 import unittest
 import random
+import time
 from io import BytesIO
 from collections import defaultdict
 from hashlib import md5
 from copy import deepcopy
-from eventlet import Timeout
+from eventlet import GreenPile, Timeout, sleep
 from oio.common.storage_method import STORAGE_METHODS
 from oio.api.ec import EcMetachunkWriter, ECChunkDownloadHandler, \
-    ECRebuildHandler
+    ECRebuildHandler, ECWriteHandler
+from oio.api.io import LatencyTracker
 from oio.common import exceptions as exc
 from oio.common.constants import chunk_headers
 from tests.unit.api import empty_stream, decode_chunked_body, \
-    FakeResponse, CHUNK_SIZE, EMPTY_CHECKSUM
+    FakeResponse, CHUNK_SIZE, EMPTY_CHECKSUM, cancelled_timeout
 from tests.unit import set_http_connect, set_http_requests
 from oio.common.constants import OIO_VERSION
 
@@ -93,6 +95,33 @@ class TestEC(unittest.TestCase):
                                         checksum, self.storage_method)
             self.assertRaises(exc.OioException, handler.stream, source, size)
 
+    def test_write_handler_metachunk_hashes(self):
+        segment_size = self.storage_method.ec_segment_size
+        nb = self.storage_method.ec_nb_data + self.storage_method.ec_nb_parity
+        # one segment per data fragment: metachunks of 6 segments
+        sysmeta = dict(self.sysmeta, chunk_size=segment_size)
+        mc_size = segment_size * self.storage_method.ec_nb_data
+        test_data = ('0123456789ABCDEF' * (mc_size // 4))[:mc_size * 2 + 100]
+        nb_mc = 3
+        chunk_prep = {
+            pos: [{'url': 'http://127.0.0.1:70%02d/%d%d' % (i, pos, i),
+                   'pos': '%d.%d' % (pos, i), 'num': i} for i in range(nb)]
+            for pos in range(nb_mc)}
+        with set_http_connect(*([201] * nb * nb_mc)):
+            handler = ECWriteHandler(
+                BytesIO(test_data), sysmeta, chunk_prep,
+                self.storage_method, pipeline_depth=2)
+            chunks, bytes_transferred, checksum = handler.stream()
+
+        self.assertEqual(len(test_data), bytes_transferred)
+        self.assertEqual(self.checksum(test_data).hexdigest(), checksum)
+        self.assertEqual(nb * nb_mc, len(chunks))
+        for chunk in chunks:
+            pos = int(chunk['pos'].split('.')[0])
+            part = test_data[pos * mc_size:(pos + 1) * mc_size]
+            self.assertEqual(len(part), chunk['size'])
+            self.assertEqual(self.checksum(part).hexdigest(), chunk['hash'])
+
     def test_write_quorum_success(self):
         checksum = self.checksum()
         source = empty_stream()
@@ -131,7 +160,8 @@ class TestEC(unittest.TestCase):
 
     def test_write_connect_errors(self):
         test_cases = [
-                {'error': Timeout(1.0), 'msg': 'connect: Timeout 1.0 second'},
+                {'error': cancelled_timeout(),
+                 'msg': 'connect: Timeout 1.0 second'},
                 {'error': Exception('failure'), 'msg': 'connect: failure'},
         ]
         for test in test_cases:
@@ -161,7 +191,8 @@ class TestEC(unittest.TestCase):
 
     def test_write_response_error(self):
         test_cases = [
-                {'error': Timeout(1.0), 'msg': 'resp: Timeout 1.0 second'},
+                {'error': cancelled_timeout(),
+                 'msg': 'resp: Timeout 1.0 second'},
                 {'error': Exception('failure'), 'msg': 'resp: failure'},
         ]
         for test in test_cases:
@@ -206,7 +237,7 @@ class TestEC(unittest.TestCase):
     def test_write_timeout_source(self):
         class TestReader(object):
             def read(self, size):
-                raise Timeout(1.0)
+                raise cancelled_timeout()
         checksum = self.checksum()
         source = TestReader()
         size = CHUNK_SIZE * self.storage_method.ec_nb_data
@@ -399,6 +430,36 @@ class TestEC(unittest.TestCase):
         # nb_parity remaining
         self.assertEqual(len(responses), self.storage_method.ec_nb_parity)
 
+    def test_read_hedged(self):
+        segment_size = self.storage_method.ec_segment_size
+        test_data = ('1234' * segment_size)[:-657]
+        ec_chunks = self._make_ec_chunks(test_data)
+        responses = {'/%d' % i: FakeResponse(200, ec_chunk)
+                     for i, ec_chunk in enumerate(ec_chunks)}
+
+        def get_response(req):
+            if req['path'] == '/0':
+                # this one is much slower than usual
+                sleep(0.5)
+            return responses.pop(req['path'])
+
+        tracker = LatencyTracker(min_samples=1, min_delay=0.01)
+        tracker.record('127.0.0.1:7000', 0.01)
+        meta_chunk = self.meta_chunk()
+        meta_chunk[0]['size'] = len(test_data)
+        start = time.time()
+        with set_http_requests(get_response) as conn_record:
+            handler = ECChunkDownloadHandler(self.storage_method,
+                                             meta_chunk, None, None, {},
+                                             latencies=tracker)
+            stream = handler.get_stream()
+            data = ''.join(''.join(part['iter']) for part in stream)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(test_data, data)
+        # an extra fragment has been requested
+        self.assertEqual(len(conn_record),
+                         self.storage_method.ec_nb_data + 1)
+
     def _make_ec_meta_resp(self, test_data=None):
         segment_size = self.storage_method.ec_segment_size
         test_data = test_data or \
@@ -701,6 +762,38 @@ class TestEC(unittest.TestCase):
                              self.checksum(missing_chunk_body).hexdigest())
             self.assertEqual(len(conn_record), nb - 1)
 
+    def test_rebuild_several(self):
+        test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
+        ec_chunks = self._make_ec_chunks(test_data)
+        meta_chunk = self.meta_chunk_copy()
+        # lose a data and a parity fragments
+        missing_bodies = {6: ec_chunks.pop(6), 1: ec_chunks.pop(1)}
+        meta_chunk.pop(6)
+        meta_chunk.pop(1)
+
+        responses = [FakeResponse(200, ec_chunk, {})
+                     for ec_chunk in ec_chunks]
+
+        def get_response(req):
+            return responses.pop(0) if responses else FakeResponse(404)
+
+        with set_http_requests(get_response) as conn_record:
+            handler = ECRebuildHandler(
+                meta_chunk, [6, 1], self.storage_method, read_ahead=1)
+            streams = handler.rebuild_all()
+            self.assertEqual([1, 6], sorted(streams.keys()))
+            # the fragments are rebuilt together, read them in parallel
+            pile = GreenPile(2)
+            for missing in (1, 6):
+                pile.spawn(lambda stream: ''.join(stream), streams[missing])
+            results = list(pile)
+        for missing, result in zip((1, 6), results):
+            self.assertEqual(
+                self.checksum(missing_bodies[missing]).hexdigest(),
+                self.checksum(result).hexdigest())
+        # the metachunk has been read once
+        self.assertEqual(len(conn_record), len(meta_chunk))
+
     def test_rebuild_errors(self):
         test_data = ('1234' * self.storage_method.ec_segment_size)[:-777]
 
@@ -14,10 +14,21 @@
 # License along with this library.
 
 import unittest
+from collections import deque
+from hashlib import md5
+from io import BytesIO
+import time
+from eventlet import sleep
+from eventlet.event import Event
+from greenlet import GreenletExit
 from mock import patch
-from oio.api.io import ChunkReader, discard_bytes
+from oio.api.io import ChunkReader, discard_bytes, make_iter_from_resp, \
+    pop_bytes, DeferredChecksum, LatencyTracker, PipedSource, WriteHandler
 from oio.common import exceptions as exc
+from oio.api import io
 from oio.common import green
+from tests.unit import set_http_requests
+from tests.unit.api import FakeResponse
 
 
 class FakeSource(object):
@@ -43,6 +54,35 @@ class FakeSource(object):
         return [('content-length', self.getheader('content-length'))]
 
 
+def multipart_body(boundary, parts, total):
+    body = ''
+    for start, data in parts:
+        body += '\r\n--%s\r\n' % boundary
+        body += 'Content-Type: application/octet-stream\r\n'
+        body += 'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+            start, start + len(data) - 1, total)
+        body += data
+    body += '\r\n--%s--\r\n' % boundary
+    return body
+
+
+class FakeMultipartResponse(object):
+    def __init__(self, boundary, parts, total):
+        self.status = 206
+        self.stream = BytesIO(multipart_body(boundary, parts, total))
+        self.headers = {
+            'content-type': 'multipart/byteranges; boundary=%s' % boundary}
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def getheader(self, k):
+        return self.headers.get(k.lower())
+
+    def getheaders(self):
+        return self.headers.items()
+
+
 class IOTest(unittest.TestCase):
     def test_recover(self):
         # basic without range
@@ -105,6 +145,28 @@ class IOTest(unittest.TestCase):
         data = list(it)
         self.assertEqual(data, ['1234abcd', '1234abcd', '1234abcd', '1234ab'])
 
+    def test_pop_bytes(self):
+        blocks = deque(['1234', 'abcd', '12', '34abcd'])
+        self.assertEqual('1234', pop_bytes(blocks, 4))
+        self.assertEqual('abcd1234', pop_bytes(blocks, 8))
+        self.assertEqual('ab', pop_bytes(blocks, 2))
+        self.assertEqual(['cd'], list(blocks))
+
+    def test_reader_buf_size_read_alignment(self):
+        reader = ChunkReader(None, 8, {})
+        source = FakeSource(['12345', '678abcdefgh', 'ijklm'])
+        sizes = list()
+        orig_read = source.read
+
+        def _read(size):
+            sizes.append(size)
+            return orig_read(size)
+        source.read = _read
+        data = list(reader._create_iter({}, source))
+        self.assertEqual(['12345678', 'abcdefgh', 'ijklm'], data)
+        # reads are sized to complete the current block
+        self.assertEqual(3, sizes[1])
+
     def test_reader_buf_resume(self):
         chunk = {}
 
@@ -120,3 +182,207 @@ class IOTest(unittest.TestCase):
             data = list(it)
 
         self.assertEqual(data, ['1234abcd', '5678efgh'])
+
+    def test_make_iter_multipart(self):
+        resp = FakeMultipartResponse(
+            'XyZ', [(0, '0123456789'), (40, 'abc\r\n--XyZ')], 100)
+        parts = list()
+        for start, end, length, headers, body in make_iter_from_resp(resp):
+            parts.append((start, end, length, body.read()))
+        self.assertEqual([(0, 9, 10, '0123456789'),
+                          (40, 49, 10, 'abc\r\n--XyZ')], parts)
+
+    def test_make_iter_multipart_partial_read(self):
+        resp = FakeMultipartResponse(
+            'XyZ', [(0, '0123456789'), (40, 'abcdefghij')], 100)
+        parts_iter = make_iter_from_resp(resp)
+        _, _, _, _, body = next(parts_iter)
+        self.assertEqual('012', body.read(3))
+        _, _, _, _, body = next(parts_iter)
+        self.assertEqual('abcdefghij', body.read())
+        self.assertRaises(StopIteration, next, parts_iter)
+
+    def test_fill_ranges_multipart(self):
+        reader = ChunkReader(None, None,
+                             {'Range': 'bytes=0-9,40-49,80-89'})
+        reader.fill_ranges(0, 9, 10)
+        self.assertEqual('bytes=0-9,40-49,80-89',
+                         reader.request_headers['Range'])
+        reader.fill_ranges(40, 49, 10)
+        self.assertEqual('bytes=40-49,80-89',
+                         reader.request_headers['Range'])
+        # recovery of the current part keeps the next ones
+        reader.recover(5)
+        self.assertEqual('bytes=45-49,80-89',
+                         reader.request_headers['Range'])
+
+    def test_latency_tracker(self):
+        tracker = LatencyTracker(min_samples=4, min_delay=0.01)
+        chunk = {'url': 'http://1.2.3.4:6000/AAAA'}
+        self.assertIsNone(tracker.hedge_delay(chunk))
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            tracker.record('1.2.3.5:6000', latency)
+        # not enough samples for this service, use all the samples
+        self.assertEqual(0.4, tracker.hedge_delay(chunk, 95))
+        for latency in (0.01, 0.02, 0.03, 0.04):
+            tracker.record('1.2.3.4:6000', latency)
+        self.assertEqual(0.03, tracker.hedge_delay(chunk, 50))
+        # hedge sooner on loaded services
+        chunk['score'] = 0
+        self.assertEqual(0.015, tracker.hedge_delay(chunk, 50))
+        self.assertEqual(0.01, tracker.hedge_delay(chunk, 0))
+        self.assertIsNone(tracker.hedge_delay(chunk, None))
+
+    def test_reader_hedged(self):
+        tracker = LatencyTracker(min_samples=1, min_delay=0.01)
+        tracker.record('1.2.3.4:6000', 0.01)
+        chunks = [{'url': 'http://1.2.3.4:6000/AAAA'},
+                  {'url': 'http://1.2.3.5:6000/BBBB'}]
+
+        killed = list()
+
+        def _get_response(req):
+            if req['host'] == '1.2.3.4:6000':
+                try:
+                    sleep(0.5)
+                except GreenletExit:
+                    killed.append(req['host'])
+                    raise
+                return FakeResponse(200, 'slow')
+            return FakeResponse(200, 'fast')
+
+        reader = ChunkReader(iter(chunks), None, {}, latencies=tracker)
+        start = time.time()
+        with set_http_requests(_get_response) as conn_record:
+            data = ''.join(''.join(part['iter'])
+                           for part in reader.get_iter())
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual('fast', data)
+        self.assertEqual(2, len(conn_record))
+        # The slower request has been stopped, with its timeouts
+        self.assertEqual(['1.2.3.4:6000'], killed)
+
+    def test_reader_latency_of_successes(self):
+        tracker = LatencyTracker(min_samples=1, min_delay=0.01)
+        chunks = [{'url': 'http://1.2.3.4:6000/AAAA'},
+                  {'url': 'http://1.2.3.5:6000/BBBB'},
+                  {'url': 'http://1.2.3.6:6000/CCCC'}]
+
+        def _get_response(req):
+            if req['host'] == '1.2.3.4:6000':
+                raise IOError('Connection refused')
+            if req['host'] == '1.2.3.5:6000':
+                return FakeResponse(404, '')
+            return FakeResponse(200, 'data')
+
+        reader = ChunkReader(iter(chunks), None, {}, latencies=tracker,
+                             hedge_percentile=None)
+        with set_http_requests(_get_response):
+            data = ''.join(''.join(part['iter'])
+                           for part in reader.get_iter())
+        self.assertEqual('data', data)
+        self.assertEqual(['1.2.3.6:6000'], tracker.samples.keys())
+
+    def test_reader_not_hedged(self):
+        tracker = LatencyTracker(min_samples=1, min_delay=0.01)
+        tracker.record('1.2.3.4:6000', 0.01)
+        chunks = [{'url': 'http://1.2.3.4:6000/AAAA'},
+                  {'url': 'http://1.2.3.5:6000/BBBB'}]
+
+        def _get_response(req):
+            if req['host'] == '1.2.3.4:6000':
+                sleep(0.05)
+                return FakeResponse(200, 'slow')
+            return FakeResponse(200, 'fast')
+
+        reader = ChunkReader(iter(chunks), None, {}, latencies=tracker,
+                             hedge_percentile=None)
+        with set_http_requests(_get_response) as conn_record:
+            data = ''.join(''.join(part['iter'])
+                           for part in reader.get_iter())
+        self.assertEqual('slow', data)
+        self.assertEqual(1, len(conn_record))
+
+
+class FakeMetachunkWriter(object):
+    def __init__(self, pos, started):
+        self.pos = pos
+        self.started = started
+        self.read = ''
+        self.committed = False
+
+    def stream(self, source, size):
+        while True:
+            data = source.read(size)
+            if not data:
+                break
+            self.read += data
+            if self.pos > 0 and not self.started.ready():
+                self.started.send(True)
+            # Let the other coroutines run, as a network write would
+            sleep(0)
+        if self.pos == 0:
+            # Fail after the next metachunk has begun to be fed
+            self.started.wait()
+            raise exc.OioException('rawx failure')
+        self.committed = True
+        return self.pos
+
+
+class WriteHandlerTest(unittest.TestCase):
+    def test_deferred_checksum_not_ready(self):
+        self.assertRaises(ValueError, DeferredChecksum().hexdigest)
+
+    def test_feed_first_metachunk(self):
+        data = '0123456789' * 3
+        handler = WriteHandler(BytesIO(data), {}, {}, None)
+        checksum = md5()
+        meta_checksum = DeferredChecksum()
+        source = PipedSource(4)
+        self.assertEqual(10, handler._feed(source, 10, checksum, [],
+                                           meta_checksum=meta_checksum,
+                                           first=True))
+        self.assertEqual(data[:10], source.read())
+        self.assertEqual('', source.read())
+        # The metachunk checksum is a copy of the content checksum...
+        self.assertEqual(md5(data[:10]).hexdigest(),
+                         meta_checksum.hexdigest())
+        # ...which goes on with the next metachunks
+        handler._feed(PipedSource(4), 10, checksum, [])
+        self.assertEqual(md5(data[:10]).hexdigest(),
+                         meta_checksum.hexdigest())
+        self.assertEqual(md5(data[:20]).hexdigest(), checksum.hexdigest())
+
+    def test_feed_next_metachunk(self):
+        data = '0123456789' * 3
+        handler = WriteHandler(BytesIO(data), {}, {}, None)
+        checksum = md5()
+        handler._feed(PipedSource(4), 10, checksum, [])
+        meta_checksum = DeferredChecksum()
+        self.assertEqual(10, handler._feed(PipedSource(4), 10, checksum, [],
+                                           meta_checksum=meta_checksum))
+        self.assertEqual(md5(data[10:20]).hexdigest(),
+                         meta_checksum.hexdigest())
+        self.assertEqual(md5(data[:20]).hexdigest(), checksum.hexdigest())
+
+    def test_pipeline_failure_aborts_next_metachunk(self):
+        data = 'x' * (io.WRITE_CHUNK_SIZE * 8)
+        chunk_prep = {pos: [{'pos': str(pos)}] for pos in range(3)}
+        handler = WriteHandler(BytesIO(data), {}, chunk_prep, None,
+                               pipeline_depth=2, pipeline_buffer=1)
+        started = Event()
+        writers = list()
+
+        def _make_writer(meta_chunk, _meta_checksum):
+            writer = FakeMetachunkWriter(int(meta_chunk[0]['pos']), started)
+            writers.append(writer)
+            return writer
+
+        self.assertRaises(exc.OioException, handler._stream_pipeline,
+                          _make_writer, io.WRITE_CHUNK_SIZE * 4)
+        self.assertEqual(2, len(writers))
+        self.assertFalse(writers[0].committed)
+        # The metachunk being fed when the first failed is not committed
+        self.assertTrue(writers[1].read)
+        self.assertLess(len(writers[1].read), io.WRITE_CHUNK_SIZE * 4)
+        self.assertFalse(writers[1].committed)
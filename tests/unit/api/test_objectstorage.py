@@ -338,3 +338,61 @@ class ObjectStorageTest(unittest.TestCase):
         self.assertRaises(
             exceptions.Conflict, self.api.container_refresh, self.account,
             self.container)
+
+    def _mock_prepare(self, chunk_size=32):
+        meta = {'chunk_method': 'plain/nb_copy=2', 'chunk_size': chunk_size}
+
+        def _prepare(account, container, obj_name, size, **_kwargs):
+            nb_mc = (size + chunk_size - 1) // chunk_size
+            body = [chunk(random_str(8), pos)
+                    for pos in range(nb_mc) for _ in range(2)]
+            return meta, body
+
+        self.api.container.content_prepare = Mock(side_effect=_prepare)
+
+    def _prepare_sizes(self):
+        return [call[0][3] if len(call[0]) > 3 else call[1]['size']
+                for call in self.api.container.content_prepare.call_args_list]
+
+    def test_content_preparer_batches(self):
+        self._mock_prepare()
+        self.api._chunk_size = 32
+        _, prep = self.api._content_preparer(
+            self.account, self.container, 'obj', content_length=96)
+        gen = prep()
+        metachunks = [next(gen) for _j in range(5)]
+        self.assertEqual(
+            [str(pos) for pos in range(5)],
+            [mc[0]['pos'] for mc in metachunks])
+        for mc in metachunks:
+            self.assertEqual(2, len(mc))
+            self.assertEqual(mc[0]['pos'], mc[1]['pos'])
+        # 3 metachunks from the content length, then a batch of 2
+        self.assertEqual([96, 64], self._prepare_sizes())
+
+    def test_content_preparer_learns_chunk_size(self):
+        self._mock_prepare()
+        _, prep = self.api._content_preparer(
+            self.account, self.container, 'obj', content_length=96)
+        next(prep())
+        # The chunk size is not known yet: one metachunk
+        self.assertEqual([1], self._prepare_sizes())
+        self.assertEqual(32, self.api._chunk_size)
+
+    def test_content_preparer_first_batch_capped(self):
+        self._mock_prepare()
+        self.api._chunk_size = 32
+        _, prep = self.api._content_preparer(
+            self.account, self.container, 'obj', content_length=32 * 1000)
+        next(prep())
+        self.assertEqual([self.api.MAX_PREPARE_BATCH * 32],
+                         self._prepare_sizes())
+
+    def test_object_create_unicode_data(self):
+        self.api._object_create = Mock()
+        self.api.object_create(self.account, self.container,
+                               data=u'\u00e9t\u00e9', obj_name='obj')
+        kwargs = self.api._object_create.call_args[1]
+        self.assertEqual(5, kwargs['content_length'])
+        self.assertEqual('\xc3\xa9t\xc3\xa9',
+                         self.api._object_create.call_args[0][3].read())
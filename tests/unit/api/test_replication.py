@@ -17,13 +17,13 @@ import unittest
 from collections import defaultdict
 from io import BytesIO
 from hashlib import md5
-from eventlet import Timeout
 from oio.common import exceptions as exc
 from oio.common import green
-from oio.api.replication import ReplicatedMetachunkWriter
+from oio.api.replication import ReplicatedMetachunkWriter, \
+    ReplicatedWriteHandler
 from oio.common.storage_method import STORAGE_METHODS
 from tests.unit.api import CHUNK_SIZE, EMPTY_CHECKSUM, empty_stream, \
-    decode_chunked_body, FakeResponse
+    decode_chunked_body, FakeResponse, cancelled_timeout
 from oio.api import io
 from tests.unit import set_http_connect, set_http_requests
 from oio.common.constants import OIO_VERSION
@@ -130,7 +130,7 @@ class TestReplication(unittest.TestCase):
         size = CHUNK_SIZE
         meta_chunk = self.meta_chunk()
         resps = [201] * (len(meta_chunk) - 1)
-        resps.append(Timeout(1.0))
+        resps.append(cancelled_timeout())
         with set_http_connect(*resps):
             handler = ReplicatedMetachunkWriter(
                 self.sysmeta, meta_chunk, checksum, self.storage_method)
@@ -191,7 +191,7 @@ class TestReplication(unittest.TestCase):
     def test_write_timeout_source(self):
         class TestReader(object):
             def read(self, size):
-                raise Timeout(1.0)
+                raise cancelled_timeout()
 
         checksum = self.checksum()
         source = TestReader()
@@ -223,6 +223,44 @@ class TestReplication(unittest.TestCase):
             self.assertRaises(Exception, handler.stream, source,
                               size)
 
+    def test_write_handler_pipeline(self):
+        chunk_size = 4096
+        test_data = ('1234' * 1024) * 3 + 'end'
+        sysmeta = dict(self.sysmeta, chunk_size=chunk_size)
+        nb_mc = 4
+        chunk_prep = {
+            pos: [{'url': 'http://127.0.0.1:700%d/%d%d' % (i, pos, i),
+                   'pos': str(pos)} for i in range(3)]
+            for pos in range(nb_mc)}
+        resps = [201] * (3 * nb_mc)
+
+        put_reqs = defaultdict(lambda: {'parts': []})
+
+        def cb_body(conn_id, part):
+            put_reqs[conn_id]['parts'].append(part)
+
+        with set_http_connect(*resps, cb_body=cb_body):
+            handler = ReplicatedWriteHandler(
+                BytesIO(test_data), sysmeta, chunk_prep, self.storage_method,
+                pipeline_depth=3)
+            chunks, bytes_transferred, checksum = handler.stream()
+
+        self.assertEqual(len(test_data), bytes_transferred)
+        self.assertEqual(self.checksum(test_data).hexdigest(), checksum)
+        self.assertEqual([str(pos) for pos in range(nb_mc) for _i in range(3)],
+                         [chunk['pos'] for chunk in chunks])
+        expected_bodies = []
+        for pos in range(nb_mc):
+            part = test_data[pos * chunk_size:(pos + 1) * chunk_size]
+            expected_bodies += [part] * 3
+            for chunk in chunks[pos * 3:(pos + 1) * 3]:
+                self.assertEqual(len(part), chunk['size'])
+                self.assertEqual(self.checksum(part).hexdigest(),
+                                 chunk['hash'])
+        bodies = [decode_chunked_body(''.join(info['parts']))[0]
+                  for info in put_reqs.values()]
+        self.assertEqual(sorted(expected_bodies), sorted(bodies))
+
     def test_write_transfer(self):
         checksum = self.checksum()
         test_data = ('1234' * 1024)[:-10]
@@ -14,7 +14,14 @@
 # License along with this library.
 
 import unittest
-from oio.common.storage_functions import obj_range_to_meta_chunk_range
+from eventlet import sleep
+from oio.common import exceptions as exc
+from oio.common.storage_method import STORAGE_METHODS
+from oio.common.storage_functions import fetch_stream
+from tests.unit import set_http_connect
+from tests.unit.api.test_io import multipart_body
+from oio.common.storage_functions import obj_range_to_meta_chunk_range, \
+    _iter_read_ahead, group_meta_ranges, coalesce_ranges, extract_ranges
 
 
 class TestUtils(unittest.TestCase):
@@ -126,3 +133,100 @@ class TestUtils(unittest.TestCase):
             result = obj_range_to_meta_chunk_range(
                 c['start'], c['end'], c['sizes'])
             self.assertEqual(result, c['expected'])
+
+    def _openers(self, events, nb=3, failing=None):
+        def _open(pos):
+            events.append(('open', pos))
+            if pos == failing:
+                raise exc.UnrecoverableContent('position %d' % pos)
+            for i in range(3):
+                events.append(('read', pos, i))
+                yield '%d%d' % (pos, i)
+        return [lambda pos=pos: _open(pos) for pos in range(nb)]
+
+    def test_read_ahead_order(self):
+        for read_ahead in (0, 1, 2):
+            events = []
+            data = ''.join(_iter_read_ahead(
+                self._openers(events), read_ahead, 1))
+            self.assertEqual('000102101112202122', data)
+
+    def test_read_ahead_opens_next(self):
+        events = []
+        it = _iter_read_ahead(self._openers(events), 1, 8)
+        self.assertEqual('00', next(it))
+        sleep(0)
+        self.assertIn(('open', 1), events)
+        self.assertNotIn(('open', 2), events)
+        it.close()
+
+    def test_read_ahead_error_position(self):
+        events = []
+        it = _iter_read_ahead(self._openers(events, failing=1), 2, 8)
+        self.assertEqual(['00', '01', '02'], [next(it) for _i in range(3)])
+        self.assertRaises(exc.UnrecoverableContent, next, it)
+
+    def test_read_ahead_cancel(self):
+        events = []
+        it = _iter_read_ahead(self._openers(events, nb=10), 2, 1)
+        next(it)
+        it.close()
+        sleep(0)
+        nb_events = len(events)
+        sleep(0.01)
+        self.assertEqual(nb_events, len(events))
+        self.assertNotIn(('open', 5), events)
+
+    def test_group_meta_ranges(self):
+        meta_range_list = [{0: (0, 9)}, {0: (20, 29)}, {0: (5, 6)},
+                           {0: (40, 49), 1: (0, 9)}, {1: (20, 29)}]
+        self.assertEqual(
+            [(0, [(0, 9), (20, 29)]),
+             (0, [(5, 6), (40, 49)]),
+             (1, [(0, 9), (20, 29)])],
+            group_meta_ranges(meta_range_list))
+
+    def test_coalesce_ranges(self):
+        def _mergeable(end, start):
+            return start - end - 1 <= 10
+        self.assertEqual(
+            [(0, 29), (50, 59)],
+            coalesce_ranges([(0, 9), (20, 29), (50, 59)], _mergeable))
+
+    def test_extract_ranges(self):
+        data = ''.join(chr(ord('a') + i) for i in range(26))
+        # one part covering all the ranges, split into blocks
+        parts = [{'start': 0,
+                  'iter': iter([data[i:i + 4] for i in range(0, 26, 4)])}]
+        self.assertEqual(
+            'bcdefghklmnoz',
+            ''.join(extract_ranges(parts, [(1, 7), (10, 14), (25, 25)])))
+        # one part per range
+        parts = [{'start': 1, 'iter': iter([data[1:8]])},
+                 {'start': 10, 'iter': iter([data[10:15]])}]
+        self.assertEqual(
+            'bcdefghklmno',
+            ''.join(extract_ranges(parts, [(1, 7), (10, 14)])))
+        # missing data
+        parts = [{'start': 10, 'iter': iter([data[10:15]])}]
+        self.assertRaises(exc.OioException, list,
+                          extract_ranges(parts, [(1, 7), (10, 14)]))
+
+    def test_fetch_stream_multi_range(self):
+        data = ''.join(chr(ord('a') + i) for i in range(26)) * 10000
+        chunks = {0: [{'url': 'http://127.0.0.1:7000/0', 'pos': '0',
+                       'size': len(data)}]}
+        ranges = [(1, 7), (100000, 100009), (200000, 200001)]
+        body = multipart_body('XyZ', [(1, data[1:8]),
+                                      (100000, data[100000:100010]),
+                                      (200000, data[200000:200002])],
+                              len(data))
+        headers = {'Content-Type': 'multipart/byteranges; boundary=XyZ'}
+        storage_method = STORAGE_METHODS.load('plain/nb_copy=1')
+        # a single request for all the ranges
+        with set_http_connect(206, body=body, headers=headers) as conn:
+            stream = fetch_stream(chunks, ranges, storage_method)
+            self.assertEqual(
+                data[1:8] + data[100000:100010] + data[200000:200002],
+                ''.join(stream))
+        self.assertRaises(StopIteration, next, conn.status_iter)
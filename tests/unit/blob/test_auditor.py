@@ -0,0 +1,101 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from mock import MagicMock as Mock, patch
+from oio.blob import auditor
+from oio.blob.auditor import BlobAuditorWorker, ChunkReader
+from oio.common import exceptions as exc
+from oio.common import utils
+
+
+class TestChunkReader(unittest.TestCase):
+    def test_read_blocks(self):
+        data = 'x' * 2500
+        fp = BytesIO(data)
+        reader = ChunkReader(fp, len(data), hashlib.md5(data).hexdigest(),
+                             block_size=1000)
+        self.assertEqual([1000, 1000, 500], [len(buf) for buf in reader])
+        reader.close()
+
+    def test_corrupted(self):
+        reader = ChunkReader(BytesIO('abcd'), 4,
+                             hashlib.md5('abce').hexdigest())
+        list(reader)
+        self.assertRaises(exc.CorruptedChunk, reader.close)
+
+
+class TestBlobAuditorWorker(unittest.TestCase):
+    def _worker(self, **kwargs):
+        conf = {'namespace': 'NS', 'chunks_per_second': 30,
+                'bytes_per_second': 1000}
+        with patch.object(auditor, 'ContainerClient'):
+            return BlobAuditorWorker(conf, Mock(), '/volume', **kwargs)
+
+    def test_shared_budget(self):
+        worker = self._worker(shard=1, shards=4)
+        self.assertEqual(7, worker.max_chunks_per_second)
+        self.assertEqual(250, worker.max_bytes_per_second)
+
+    def test_shards(self):
+        volume = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, volume)
+        paths = list()
+        for i in range(100):
+            top = os.path.join(volume, '%02X' % (i % 16))
+            if not os.path.isdir(top):
+                os.makedirs(os.path.join(top, 'sub'))
+            paths.append(os.path.join(top, 'sub', '%064X' % i))
+            open(paths[-1], 'w').close()
+
+        sharded = list()
+        for shard in range(3):
+            worker = self._worker(shard=shard, shards=3)
+            worker.volume = volume
+            walked = list()
+
+            def _paths_gen(path):
+                walked.append(os.path.basename(path))
+                return utils.paths_gen(path)
+            with patch.object(auditor, 'paths_gen', _paths_gen):
+                sharded.extend(worker._paths_gen())
+            # each worker only walks its own top-level directories
+            self.assertTrue(walked)
+            for name in walked:
+                self.assertEqual(shard, auditor._shard_of(name, 3))
+        self.assertItemsEqual(paths, sharded)
+
+    def test_locate_cached(self):
+        worker = self._worker()
+        chunks = [{'url': 'http://127.0.0.1:6000/%064X' % i}
+                  for i in range(3)]
+        locate = worker.container_client.content_locate
+        locate.return_value = ({}, chunks)
+        for chunk in chunks:
+            meta = {'container_id': 'A' * 64, 'content_path': 'obj',
+                    'content_id': 'B' * 32,
+                    'chunk_id': chunk['url'].rsplit('/', 1)[-1]}
+            self.assertEqual(chunk, worker._locate_chunk(meta))
+        self.assertEqual(1, locate.call_count)
+
+        # unknown chunk: the location is refreshed
+        meta['chunk_id'] = 'C' * 64
+        self.assertIsNone(worker._locate_chunk(meta))
+        self.assertEqual(2, locate.call_count)
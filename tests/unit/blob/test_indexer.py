@@ -0,0 +1,81 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from oio.blob import indexer
+from oio.blob.indexer import BlobIndexer
+
+
+class TestBlobIndexer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.volume = os.path.join(self.tmpdir, 'volume')
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+        for name in ('AB', 'CD'):
+            os.makedirs(os.path.join(self.volume, name))
+            open(os.path.join(self.volume, name, name + '0'), 'w').close()
+        conf = {'namespace': 'OPENIO', 'volume': self.volume,
+                'batch_size': 10, 'chunks_per_second': 0,
+                'walk_checkpoint': self.checkpoint}
+        with patch.object(indexer, 'check_volume',
+                          return_value=('OPENIO', '127.0.0.1:6010')):
+            with patch.object(indexer, 'RdirClient'):
+                self.indexer = BlobIndexer(conf)
+        self.indexer.chunk_record = lambda path: {'chunk_id': path}
+        self.push = self.indexer.index_client.chunk_push_many
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_checkpoint_saved_after_last_batch(self):
+        def _push(volume_id, records, **kwargs):
+            # the end of the walk is not saved before the chunks of
+            # the last batch are indexed
+            self.assertFalse(os.path.exists(self.checkpoint))
+            return [{'status': 201} for _ in records]
+        self.push.side_effect = _push
+        self.indexer.index_pass()
+        self.assertEqual(1, self.push.call_count)
+        self.assertEqual(2, self.indexer.successes)
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+        # nothing changed, nothing to index
+        self.indexer.index_pass()
+        self.assertEqual(1, self.push.call_count)
+
+    def test_checkpoint_not_saved_after_errors(self):
+        self.push.side_effect = lambda volume_id, records, **kwargs: [
+            {'status': 201}, {'status': 500, 'message': 'rdir error'}]
+        self.indexer.index_pass()
+        self.assertEqual(1, self.indexer.errors)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # the chunks are indexed again by the next pass
+        self.push.side_effect = lambda volume_id, records, **kwargs: [
+            {'status': 201} for _ in records]
+        self.indexer.index_pass()
+        self.assertEqual(2, self.push.call_count)
+        self.assertEqual(2, len(self.push.call_args[0][1]))
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+    def test_checkpoint_not_saved_after_batch_failure(self):
+        self.push.side_effect = Exception('failed')
+        self.indexer.index_pass()
+        self.assertEqual(2, self.indexer.errors)
+        self.assertFalse(os.path.exists(self.checkpoint))
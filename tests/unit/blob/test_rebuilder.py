@@ -0,0 +1,208 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock as Mock
+from oio.blob.rebuilder import BlobRebuilderWorker, RebuildCheckpoint
+from oio.content.content import ChunksHelper
+
+
+class TestRebuildCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_marker_follows_oldest_chunk(self):
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertIsNone(checkpoint.marker)
+        for key in ('a', 'b', 'c'):
+            checkpoint.start(key)
+        checkpoint.finish('b', 'ok')
+        self.assertIsNone(checkpoint.marker)
+        checkpoint.finish('a', 'error')
+        self.assertEqual('b', checkpoint.marker)
+        checkpoint.close()
+
+        # 'c' has not been processed
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertEqual('b', checkpoint.marker)
+        self.assertFalse(checkpoint.is_done('c'))
+        checkpoint.close()
+
+    def test_failed_chunks_kept(self):
+        checkpoint = RebuildCheckpoint(self.path)
+        for key in ('a', 'b', 'c'):
+            checkpoint.start(key)
+        checkpoint.finish('a', 'error')
+        checkpoint.finish('b', 'ok')
+        checkpoint.finish('c', 'error')
+        self.assertEqual('c', checkpoint.marker)
+        self.assertEqual(set(['a', 'c']), checkpoint.failed)
+        checkpoint.close()
+
+        # the failed chunks are retried when the rebuild is resumed
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertEqual('c', checkpoint.marker)
+        self.assertEqual(set(['a', 'c']), checkpoint.failed)
+        self.assertFalse(checkpoint.is_done('a'))
+        checkpoint.start('a')
+        checkpoint.finish('a', 'ok')
+        checkpoint.start('c')
+        checkpoint.finish('c', 'error')
+        # the marker does not go backwards
+        self.assertEqual('c', checkpoint.marker)
+        self.assertEqual(set(['c']), checkpoint.failed)
+        checkpoint.start('d')
+        checkpoint.finish('d', 'ok')
+        self.assertEqual('d', checkpoint.marker)
+        checkpoint.close()
+
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertEqual('d', checkpoint.marker)
+        self.assertEqual(set(['c']), checkpoint.failed)
+        checkpoint.close()
+
+    def test_failed_chunks_after_marker_not_done(self):
+        checkpoint = RebuildCheckpoint(self.path)
+        for key in ('a', 'b'):
+            checkpoint.start(key)
+        checkpoint.finish('b', 'error')
+        checkpoint.close()
+
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertIsNone(checkpoint.marker)
+        self.assertFalse(checkpoint.is_done('b'))
+        self.assertEqual(set(), checkpoint.failed)
+        checkpoint.close()
+
+    def test_resume_skips_processed_chunks(self):
+        checkpoint = RebuildCheckpoint(self.path)
+        for key in ('a', 'b', 'c'):
+            checkpoint.start(key)
+        checkpoint.finish('c', 'ok')
+        checkpoint.close()
+        # simulate a crash while writing
+        with open(self.path, 'a') as out:
+            out.write('{"chunk": "b", "sta')
+
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertIsNone(checkpoint.marker)
+        self.assertTrue(checkpoint.is_done('c'))
+        self.assertFalse(checkpoint.is_done('b'))
+        checkpoint.start('a')
+        checkpoint.start('b')
+        checkpoint.finish('a', 'ok')
+        checkpoint.finish('b', 'ok')
+        checkpoint.close()
+
+        # the checkpoint has been compacted when loaded
+        with open(self.path) as in_:
+            self.assertEqual(1, sum(1 for line in in_ if 'sta' in line
+                                    and '"c"' in line))
+        checkpoint = RebuildCheckpoint(self.path)
+        self.assertEqual('b', checkpoint.marker)
+        self.assertTrue(checkpoint.is_done('c'))
+        checkpoint.close()
+
+
+class TestBlobRebuilderWorker(unittest.TestCase):
+    def setUp(self):
+        conf = {'namespace': 'OPENIO', 'proxyd_url': 'http://127.0.0.1:6000'}
+        self.worker = BlobRebuilderWorker(conf, Mock(), '127.0.0.1:6010')
+        self.worker.rdir_client = Mock()
+        self.worker.content_factory = Mock()
+
+    def _content(self, ec, positions):
+        chunks = list()
+        for i, pos in enumerate(positions):
+            chunks.append({'url': 'http://127.0.0.1:6010/%064X' % i,
+                           'pos': pos, 'size': 8, 'hash': '0' * 32})
+        content = Mock(container_id='CID', content_id='CONTENT')
+        content.storage_method.ec = ec
+        content.chunks = ChunksHelper(chunks)
+        self.worker.content_factory.get.return_value = content
+        return content
+
+    def test_resume_retries_failed_chunks(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.worker.checkpoint = RebuildCheckpoint(
+            os.path.join(tmpdir, 'checkpoint'))
+        self.addCleanup(self.worker.checkpoint.close)
+        self.worker.checkpoint.failed.update(['CID|A|c0', 'CID|A|c1'])
+        self.worker.checkpoint.marker = 'CID|B|c2'
+        self.worker.rdir_client.chunk_fetch.return_value = iter(
+            [('CID', 'C', 'c3', None)])
+        processed = list()
+        self.worker._process_chunks = \
+            lambda *args: processed.append(args)
+        self.worker._rebuilder_loop(0)
+        self.worker.pool.waitall()
+        self.assertEqual([('CID', 'A', ['c0', 'c1']), ('CID', 'C', ['c3'])],
+                         processed)
+        self.worker.rdir_client.chunk_fetch.assert_called_once_with(
+            '127.0.0.1:6010', limit=100, rebuild=True, start_after='CID|B|c2')
+
+    def test_throttle_spare_chunks(self):
+        self.worker.max_rawx_chunks_per_second = 1
+        self.worker._throttle_spare_chunks(
+            ['http://127.0.0.1:6011/%064X' % 0,
+             'http://127.0.0.1:6012/%064X' % 1])
+        self.assertEqual(['127.0.0.1:6011', '127.0.0.1:6012'],
+                         sorted(self.worker._rawx_next_time))
+
+    def test_group_by_content(self):
+        chunks = [('CID', 'A', 'c0', None), ('CID', 'A', 'c1', None),
+                  ('CID', 'B', 'c2', None), ('CID', 'A', 'c3', None)]
+        self.assertEqual([('CID', 'A', ['c0', 'c1']),
+                          ('CID', 'B', ['c2']),
+                          ('CID', 'A', ['c3'])],
+                         list(self.worker._group_by_content(chunks)))
+
+    def test_rebuild_ec_chunks_together(self):
+        content = self._content(True, ['0.0', '0.1', '0.2', '1.0', '1.1'])
+        lost = [content.chunks[0].id, content.chunks[3].id]
+        self.worker._process_chunks('CID', 'CONTENT', lost)
+        self.worker.content_factory.get.assert_called_once_with(
+            'CID', 'CONTENT')
+        content.rebuild_chunks.assert_called_once_with(
+            lost, allow_same_rawx=False,
+            throttle=self.worker._throttle_spare_chunks)
+        self.assertFalse(content.rebuild_chunk.called)
+        self.assertEqual(2, self.worker.rdir_client.chunk_delete.call_count)
+        self.assertEqual(0, self.worker.errors)
+        self.assertEqual(16, self.worker.total_bytes_processed)
+
+    def test_rebuild_ec_chunks_failure(self):
+        content = self._content(True, ['0.0', '0.1', '0.2'])
+        content.rebuild_chunks.side_effect = Exception('failed')
+        lost = [content.chunks[0].id, content.chunks[1].id]
+        self.worker._process_chunks('CID', 'CONTENT', lost)
+        self.assertEqual(2, self.worker.errors)
+        self.assertFalse(self.worker.rdir_client.chunk_delete.called)
+
+    def test_rebuild_replicated_chunks_one_by_one(self):
+        content = self._content(False, ['0', '0', '0'])
+        lost = [content.chunks[0].id, content.chunks[1].id]
+        self.worker._process_chunks('CID', 'CONTENT', lost)
+        self.assertFalse(content.rebuild_chunks.called)
+        self.assertEqual(2, content.rebuild_chunk.call_count)
+        self.assertEqual(2, self.worker.rdir_client.chunk_delete.call_count)
@@ -0,0 +1,69 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+from mock import patch
+from oio.common.cache import LruTtlCache
+
+
+class TestLruTtlCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LruTtlCache(max_size=4)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('x', cache.get('a', 'x'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIn('a', cache)
+        cache.invalidate('a')
+        self.assertNotIn('a', cache)
+        self.assertEqual({'size': 0, 'hits': 1, 'misses': 2,
+                          'evictions': 0}, cache.stats())
+
+    def test_lru_eviction(self):
+        cache = LruTtlCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' becomes the most recently used
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertNotIn('b', cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.evictions)
+
+    def test_expiration(self):
+        cache = LruTtlCache(ttl=10.0)
+        with patch('oio.common.cache.time.time', return_value=100.0):
+            cache.set('a', 1)
+            cache.set('b', 2, ttl=1.0)
+        with patch('oio.common.cache.time.time', return_value=105.0):
+            self.assertEqual(1, cache.get('a'))
+            self.assertIsNone(cache.get('b'))
+        with patch('oio.common.cache.time.time', return_value=111.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_zero_ttl(self):
+        cache = LruTtlCache(ttl=300.0)
+        cache.set('a', 1)
+        # an explicit zero time-to-live disables caching
+        cache.set('a', 2, ttl=0)
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+        cache = LruTtlCache(ttl=0)
+        cache.set('a', 1)
+        self.assertEqual(0, len(cache))
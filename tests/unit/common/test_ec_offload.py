@@ -0,0 +1,123 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import subprocess
+import sys
+import unittest
+from oio.api.ec import ec_encode
+from oio.common import ec_offload
+from oio.common.exceptions import ConfigurationException
+from oio.common.storage_method import STORAGE_METHODS
+
+
+# Encode and decode in 'process' mode from a monkey-patched interpreter,
+# while another green thread keeps running.
+MONKEY_PATCHED_SCRIPT = """
+import os
+import signal
+import eventlet
+eventlet.monkey_patch(%s)
+from oio.common import ec_offload
+from oio.common.storage_method import STORAGE_METHODS
+
+signal.alarm(30)
+ticks = []
+
+def _tick():
+    while True:
+        ticks.append(1)
+        eventlet.sleep(0.001)
+
+eventlet.spawn_n(_tick)
+method = STORAGE_METHODS.load('ec/algo=liberasurecode_rs_vand,k=6,m=2')
+segments = [os.urandom(method.ec_segment_size) for _ in range(16)]
+ec_offload.configure('process', workers=2, batch=2)
+with eventlet.Timeout(20):
+    fragments = method.encode_segments(segments)
+    assert segments == method.decode_segments(fragments)
+assert ticks
+ec_offload.shutdown()
+print('OK')
+"""
+
+
+class TestEcOffload(unittest.TestCase):
+    def setUp(self):
+        self.storage_method = STORAGE_METHODS.load(
+            'ec/algo=liberasurecode_rs_vand,k=6,m=2')
+        segment_size = self.storage_method.ec_segment_size
+        self.data = os.urandom(segment_size * 3 + 100)
+        self.segments = [self.data[i:i + segment_size]
+                         for i in range(0, len(self.data), segment_size)]
+
+    def tearDown(self):
+        ec_offload.configure()
+
+    def _encode_stream(self, block_size=65536):
+        nb = self.storage_method.ec_nb_data + \
+            self.storage_method.ec_nb_parity
+        stream = ec_encode(self.storage_method, nb)
+        stream.send(None)
+        fragments = [[] for _j in range(nb)]
+        for i in range(0, len(self.data), block_size):
+            result = stream.send(self.data[i:i + block_size])
+            if result:
+                for frags, frag in zip(fragments, result):
+                    frags.append(frag)
+        for frags, frag in zip(fragments, stream.send('')):
+            frags.append(frag)
+        return [''.join(frags) for frags in fragments]
+
+    def _check_mode(self, mode):
+        inline_chunks = self._encode_stream()
+        ec_offload.configure(mode, workers=2, batch=2)
+        self.assertEqual(2, ec_offload.batch_size())
+        fragment_sets = self.storage_method.encode_segments(self.segments)
+        self.assertEqual(len(self.segments), len(fragment_sets))
+        self.assertEqual(
+            self.segments,
+            self.storage_method.decode_segments(fragment_sets))
+        # batching segments does not change the fragments
+        self.assertEqual(inline_chunks, self._encode_stream())
+
+    def test_thread(self):
+        self._check_mode(ec_offload.EC_OFFLOAD_THREAD)
+
+    def test_process(self):
+        self._check_mode(ec_offload.EC_OFFLOAD_PROCESS)
+
+    def _check_monkey_patched(self, patch_args):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.getcwd()] + sys.path)
+        out = subprocess.check_output(
+            [sys.executable, '-c', MONKEY_PATCHED_SCRIPT % patch_args],
+            env=env)
+        self.assertEqual('OK', out.strip())
+
+    def test_process_monkey_patched(self):
+        self._check_monkey_patched('')
+
+    def test_process_monkey_patched_no_os(self):
+        # As done by the event agent
+        self._check_monkey_patched('os=False')
+
+    def test_configure_invalid(self):
+        self.assertRaises(ConfigurationException,
+                          ec_offload.configure, 'gpu')
+        self.assertRaises(ConfigurationException,
+                          ec_offload.configure, 'thread', batch=0)
+        self.assertEqual(1, ec_offload.batch_size())
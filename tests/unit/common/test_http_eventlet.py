@@ -0,0 +1,190 @@
+# Copyright (C) 2017 OpenIO SAS
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+
+import unittest
+
+import eventlet
+from eventlet import wsgi
+
+from oio.common.http_eventlet import ConnectionPoolManager, http_connect, \
+    DRAIN_TIMEOUT
+
+
+BIG_BODY = 'x' * 65536
+
+
+def _app(environ, start_response):
+    body = BIG_BODY if environ['PATH_INFO'].endswith('big') else 'ok'
+    start_response('200 OK', [('Content-Length', str(len(body)))])
+    return [body]
+
+
+def _read_request(fp):
+    """Read the request line and headers of a body-less request."""
+    line = fp.readline()
+    while line and line != '\r\n':
+        line = fp.readline()
+    return bool(line)
+
+
+def _serve_once_then_close(client):
+    """Answer the first request, close on the second."""
+    fp = client.makefile('rb')
+    if _read_request(fp):
+        client.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+        _read_request(fp)
+    client.close()
+
+
+def _serve_stalled_body(client):
+    """Send only part of the announced body, then stall."""
+    fp = client.makefile('rb')
+    if _read_request(fp):
+        client.sendall('HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nok')
+        eventlet.sleep(60)
+    client.close()
+
+
+class _NullLog(object):
+    def write(self, *_args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.host = '127.0.0.1:%d' % self.sock.getsockname()[1]
+        self.server = eventlet.spawn(wsgi.server, self.sock, _app,
+                                     log=_NullLog())
+        self.manager = ConnectionPoolManager()
+
+    def tearDown(self):
+        self.manager.clear()
+        self.server.kill()
+        self.sock.close()
+
+    def _request(self, path='/small', amount=None):
+        conn = http_connect(self.host, 'GET', path,
+                            pool_manager=self.manager)
+        resp = conn.getresponse()
+        data = resp.read(amount)
+        conn.close()
+        return data
+
+    def test_reuse(self):
+        for _ in range(3):
+            self.assertEqual('ok', self._request())
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(1, stats['created'])
+        self.assertEqual(2, stats['reused'])
+        self.assertEqual(3, stats['released'])
+        self.assertEqual(1, stats['idle'])
+
+    def test_no_reuse_partial_body(self):
+        self.assertEqual('x' * 10, self._request('/big', 10))
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(0, stats['released'])
+        self.assertEqual(0, stats['idle'])
+        self.assertEqual('ok', self._request())
+        self.assertEqual(2, self.manager.stats()[self.host]['created'])
+
+    def test_idle_eviction(self):
+        self.manager = ConnectionPoolManager(idle_timeout=0.0)
+        self._request()
+        eventlet.sleep(0.01)
+        self._request()
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(2, stats['created'])
+        self.assertEqual(1, stats['evicted'])
+
+    def test_max_idle(self):
+        self.manager = ConnectionPoolManager(max_idle=1)
+        conns = [http_connect(self.host, 'GET', '/small',
+                              pool_manager=self.manager)
+                 for _ in range(2)]
+        for conn in conns:
+            conn.getresponse().read()
+            conn.close()
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(1, stats['idle'])
+        self.assertEqual(1, stats['evicted'])
+
+    def test_unhealthy_on_checkout(self):
+        self._request()
+        pool = self.manager.get_pool(self.host)
+        # simulate the server closing the idle connection
+        _, conn = pool._idle[-1]
+        conn.sock.fd.shutdown(2)
+        self.assertEqual('ok', self._request())
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(1, stats['unhealthy'])
+        self.assertEqual(2, stats['created'])
+
+
+class TestConnectionPoolRawServer(unittest.TestCase):
+    def setUp(self):
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.host = '127.0.0.1:%d' % self.sock.getsockname()[1]
+        self.handler = None
+        self.clients = eventlet.GreenPool()
+        self.server = eventlet.spawn(self._serve)
+        self.manager = ConnectionPoolManager()
+
+    def tearDown(self):
+        self.manager.clear()
+        self.server.kill()
+        for client in list(self.clients.coroutines_running):
+            client.kill()
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            client, _ = self.sock.accept()
+            self.clients.spawn(self.handler, client)
+
+    def _request(self):
+        conn = http_connect(self.host, 'GET', '/small',
+                            pool_manager=self.manager)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return data
+
+    def test_retry_closed_after_checkout(self):
+        self.handler = _serve_once_then_close
+        self.assertEqual('ok', self._request())
+        # The connection passes the health check, but the server
+        # closes it without answering the second request.
+        self.assertEqual('ok', self._request())
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(1, stats['reused'])
+        self.assertEqual(1, stats['unhealthy'])
+        self.assertEqual(2, stats['created'])
+
+    def test_no_retry_new_connection(self):
+        self.handler = lambda client: client.close()
+        self.assertRaises(Exception, self._request)
+        self.assertEqual(1, self.manager.stats()[self.host]['created'])
+
+    def test_drain_timeout(self):
+        self.handler = _serve_stalled_body
+        conn = http_connect(self.host, 'GET', '/small',
+                            pool_manager=self.manager)
+        resp = conn.getresponse()
+        self.assertEqual(200, resp.status)
+        with eventlet.Timeout(DRAIN_TIMEOUT * 10):
+            conn.close()
+        stats = self.manager.stats()[self.host]
+        self.assertEqual(0, stats['released'])
+        self.assertEqual(0, stats['idle'])
@@ -0,0 +1,86 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from oio.common import utils
+from oio.common.utils import paths_gen
+
+
+class TestPathsGen(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.volume = os.path.join(self.tmpdir, 'volume')
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+        self.files = list()
+        for prefix in ('AB', 'CD'):
+            for sub in ('012', '345'):
+                os.makedirs(os.path.join(self.volume, prefix, sub))
+                self._touch(prefix, sub, prefix + sub)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, *names):
+        path = os.path.join(self.volume, *names)
+        open(path, 'w').close()
+        self.files.append(path)
+        return path
+
+    def test_full_walk(self):
+        self.assertItemsEqual(self.files, paths_gen(self.volume))
+
+    def test_full_walk_without_scandir(self):
+        with patch.object(utils, 'scandir', utils._listdir_entries):
+            self.assertItemsEqual(self.files, paths_gen(self.volume))
+
+    def test_incremental_walk(self):
+        self.assertItemsEqual(
+            self.files, paths_gen(self.volume, self.checkpoint))
+        self.assertTrue(os.path.exists(self.checkpoint))
+        # nothing changed
+        self.assertEqual(
+            [], list(paths_gen(self.volume, self.checkpoint)))
+
+        # a new file in a leaf directory, whose mtime changes
+        leaf = os.path.join(self.volume, 'CD', '345')
+        new_file = self._touch('CD', '345', 'new')
+        stat = os.stat(leaf)
+        os.utime(leaf, (stat.st_atime, stat.st_mtime + 10))
+        self.assertItemsEqual(
+            [os.path.join(leaf, 'CD345'), new_file],
+            paths_gen(self.volume, self.checkpoint))
+
+    def test_incremental_walk_interrupted(self):
+        paths = paths_gen(self.volume, self.checkpoint)
+        next(paths)
+        paths.close()
+        # the checkpoint is only saved at the end of a walk
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertItemsEqual(
+            self.files, paths_gen(self.volume, self.checkpoint))
+
+    def test_incremental_walk_not_committed(self):
+        self.assertItemsEqual(
+            self.files, paths_gen(self.volume, self.checkpoint,
+                                  commit=lambda: False))
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertItemsEqual(
+            self.files, paths_gen(self.volume, self.checkpoint,
+                                  commit=lambda: True))
+        self.assertTrue(os.path.exists(self.checkpoint))
@@ -0,0 +1,181 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+import eventlet
+from mock import MagicMock as Mock, patch
+from oio.common.exceptions import ClientException, ServiceBusy
+from oio.conscience.agent import ServiceRegistrar, ServiceWatcher
+from oio.conscience.stats.base import BaseStat
+
+
+def _definition(addr, up=True):
+    return {'ns': 'OPENIO', 'type': 'rawx', 'addr': addr, 'score': 0,
+            'tags': {'tag.up': up}}
+
+
+class TestServiceRegistrar(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('oio.conscience.agent.ConscienceClient')
+        self.cs = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.registrar = ServiceRegistrar({'namespace': 'OPENIO'},
+                                          logger=Mock())
+
+    def test_batch(self):
+        definition = _definition('127.0.0.1:6000')
+        self.registrar.push(definition)
+        self.registrar.push(_definition('127.0.0.1:6001'))
+        # Only the latest state of a service is sent
+        definition['tags']['tag.up'] = False
+        self.registrar.push(definition)
+        self.registrar.flush()
+
+        self.cs.register.assert_called_once_with(
+            None, [_definition('127.0.0.1:6001'),
+                   _definition('127.0.0.1:6000', False)],
+            retries=False)
+        self.assertEqual(0, len(self.registrar.pending))
+        self.registrar.flush()
+        self.assertEqual(1, self.cs.register.call_count)
+
+    def test_batch_rejected(self):
+        def _register(pool, definition, **kwargs):
+            if pool is None:
+                raise ClientException(400, message='Expected: json object')
+        self.cs.register.side_effect = _register
+        self.registrar.push(_definition('127.0.0.1:6000'))
+        self.registrar.push(_definition('127.0.0.1:6001'))
+        self.registrar.flush()
+        self.assertEqual(3, self.cs.register.call_count)
+        self.assertFalse(self.registrar.batch)
+
+        self.registrar.push(_definition('127.0.0.1:6000'))
+        self.registrar.flush()
+        self.cs.register.assert_called_with(
+            'rawx', _definition('127.0.0.1:6000'), retries=False)
+
+    def test_batch_invalid_service(self):
+        def _register(pool, definition, **kwargs):
+            if pool is None or definition['addr'] == '0.0.0.0:0':
+                raise ClientException(400, message='Invalid address')
+        self.cs.register.side_effect = _register
+        self.registrar.push(_definition('127.0.0.1:6000'))
+        self.registrar.push(_definition('0.0.0.0:0'))
+        self.registrar.flush()
+        self.assertEqual(3, self.cs.register.call_count)
+        # The proxy accepts batches, one of the services is wrong
+        self.assertTrue(self.registrar.batch)
+
+    def test_batch_proxy_error(self):
+        self.cs.register.side_effect = ServiceBusy()
+        self.registrar.push(_definition('127.0.0.1:6000'))
+        self.registrar.flush()
+        self.assertEqual(1, self.cs.register.call_count)
+        self.assertTrue(self.registrar.batch)
+
+
+class _Clock(object):
+    """Replace the `time` module of the stats, to control their clock."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class _SlowStat(BaseStat):
+    """
+    Stat whose fetches take the next of `delays` seconds of `clock`.
+    A fetch longer than the timeout blocks until interrupted.
+    """
+
+    def configure(self):
+        self.delays = list(self.stat_conf['delays'])
+        self.clock = self.stat_conf['clock']
+        self.calls = self.stat_conf.get('calls', list())
+
+    def get_stats(self):
+        delay = self.delays.pop(0)
+        if delay is None:
+            raise Exception('no stats')
+        self.calls.append(('start', self.name))
+        # let the other stats start
+        eventlet.sleep(0)
+        self.clock.now += delay
+        if delay > self.timeout:
+            eventlet.sleep(60.0)
+        self.calls.append(('end', self.name))
+        return {'stat.%s' % self.name: delay}
+
+
+class TestServiceWatcherStats(unittest.TestCase):
+    def setUp(self):
+        conf = {'namespace': 'OPENIO', 'proxyd_url': 'http://127.0.0.1:1'}
+        service = {'host': '127.0.0.1', 'port': 6000, 'type': 'rawx',
+                   'checks': [], 'stats': []}
+        self.watcher = ServiceWatcher(conf, service)
+        self.watcher.running = True
+        self.watcher.last_status = True
+        self.clock = _Clock(1000.0)
+        patcher = patch('oio.conscience.stats.base.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = list()
+
+    def _stat(self, name, delays, timeout=0.05):
+        return _SlowStat(self.watcher, {'type': name, 'delays': delays,
+                                        'timeout': timeout,
+                                        'clock': self.clock,
+                                        'calls': self.calls}, Mock())
+
+    def test_collect_fallback(self):
+        stat = self._stat('slow', [0.0, 0.5, None, 0.01])
+        self.assertEqual(({'stat.slow': 0.0}, 0.0), stat.collect())
+        # Too slow: the last known values are returned, with their age
+        self.assertEqual(({'stat.slow': 0.0}, 0.5), stat.collect())
+        self.assertEqual(0.5, stat.duration)
+        # Failed: idem
+        self.clock.now += 1.0
+        self.assertEqual(({'stat.slow': 0.0}, 1.5), stat.collect())
+        self.assertEqual(0.0, stat.duration)
+        self.assertEqual(({'stat.slow': 0.01}, 0.0), stat.collect())
+
+    def test_collect_never_succeeded(self):
+        stat = self._stat('broken', [None])
+        self.assertEqual(({}, None), stat.collect())
+
+    def test_get_stats_concurrent(self):
+        self.watcher.service_stats = [
+            self._stat('a', [0.01, 0.0]),
+            self._stat('b', [0.02, 0.5]),
+            self._stat('c', [0.03, 0.0])]
+        self.watcher.get_stats()
+        # the stats are fetched at the same time
+        self.assertEqual([('start', 'a'), ('start', 'b'), ('start', 'c')],
+                         self.calls[:3])
+        tags = self.watcher.service_definition['tags']
+        self.assertEqual(0.02, tags['stat.b'])
+        self.assertNotIn('stat.b.age', tags)
+
+        # 'b' times out, its previous value is kept, with its age
+        now = self.clock.now
+        self.watcher.get_stats()
+        self.assertNotIn(('end', 'b'), self.calls[6:])
+        self.assertEqual(0.02, tags['stat.b'])
+        self.assertEqual(now + 0.5 - 1000.0, tags['stat.b.age'])
+        self.assertNotIn('stat.a.age', tags)
+        self.assertNotIn('stat.c.age', tags)
@@ -0,0 +1,150 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+import eventlet
+from mock import MagicMock as Mock, patch
+from oio.conscience.client import ConscienceClient, ServiceListCache, \
+    SERVICE_LIST_CACHE, diff_services
+
+
+def _srv(addr, score):
+    return {'addr': addr, 'score': score}
+
+
+class _Clock(object):
+    """Replace the `time` module of the cache, to control its clock."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class TestServiceListCache(unittest.TestCase):
+    def setUp(self):
+        # Only the clock of the cache: the green threads spawned by the
+        # cache (or left by other tests) must not see a frozen time.
+        self.clock = _Clock(100.0)
+        patcher = patch('oio.conscience.client.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_diff_services(self):
+        added, removed, changed = diff_services(
+            [_srv('A', 10), _srv('B', 10), _srv('C', 10)],
+            [_srv('A', 10), _srv('B', 0), _srv('D', 10)])
+        self.assertEqual([_srv('D', 10)], added)
+        self.assertEqual([_srv('C', 10)], removed)
+        self.assertEqual([_srv('B', 0)], changed)
+
+    def test_stale_while_revalidate(self):
+        cache = ServiceListCache()
+        fetch = Mock(side_effect=[[_srv('A', 10)], [_srv('A', 20)],
+                                  [_srv('A', 30)]])
+        key = ('proxy', 'rawx', False)
+        self.assertEqual([_srv('A', 10)], cache.get(key, fetch, 5.0, 10.0))
+        self.clock.now = 104.0
+        self.assertEqual([_srv('A', 10)], cache.get(key, fetch, 5.0, 10.0))
+        self.assertEqual(1, fetch.call_count)
+
+        # Expired: the stale listing is returned, and refreshed
+        self.clock.now = 106.0
+        self.assertEqual([_srv('A', 10)], cache.get(key, fetch, 5.0, 10.0))
+        eventlet.sleep(0)
+        self.assertEqual(2, fetch.call_count)
+        self.assertEqual([_srv('A', 20)], cache.get(key, fetch, 5.0, 10.0))
+
+        # Too old to be returned: fetched synchronously
+        self.clock.now = 200.0
+        self.assertEqual([_srv('A', 30)], cache.get(key, fetch, 5.0, 10.0))
+        self.assertEqual(3, fetch.call_count)
+
+    def test_background_refresh_failure(self):
+        cache = ServiceListCache()
+        fetch = Mock(side_effect=[[_srv('A', 10)], Exception('boom')])
+        key = ('proxy', 'rawx', False)
+        cache.get(key, fetch, 5.0, 10.0)
+        self.clock.now = 106.0
+        cache.get(key, fetch, 5.0, 10.0)
+        eventlet.sleep(0)
+        self.assertEqual(2, fetch.call_count)
+        # the stale listing is still served, and refreshed again
+        self.assertEqual([_srv('A', 10)], cache.get(key, fetch, 5.0, 10.0))
+        self.assertEqual(set([key]), cache._refreshing)
+        eventlet.sleep(0)
+        self.assertEqual(3, fetch.call_count)
+
+    def test_watch(self):
+        cache = ServiceListCache()
+        callback = Mock()
+        key = ('proxy', 'rawx', False)
+        cache.watch(key, callback)
+        fetch = Mock(side_effect=[[_srv('A', 10)], [_srv('A', 10)],
+                                  [_srv('A', 0)]])
+        for _ in range(3):
+            # each listing is outdated by the next call
+            self.clock.now += 1.0
+            cache.get(key, fetch, 0.0, 0.0)
+        callback.assert_called_once_with('rawx', [], [], [_srv('A', 0)])
+
+    def test_watch_variants(self):
+        cache = ServiceListCache()
+        callback = Mock()
+        cache.watch(('proxy', 'rawx', False), callback)
+        for score in (10, 0):
+            for full in (False, True):
+                self.clock.now += 1.0
+                cache.get(('proxy', 'rawx', full),
+                          Mock(return_value=[_srv('A', score)]), 0.0, 0.0)
+        # the change is reported once, for the watched variant
+        callback.assert_called_once_with('rawx', [], [], [_srv('A', 0)])
+        cache.unwatch(('proxy', 'rawx', False), callback)
+        self.clock.now += 1.0
+        cache.get(('proxy', 'rawx', False),
+                  Mock(return_value=[_srv('A', 50)]), 0.0, 0.0)
+        self.assertEqual(1, callback.call_count)
+
+
+class TestConscienceClientCache(unittest.TestCase):
+    def setUp(self):
+        SERVICE_LIST_CACHE.clear()
+        self.addCleanup(SERVICE_LIST_CACHE.clear)
+
+    def _client(self, **conf):
+        conf.update({'namespace': 'OPENIO', 'proxyd_url': 'http://proxy'})
+        client = ConscienceClient(conf)
+        client._request = Mock(
+            return_value=(Mock(status=200), [_srv('A', 10)]))
+        return client
+
+    def test_no_cache_by_default(self):
+        client = self._client()
+        client.all_services('rawx')
+        client.all_services('rawx')
+        self.assertEqual(2, client._request.call_count)
+
+    def test_shared_cache(self):
+        client = self._client(service_cache_ttl='10')
+        other = self._client(service_cache_ttl='10')
+        services = client.all_services('rawx')
+        services[0]['score'] = 0
+        self.assertEqual([_srv('A', 10)], other.all_services('rawx'))
+        self.assertEqual(1, client._request.call_count)
+        self.assertEqual(0, other._request.call_count)
+        other.all_services('rawx', full=True)
+        other.all_services('rawx', use_cache=False)
+        self.assertEqual(2, other._request.call_count)
@@ -291,3 +291,40 @@ class TestGeneratorIO(unittest.TestCase):
         data = ["", "", ""]
         gen = GeneratorIO(iter(data))
         self.assertEqual(gen.read(10), "")
+
+    def test_read_sliced_parts(self):
+        data = ["abcdef", "ghij", "k"]
+        gen = GeneratorIO(iter(data))
+        self.assertEqual(gen.read(4), "abcd")
+        self.assertEqual(gen.read(4), "efgh")
+        self.assertEqual(gen.read(), "ijk")
+        self.assertEqual(gen.read(), "")
+
+    def test_read_stops_at_empty_part(self):
+        data = ["abc", "", "def"]
+        gen = GeneratorIO(iter(data))
+        self.assertEqual(gen.read(), "abc")
+        self.assertEqual(gen.read(), "")
+
+    def test_readinto(self):
+        data = ["abc", "defgh"]
+        gen = GeneratorIO(iter(data))
+        buf = bytearray(4)
+        self.assertEqual(gen.readinto(buf), 4)
+        self.assertEqual(str(buf), "abcd")
+        self.assertEqual(gen.readinto(buf), 4)
+        self.assertEqual(str(buf), "efgh")
+        self.assertEqual(gen.readinto(buf), 0)
+
+    def test_read_no_sub_generator(self):
+        data = ["ab", "cd", "ef"]
+        gen = GeneratorIO(iter(data), sub_generator=False)
+        self.assertEqual(gen.read(2), "abcd")
+        self.assertEqual(gen.read(2), "ef")
+        self.assertEqual(gen.read(2), "")
+
+    def test_iter_after_read(self):
+        data = ["abcdef", "ghij", "", "k"]
+        gen = GeneratorIO(iter(data))
+        self.assertEqual(gen.read(2), "ab")
+        self.assertEqual(list(gen), ["cdef", "ghij"])
@@ -0,0 +1,125 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+import eventlet
+from mock import patch
+from oio.event.consumer import EventTypes
+from oio.event.filters.account_update import AccountUpdateFilter, \
+    merge_container_update
+
+
+class _App(object):
+    app_env = dict()
+
+    def __init__(self):
+        self.processed = list()
+
+    def __call__(self, env, cb):
+        self.processed.append(env['job_id'])
+        cb(200, '')
+
+
+def _event(job_id, container, event_type, when, objects=0):
+    return {'job_id': job_id, 'event': event_type, 'when': when * 1000000,
+            'url': {'account': 'acct', 'user': container},
+            'data': {'object-count': objects, 'bytes-count': objects * 10}}
+
+
+class TestAccountUpdateFilter(unittest.TestCase):
+    def setUp(self):
+        self.app = _App()
+        patcher = patch('oio.event.filters.account_update.AccountClient')
+        self.account = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.filter = AccountUpdateFilter(
+            self.app, {'namespace': 'OPENIO', 'coalesce_window': '0.05'})
+
+    def _process_all(self, events):
+        statuses = dict()
+
+        def _process(env):
+            def cb(status, msg):
+                statuses[env['job_id']] = status
+            self.filter.process(env, cb)
+
+        pool = eventlet.GreenPool()
+        for env in events:
+            pool.spawn(_process, env)
+        pool.waitall()
+        return statuses
+
+    def test_merge_container_update(self):
+        state = {'mtime': 2.0, 'objects': 3, 'bytes': 30}
+        self.assertEqual(state, merge_container_update(
+            {'mtime': 1.0, 'objects': 1, 'bytes': 10}, state))
+        self.assertEqual(state, merge_container_update(
+            state, {'mtime': 1.0, 'objects': 1, 'bytes': 10}))
+        self.assertEqual({'mtime': 3.0, 'dtime': 2.0}, merge_container_update(
+            merge_container_update(state, {'dtime': 2.0}), {'mtime': 3.0}))
+
+    def test_coalesce(self):
+        self.account.container_batch_update.side_effect = \
+            lambda updates: [{'account': u['account'], 'name': u['name'],
+                              'status': 200} for u in updates]
+        events = [
+            _event(1, 'c1', EventTypes.CONTAINER_STATE, 1.0, 1),
+            _event(2, 'c1', EventTypes.CONTAINER_STATE, 3.0, 3),
+            _event(3, 'c1', EventTypes.CONTAINER_STATE, 2.0, 2),
+            _event(4, 'c2', EventTypes.CONTAINER_NEW, 1.0)]
+        statuses = self._process_all(events)
+
+        self.assertEqual({1: 200, 2: 200, 3: 200, 4: 200}, statuses)
+        self.assertEqual(1, self.account.container_batch_update.call_count)
+        updates = self.account.container_batch_update.call_args[0][0]
+        self.assertEqual(
+            [{'account': 'acct', 'name': 'c1', 'mtime': 3.0,
+              'objects': 3, 'bytes': 30},
+             {'account': 'acct', 'name': 'c2', 'mtime': 1.0}], updates)
+
+    def test_coalesce_errors(self):
+        self.account.container_batch_update.return_value = [
+            {'account': 'acct', 'name': 'c1', 'status': 409,
+             'message': 'No update needed, event older than last update'},
+            {'account': 'acct', 'name': 'c2', 'status': 404,
+             'message': 'Container c2 not found'}]
+        events = [
+            _event(1, 'c1', EventTypes.CONTAINER_STATE, 1.0),
+            _event(2, 'c2', EventTypes.CONTAINER_STATE, 1.0)]
+        statuses = self._process_all(events)
+        # Outdated updates are acknowledged, failed ones are released
+        self.assertEqual({1: 200, 2: 500}, statuses)
+        self.assertEqual([1], self.app.processed)
+
+    def test_coalesce_flush_failure(self):
+        self.account.container_batch_update.side_effect = Exception('boom')
+        events = [
+            _event(1, 'c1', EventTypes.CONTAINER_STATE, 1.0),
+            _event(2, 'c2', EventTypes.CONTAINER_STATE, 1.0)]
+        statuses = self._process_all(events)
+        self.assertEqual({1: 500, 2: 500}, statuses)
+        self.assertEqual([], self.app.processed)
+
+    def test_coalesce_max_batch(self):
+        self.filter.coalesce_window = 60.0
+        self.filter.coalesce_max_batch = 2
+        self.account.container_batch_update.side_effect = \
+            lambda updates: [{'status': 200} for _ in updates]
+        events = [
+            _event(1, 'c1', EventTypes.CONTAINER_STATE, 1.0),
+            _event(2, 'c2', EventTypes.CONTAINER_STATE, 1.0)]
+        with eventlet.Timeout(5.0):
+            statuses = self._process_all(events)
+        self.assertEqual({1: 200, 2: 200}, statuses)
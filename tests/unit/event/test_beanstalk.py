@@ -0,0 +1,150 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import json
+import unittest
+from mock import MagicMock as Mock, patch
+from oio.event.beanstalk import Beanstalk, Connection, ResponseError
+from oio.event.consumer import EventWorker
+
+
+class FakeSocket(object):
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.sent = list()
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def recv(self, _size):
+        return self.replies.pop(0)
+
+    def close(self):
+        pass
+
+
+def _beanstalk(*replies):
+    connection = Connection()
+    connection._sock = FakeSocket(replies)
+    connection._parser.on_connect(connection)
+    return Beanstalk(connection=connection), connection._sock
+
+
+class TestBeanstalk(unittest.TestCase):
+    def test_pipelined_commands(self):
+        beanstalk, sock = _beanstalk(
+            'DELETED\r\nNOT_FOUND\r\n'
+            'RESERVED 3 2\r\nab\r\nRESERVED 4 1\r\nc\r\nTIMED_OUT\r\n')
+        beanstalk.delete(1, wait=False)
+        beanstalk.release(2, delay=5, wait=False)
+        # Nothing has been read yet
+        self.assertEqual(2, len(sock.sent))
+
+        jobs = beanstalk.reserve_many(3, timeout=0)
+        self.assertEqual([('3', 'ab'), ('4', 'c')], jobs)
+        self.assertEqual(
+            ['delete 1\r\n', 'release 2 %d 5\r\n' % 2 ** 31,
+             'reserve-with-timeout 0\r\n' * 3], sock.sent)
+        errors = beanstalk.pop_deferred_errors()
+        self.assertEqual(1, len(errors))
+        self.assertIn('NOT_FOUND', str(errors[0]))
+        self.assertEqual([], beanstalk.pop_deferred_errors())
+
+    def test_reserve_many_waits(self):
+        beanstalk, sock = _beanstalk(
+            'TIMED_OUT\r\nTIMED_OUT\r\n', 'RESERVED 5 1\r\nx\r\n')
+        jobs = beanstalk.reserve_many(2, timeout=1)
+        self.assertEqual([('5', 'x')], jobs)
+        self.assertEqual('reserve-with-timeout 1\r\n', sock.sent[-1])
+
+    def test_flush(self):
+        beanstalk, sock = _beanstalk('DELETED\r\nBURIED\r\n')
+        beanstalk.delete(1, wait=False)
+        beanstalk.bury(2, wait=False)
+        self.assertEqual([], beanstalk.flush())
+        self.assertEqual([], sock.replies)
+
+    def test_touch(self):
+        beanstalk, sock = _beanstalk('DELETED\r\nTOUCHED\r\nNOT_FOUND\r\n')
+        beanstalk.delete(1, wait=False)
+        beanstalk.touch(2)
+        self.assertEqual(['delete 1\r\n', 'touch 2\r\n'], sock.sent)
+        self.assertRaises(ResponseError, beanstalk.touch, 3)
+
+
+class TestEventWorkerPrefetch(unittest.TestCase):
+    def test_release_on_shutdown(self):
+        worker = EventWorker(0, {}, Mock())
+        worker.tube = None
+        event = json.dumps({'event': 'storage.content.new'})
+        beanstalk = Mock()
+        beanstalk.reserve_many.return_value = [
+            ('1', event), ('2', event), ('3', event)]
+        beanstalk.flush.return_value = []
+
+        def _handler(env, cb):
+            cb(200, '')
+            # Shutdown requested while processing the first job
+            worker.alive = False
+
+        worker.handlers = {'storage.content.new': _handler}
+        worker.handle_prefetch(beanstalk, 3)
+
+        beanstalk.reserve_many.assert_called_once_with(3, timeout=1)
+        beanstalk.delete.assert_called_once_with('1', wait=False)
+        self.assertEqual(
+            [(('2',), {'wait': False}), (('3',), {'wait': False})],
+            [tuple(c) for c in beanstalk.release.call_args_list])
+        beanstalk.flush.assert_called_once_with()
+
+    def test_prefetched_jobs_ttr(self):
+        worker = EventWorker(0, {'prefetch_ttr': '10'}, Mock())
+        worker.tube = None
+        event = json.dumps({'event': 'storage.content.new'})
+        beanstalk = Mock()
+
+        def _reserve_many(count, timeout=None):
+            if beanstalk.reserve_many.call_count > 1:
+                worker.alive = False
+                return []
+            return [(str(i), event) for i in range(1, 6)]
+        beanstalk.reserve_many.side_effect = _reserve_many
+        beanstalk.pop_deferred_errors.return_value = []
+        beanstalk.flush.return_value = []
+        beanstalk.touch.side_effect = [
+            ResponseError('touch', 'NOT_FOUND', []), None]
+        processed = list()
+        now = [1000.0]
+
+        def _handler(env, cb):
+            processed.append(env['job_id'])
+            # each job takes 4 seconds
+            now[0] += 4.0
+            cb(200, '')
+
+        worker.handlers = {'storage.content.new': _handler}
+        with patch('oio.event.consumer.time.time', lambda: now[0]):
+            worker.handle_prefetch(beanstalk, 5)
+
+        # 2 waited 4s, 3 waited 8s but was lost (touch failed),
+        # 4 waited 8s (touched), 5 waited 12s (beyond its TTR)
+        self.assertEqual(['1', '2', '4'], processed)
+        self.assertEqual([(('3',), {}), (('4',), {})],
+                         [tuple(c) for c in beanstalk.touch.call_args_list])
+        self.assertEqual(
+            [(('1',), {'wait': False}), (('2',), {'wait': False}),
+             (('4',), {'wait': False})],
+            [tuple(c) for c in beanstalk.delete.call_args_list])
+        self.assertFalse(beanstalk.release.called)
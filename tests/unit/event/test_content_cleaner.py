@@ -0,0 +1,112 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+from collections import defaultdict
+import eventlet
+from eventlet.event import Event as GreenEvent
+from mock import MagicMock as Mock, patch
+from oio.event.filters.content_cleaner import ContentReaperFilter, \
+    _group_by_host
+
+
+class _App(object):
+    app_env = dict()
+
+
+def _chunk(host, idx):
+    return {'id': 'http://%s/%064X' % (host, idx)}
+
+
+class TestContentReaperFilter(unittest.TestCase):
+    def test_group_by_host(self):
+        chunks = [_chunk('A', 0), _chunk('B', 1), _chunk('A', 2),
+                  _chunk('C', 3), _chunk('B', 4), _chunk('C', 5)]
+        by_host = _group_by_host(chunks)
+        self.assertEqual(['A', 'B', 'C'], by_host.keys())
+        self.assertEqual({'A': [0, 2], 'B': [1, 4], 'C': [3, 5]},
+                         {host: [int(c['id'][-64:], 16) for c in chunks]
+                          for host, chunks in by_host.iteritems()})
+
+    def test_delete_concurrency(self):
+        cleaner = ContentReaperFilter(
+            _App(), {'delete_concurrency': '5',
+                     'rawx_delete_concurrency': '2'})
+        running = defaultdict(int)
+        max_running = defaultdict(int)
+        total = {'running': 0, 'max': 0}
+
+        def _connect(host, method, path, headers=None):
+            running[host] += 1
+            max_running[host] = max(max_running[host], running[host])
+            total['running'] += 1
+            total['max'] = max(total['max'], total['running'])
+            conn = Mock()
+
+            def _getresponse():
+                # Yield a few times instead of sleeping, so the scheduling
+                # does not depend on the load of the machine.
+                for _ in range(10):
+                    eventlet.sleep(0)
+                running[host] -= 1
+                total['running'] -= 1
+                return Mock(status=204)
+            conn.getresponse.side_effect = _getresponse
+            return conn
+
+        chunks = [_chunk(host, idx)
+                  for idx in range(6) for host in ('A', 'B', 'C', 'D')]
+        events = [chunks[:12], chunks[12:]]
+        with patch('oio.event.filters.content_cleaner.http_connect',
+                   side_effect=_connect) as connect:
+            pool = eventlet.GreenPool()
+            for event_chunks in events:
+                pool.spawn(cleaner._handle_rawx, {'id': 'CID'},
+                           event_chunks, None, None, 'reqid')
+            pool.waitall()
+        self.assertEqual(24, connect.call_count)
+        self.assertEqual(5, total['max'])
+        for host in ('A', 'B', 'C', 'D'):
+            self.assertEqual(2, max_running[host])
+
+    def test_slow_rawx_holds_no_pool_slot(self):
+        cleaner = ContentReaperFilter(
+            _App(), {'delete_concurrency': '3',
+                     'rawx_delete_concurrency': '1'})
+        stalled = GreenEvent()
+        deleted = defaultdict(int)
+
+        def _connect(host, method, path, headers=None):
+            conn = Mock()
+
+            def _getresponse():
+                if host == 'A':
+                    stalled.wait()
+                deleted[host] += 1
+                if deleted['B'] == 5:
+                    stalled.send()
+                return Mock(status=204)
+            conn.getresponse.side_effect = _getresponse
+            return conn
+
+        chunks = [_chunk(host, idx)
+                  for idx in range(5) for host in ('A', 'B')]
+        with patch('oio.event.filters.content_cleaner.http_connect',
+                   side_effect=_connect):
+            # The deletions on B must not wait for the stalled A
+            with eventlet.Timeout(5.0):
+                cleaner._handle_rawx({'id': 'CID'}, chunks,
+                                     None, None, 'reqid')
+        self.assertEqual({'A': 5, 'B': 5}, dict(deleted))
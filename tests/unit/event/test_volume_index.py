@@ -0,0 +1,146 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+import eventlet
+from mock import MagicMock as Mock
+from oio.common.exceptions import OioException, OioNetworkException
+from oio.event.consumer import EventTypes
+from oio.event.filters.volume_index import VolumeIndexFilter
+
+
+class _App(object):
+    app_env = dict()
+
+    def __init__(self):
+        self.rdir = Mock()
+        self.processed = list()
+
+    def __call__(self, env, cb):
+        self.processed.append(env['job_id'])
+        cb(200, '')
+
+
+def _event(job_id, event_type, volume='127.0.0.1:6010'):
+    return {'job_id': job_id, 'event': event_type, 'when': 1000000,
+            'data': {'volume_id': volume, 'container_id': 'CID',
+                     'content_id': 'CONTENT', 'chunk_id': 'CHUNK%d' % job_id}}
+
+
+def _statuses(volume_id, records, **_kwargs):
+    return [{'status': 200} for _ in records]
+
+
+class TestVolumeIndexFilter(unittest.TestCase):
+    def setUp(self):
+        self.app = _App()
+        self.rdir = self.app.rdir
+        self.rdir.chunk_push_many.side_effect = _statuses
+        self.rdir.chunk_delete_many.side_effect = _statuses
+
+    def _filter(self, **conf):
+        conf.setdefault('namespace', 'OPENIO')
+        conf.setdefault('batch_delay', '0.05')
+        return VolumeIndexFilter(self.app, conf)
+
+    def _process_all(self, filter_, events):
+        statuses = dict()
+
+        def _process(env):
+            def cb(status, msg):
+                statuses[env['job_id']] = status
+            filter_.process(env, cb)
+
+        pool = eventlet.GreenPool()
+        for env in events:
+            pool.spawn(_process, env)
+        pool.waitall()
+        return statuses
+
+    def test_batch_flushed_by_timer(self):
+        filter_ = self._filter(batch_size='10')
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_NEW) for i in range(3)])
+        self.assertEqual({0: 200, 1: 200, 2: 200}, statuses)
+        self.assertEqual(1, self.rdir.chunk_push_many.call_count)
+        volume_id, records = self.rdir.chunk_push_many.call_args[0]
+        self.assertEqual('127.0.0.1:6010', volume_id)
+        self.assertEqual(['CHUNK0', 'CHUNK1', 'CHUNK2'],
+                         [r['chunk_id'] for r in records])
+        self.assertEqual(1, records[0]['mtime'])
+        self.assertEqual(dict(), filter_._batches)
+
+    def test_batch_flushed_when_full(self):
+        filter_ = self._filter(batch_size='2', batch_delay='60')
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_NEW) for i in range(4)])
+        self.assertEqual({0: 200, 1: 200, 2: 200, 3: 200}, statuses)
+        self.assertEqual(2, self.rdir.chunk_push_many.call_count)
+        # the timers of the full batches have been cancelled
+        self.assertEqual(dict(), filter_._batches)
+
+    def test_batch_per_action_and_volume(self):
+        filter_ = self._filter()
+        events = [_event(0, EventTypes.CHUNK_NEW),
+                  _event(1, EventTypes.CHUNK_DELETED),
+                  _event(2, EventTypes.CHUNK_NEW, volume='127.0.0.1:6011'),
+                  _event(3, EventTypes.CHUNK_DELETED)]
+        statuses = self._process_all(filter_, events)
+        self.assertEqual({0: 200, 1: 200, 2: 200, 3: 200}, statuses)
+        self.assertEqual(2, self.rdir.chunk_push_many.call_count)
+        self.assertEqual(1, self.rdir.chunk_delete_many.call_count)
+        records = self.rdir.chunk_delete_many.call_args[0][1]
+        self.assertEqual(['CHUNK1', 'CHUNK3'],
+                         [r['chunk_id'] for r in records])
+
+    def test_batch_partial_failure(self):
+        self.rdir.chunk_push_many.side_effect = \
+            lambda volume_id, records, **kwargs: [
+                {'status': 200},
+                {'status': 500, 'message': 'rdir error'},
+                {'status': 204}]
+        filter_ = self._filter()
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_NEW) for i in range(3)])
+        self.assertEqual({0: 200, 1: 500, 2: 200}, statuses)
+        self.assertEqual([0, 2], sorted(self.app.processed))
+
+    def test_batch_missing_statuses(self):
+        self.rdir.chunk_push_many.side_effect = \
+            lambda volume_id, records, **kwargs: [{'status': 200}]
+        filter_ = self._filter()
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_NEW) for i in range(3)])
+        self.assertEqual({0: 200, 1: 500, 2: 500}, statuses)
+        self.assertEqual([0], self.app.processed)
+
+    def test_batch_failure(self):
+        self.rdir.chunk_delete_many.side_effect = OioException('failed')
+        filter_ = self._filter()
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_DELETED) for i in range(3)])
+        self.assertEqual({0: 500, 1: 500, 2: 500}, statuses)
+        self.assertEqual(1, self.rdir.chunk_delete_many.call_count)
+        self.assertEqual([], self.app.processed)
+
+    def test_batch_network_error_retried(self):
+        self.rdir.chunk_push_many.side_effect = [
+            OioNetworkException('reset'),
+            [{'status': 200}, {'status': 200}]]
+        filter_ = self._filter()
+        statuses = self._process_all(
+            filter_, [_event(i, EventTypes.CHUNK_NEW) for i in range(2)])
+        self.assertEqual({0: 200, 1: 200}, statuses)
+        self.assertEqual(2, self.rdir.chunk_push_many.call_count)
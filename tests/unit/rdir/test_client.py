@@ -0,0 +1,92 @@
+# Copyright (C) 2017 OpenIO SAS, as part of OpenIO SDS
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3.0 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.
+
+import unittest
+from oio.common.exceptions import ClientException
+from oio.rdir.client import RdirDispatcher
+
+
+def _service(addr, loc=None, score=100, n_bases=None):
+    tags = dict()
+    if loc:
+        tags['tag.loc'] = loc
+    if n_bases is not None:
+        tags['stat.opened_db_count'] = n_bases
+    return {'addr': addr, 'score': score, 'tags': tags}
+
+
+class TestRdirDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.conf = {'namespace': 'OPENIO',
+                     'proxyd_url': 'http://127.0.0.1:6000'}
+        self.dispatcher = RdirDispatcher(self.conf)
+        self.rawx = _service('127.0.0.1:6010', 'dc1.rack1.srv1.vol1')
+
+    def test_select_fewest_bases(self):
+        all_rdir = [_service('127.0.0.3:6300', n_bases=2),
+                    _service('127.0.0.2:6300', n_bases=1),
+                    _service('127.0.0.1:6300', n_bases=1),
+                    _service('127.0.0.4:6300', n_bases=0, score=0)]
+        rdir = self.dispatcher._select_rdir(self.rawx, all_rdir)
+        # ties broken by address, services with a null score ignored
+        self.assertEqual('127.0.0.1:6300', rdir['addr'])
+
+    def test_select_max_per_rdir(self):
+        all_rdir = [_service('127.0.0.1:6300', n_bases=2),
+                    _service('127.0.0.2:6300', n_bases=3)]
+        self.assertRaises(ClientException, self.dispatcher._select_rdir,
+                          self.rawx, all_rdir, 2)
+        rdir = self.dispatcher._select_rdir(self.rawx, all_rdir, 3)
+        self.assertEqual('127.0.0.1:6300', rdir['addr'])
+
+    def test_select_distance(self):
+        all_rdir = [
+            _service('127.0.0.1:6300', 'dc1.rack1.srv1.vol1', n_bases=0),
+            _service('127.0.0.2:6300', 'dc1.rack1.srv1.vol2', n_bases=1),
+            _service('127.0.0.3:6300', 'dc1.rack1.srv2.vol1', n_bases=2),
+            _service('127.0.0.4:6300', 'dc1.rack2.srv1.vol1', n_bases=3)]
+        # by default, only the exact same location is excluded
+        rdir = self.dispatcher._select_rdir(self.rawx, all_rdir)
+        self.assertEqual('127.0.0.2:6300', rdir['addr'])
+        rdir = self.dispatcher._select_rdir(self.rawx, all_rdir, min_dist=2)
+        self.assertEqual('127.0.0.3:6300', rdir['addr'])
+        rdir = self.dispatcher._select_rdir(self.rawx, all_rdir, min_dist=3)
+        self.assertEqual('127.0.0.4:6300', rdir['addr'])
+        self.assertRaises(ClientException, self.dispatcher._select_rdir,
+                          self.rawx, all_rdir, min_dist=4)
+
+    def test_select_distance_from_conf(self):
+        self.conf['rdir_min_dist'] = '3'
+        dispatcher = RdirDispatcher(self.conf)
+        all_rdir = [
+            _service('127.0.0.3:6300', 'dc1.rack1.srv2.vol1', n_bases=0),
+            _service('127.0.0.4:6300', 'dc1.rack2.srv1.vol1', n_bases=1)]
+        rdir = dispatcher._select_rdir(self.rawx, all_rdir)
+        self.assertEqual('127.0.0.4:6300', rdir['addr'])
+
+    def test_select_no_location(self):
+        # without location, any rdir service is acceptable
+        all_rdir = [_service('127.0.0.1:6300', 'dc1.rack1.srv1.vol1')]
+        rawx = _service('127.0.0.1:6010')
+        rdir = self.dispatcher._select_rdir(rawx, all_rdir, min_dist=4)
+        self.assertEqual('127.0.0.1:6300', rdir['addr'])
+
+    def test_select_no_candidate(self):
+        all_rdir = [_service('127.0.0.1:6300', score=0)]
+        try:
+            self.dispatcher._select_rdir(self.rawx, all_rdir)
+            self.fail('should have raised')
+        except ClientException as exc:
+            self.assertEqual(481, exc.status)
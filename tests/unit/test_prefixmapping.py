@@ -14,6 +14,7 @@
 # License along with this library.
 
 import logging
+import math
 import unittest
 
 from mock import MagicMock as Mock
@@ -111,6 +112,106 @@ class TestPrefixMapping(unittest.TestCase):
     def test_bootstrap_3_services_1_digit_rebalanced(self):
         return self._test_bootstrap_rebalanced(3, 3, digits=1)
 
+    def _min_moves(self, mapping, tolerance=0.0):
+        counts = mapping.count_pfx_by_svc()
+        target = float(sum(counts.itervalues())) / len(counts)
+        lower = int(math.floor(target * (1.0 - tolerance)))
+        upper = int(math.ceil(target * (1.0 + tolerance)))
+        excess = sum(max(0, count - upper) for count in counts.itervalues())
+        deficit = sum(max(0, lower - count) for count in counts.itervalues())
+        return max(excess, deficit), lower, upper
+
+    def _check_distance(self, mapping):
+        for services in mapping.svc_by_base.itervalues():
+            locs = [mapping.get_loc(svc) for svc in services]
+            self.assertEqual(len(locs), len(set(locs)))
+
+    def test_rebalance_minimal_moves(self):
+        self.cs_client.generate_services(20, locations=7)
+        mapping = self.make_mapping(digits=3)
+        mapping.bootstrap()
+        mapping.rebalance()
+        # Add 2 services: they should only receive bases
+        for i in (21, 22):
+            addr = "127.0.1.1:6%03d" % i
+            mapping.services[addr] = {"addr": addr, "score": 100,
+                                      "tags": {"tag.loc": "location%d" % i}}
+        min_moves, lower, upper = self._min_moves(mapping)
+        plan = mapping.compute_rebalance()
+        self.assertEqual(min_moves, len(plan['moves']))
+        self.assertGreater(plan['imbalance_before'],
+                           plan['imbalance_after'])
+        for _base, _src, dst in plan['moves']:
+            self.assertIn(dst, ("127.0.1.1:6021", "127.0.1.1:6022"))
+
+        moved = mapping.rebalance()
+        self.assertEqual(set(m[0] for m in plan['moves']), moved)
+        self.assertTrue(mapping.check_replicas())
+        self._check_distance(mapping)
+        for count in mapping.count_pfx_by_svc().itervalues():
+            self.assertIn(count, range(lower, upper + 1))
+
+    def test_rebalance_tolerance(self):
+        self.cs_client.generate_services(10, locations=5)
+        mapping = self.make_mapping(digits=3)
+        mapping.bootstrap()
+        min_moves, lower, upper = self._min_moves(mapping, 0.05)
+        plan = mapping.compute_rebalance(tolerance=0.05)
+        self.assertEqual(min_moves, len(plan['moves']))
+        self.assertLess(len(plan['moves']),
+                        len(mapping.compute_rebalance()['moves']))
+        mapping.rebalance(tolerance=0.05)
+        self._check_distance(mapping)
+        for count in mapping.count_pfx_by_svc().itervalues():
+            self.assertIn(count, range(lower, upper + 1))
+
+    def test_rebalance_dry_run(self):
+        self.cs_client.generate_services(7, locations=7)
+        mapping = self.make_mapping(digits=2)
+        mapping.bootstrap()
+        before = mapping.to_json()
+        counts = mapping.count_pfx_by_svc()
+        moved = mapping.rebalance(dry_run=True)
+        self.assertTrue(moved)
+        self.assertEqual(before, mapping.to_json())
+        self.assertEqual(counts, mapping.count_pfx_by_svc())
+
+    def test_rebalance_weighted(self):
+        self.cs_client.generate_services(6, locations=6)
+        mapping = self.make_mapping(digits=3)
+        mapping.bootstrap()
+        mapping.rebalance()
+        heavy = mapping.services.values()[0]
+        heavy['score'] = 200
+        locked = mapping.services.values()[1]
+        locked['score'] = 0
+        kept = mapping.count_pfx_by_svc()[locked['addr']]
+        mapping.rebalance(weighted=True)
+        self.assertTrue(mapping.check_replicas())
+        counts = mapping.count_pfx_by_svc()
+        # The locked service keeps its bases, the others share the rest
+        self.assertEqual(kept, counts.pop(locked['addr']))
+        target = (mapping.num_bases() * 3 - kept) / 6.0
+        self.assertIn(counts.pop(heavy['addr']),
+                      range(int(target * 2) - 1, int(target * 2) + 2))
+        for count in counts.itervalues():
+            self.assertIn(count, range(int(target) - 1, int(target) + 2))
+
+    def test_rebalance_drain(self):
+        self.cs_client.generate_services(6, locations=6)
+        mapping = self.make_mapping(digits=3)
+        mapping.bootstrap()
+        mapping.rebalance()
+        locked = mapping.services.values()[0]
+        locked['score'] = 0
+        mapping.rebalance(drain=True)
+        self.assertTrue(mapping.check_replicas())
+        counts = mapping.count_pfx_by_svc()
+        self.assertEqual(0, counts.pop(locked['addr']))
+        target = mapping.num_bases() * 3 / 5.0
+        for count in counts.itervalues():
+            self.assertIn(count, range(int(target) - 1, int(target) + 2))
+
     def test_decommission(self):
         n = 20
         replicas = 3